@@ -1,21 +1,134 @@
 import os
+import shutil
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 from .file_processor import process_word_file
+from .utils import get_current_log_file, init_worker_logger
+from Pipeline.line_index import is_index_file
 
-def batch_process_word_files(input_dir: str, output_root: str, module_config_file: str):
+# 并行模式下子进程先把模块文件写入该临时目录，再由主进程按文件顺序移动到项目文件夹
+STAGING_DIR_NAME = ".split_staging"
+
+
+def _split_worker(word_path, output_root, module_config_file, staging_dir):
+    """子进程入口：切分单个Word文件，模块txt写入staging_dir，返回项目文件夹名"""
+    return process_word_file(word_path, output_root, module_config_file, output_dir=staging_dir)
+
+
+def commit_staged_files(staging_dir, output_dir):
+    """把临时目录中的模块文件移动到项目文件夹，同名文件直接覆盖"""
+    os.makedirs(output_dir, exist_ok=True)
+    for name in sorted(os.listdir(staging_dir)):
+        os.replace(os.path.join(staging_dir, name), os.path.join(output_dir, name))
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def record_split(manifest, word_path, module_config_file, output_root, result):
+    """切分成功后把Word文件及生成的模块txt记录到任务清单"""
+    if manifest is None or not result["folder"]:
+        return
+    output_dir = os.path.join(output_root, result["folder"])
+    # 后续步骤在项目文件夹中生成的行索引文件不属于切分结果
+    outputs = [os.path.join(output_dir, f) for f in sorted(os.listdir(output_dir))
+               if not is_index_file(f)] if os.path.isdir(output_dir) else []
+    manifest.record("split", result["file"], [word_path, module_config_file], outputs, folder=result["folder"])
+
+
+def batch_process_word_files(input_dir: str, output_root: str, module_config_file: str,
+                             max_workers: int = 1, progress_callback=None, manifest=None):
+    """
+    批量切分input_dir下的Word文件。
+
+    :param max_workers: 进程数，小于等于1时串行处理
+    :param progress_callback: 每处理完一个文件调用一次 progress_callback(done, total)
+    :param manifest: 任务清单（Pipeline.manifest.Manifest），内容未变化的文件直接跳过
+    :return: 按文件名排序的处理结果列表，每项为 {"file", "folder", "error"}
+    """
     if not os.path.isdir(input_dir):
         logging.error(f"输入目录不存在: {input_dir}")
-        return
+        return []
 
-    files = [f for f in os.listdir(input_dir) if f.lower().endswith('.docx')]
+    # 排序保证同名项目文件夹的覆盖顺序在串行和并行模式下一致
+    files = sorted(f for f in os.listdir(input_dir) if f.lower().endswith('.docx'))
     logging.info(f"检测到的Word文件数量: {len(files)}, 文件列表: {files}")
 
-    for file in tqdm(files, desc="预处理文件", unit="个"):
-        word_path = os.path.join(input_dir, file)
-        logging.info(f"准备处理文件: {word_path}")
-        try:
-            process_word_file(word_path, output_root, module_config_file)
-        except Exception as e:
-            logging.error(f"处理文件出错: {word_path}，错误: {e}")
+    results = [{"file": file, "folder": None, "error": None} for file in files]
+    total = len(files)
+
+    # 输入未变化的文件直接沿用清单中记录的项目文件夹
+    cached = [False] * total
+    if manifest is not None:
+        for idx, file in enumerate(files):
+            if manifest.is_fresh("split", file, [os.path.join(input_dir, file), module_config_file]):
+                results[idx]["folder"] = manifest.get_extra("split", file).get("folder")
+                cached[idx] = True
+                logging.info(f"文件未变化，跳过切分: {file}")
+
+    if max_workers is None or max_workers <= 1 or total - sum(cached) <= 1:
+        for idx, file in enumerate(tqdm(files, desc="预处理文件", unit="个"), start=1):
+            if not cached[idx - 1]:
+                word_path = os.path.join(input_dir, file)
+                logging.info(f"准备处理文件: {word_path}")
+                try:
+                    results[idx - 1]["folder"] = process_word_file(word_path, output_root, module_config_file)
+                    record_split(manifest, word_path, module_config_file, output_root, results[idx - 1])
+                except Exception as e:
+                    logging.error(f"处理文件出错: {word_path}，错误: {e}")
+                    results[idx - 1]["error"] = str(e)
+            if progress_callback:
+                progress_callback(idx, total)
+        return results
+
+    staging_root = os.path.join(output_root, STAGING_DIR_NAME)
+    shutil.rmtree(staging_root, ignore_errors=True)
+    logging.info(f"并行切分Word文件，进程数: {max_workers}")
+
+    finished = list(cached)
+    next_commit = 0
+    done = sum(cached)
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker_logger,
+                             initargs=(get_current_log_file(),)) as executor:
+        futures = {}
+        for idx, file in enumerate(files):
+            if cached[idx]:
+                continue
+            word_path = os.path.join(input_dir, file)
+            logging.info(f"准备处理文件: {word_path}")
+            staging_dir = os.path.join(staging_root, str(idx))
+            future = executor.submit(_split_worker, word_path, output_root, module_config_file, staging_dir)
+            futures[future] = idx
+
+        with tqdm(total=total, initial=done, desc="预处理文件", unit="个") as pbar:
+            for future in as_completed(futures):
+                idx = futures[future]
+                word_path = os.path.join(input_dir, files[idx])
+                try:
+                    results[idx]["folder"] = future.result()
+                except Exception as e:
+                    logging.error(f"处理文件出错: {word_path}，错误: {e}")
+                    results[idx]["error"] = str(e)
+                finished[idx] = True
+
+                # 只提交连续完成的前缀，后处理的文件覆盖先处理的文件，与串行结果一致
+                while next_commit < total and finished[next_commit]:
+                    result = results[next_commit]
+                    staging_dir = os.path.join(staging_root, str(next_commit))
+                    if not cached[next_commit] and result["folder"] and os.path.isdir(staging_dir):
+                        try:
+                            commit_staged_files(staging_dir, os.path.join(output_root, result["folder"]))
+                            record_split(manifest, os.path.join(input_dir, result["file"]),
+                                          module_config_file, output_root, result)
+                        except Exception as e:
+                            logging.error(f"移动模块文件失败: {staging_dir}，错误: {e}")
+                            result["error"] = str(e)
+                    next_commit += 1
+
+                done += 1
+                pbar.update(1)
+                if progress_callback:
+                    progress_callback(done, total)
 
+    shutil.rmtree(staging_root, ignore_errors=True)
+    return results
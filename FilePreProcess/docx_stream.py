@@ -0,0 +1,103 @@
+import posixpath
+import xml.etree.ElementTree as ET
+import zipfile
+from typing import Iterator
+
+# 流式读取docx正文段落：直接从zip中增量解析主文档xml，不构建python-docx对象模型，也不读取图片等媒体文件。
+# 段落范围和文本与 python-docx 的 Document(path).paragraphs / Paragraph.text 一致：
+# 只取 w:body 下的直接段落（不含表格中的段落），文本由段落中的 w:r 和 w:hyperlink 下的 w:r 拼接。
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+OFFICE_DOCUMENT_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+DEFAULT_DOCUMENT_PART = "word/document.xml"
+
+_BODY = W_NS + "body"
+_P = W_NS + "p"
+_R = W_NS + "r"
+_HYPERLINK = W_NS + "hyperlink"
+_T = W_NS + "t"
+_BR = W_NS + "br"
+_BR_TYPE = W_NS + "type"
+# 除 w:t 和 w:br 外，run 中其他可转换为文本的元素
+_RUN_TEXT = {W_NS + "tab": "\t", W_NS + "ptab": "\t", W_NS + "cr": "\n", W_NS + "noBreakHyphen": "-"}
+
+
+def find_document_part(zf: zipfile.ZipFile) -> str:
+    """根据 _rels/.rels 找到主文档在zip中的路径，一般为 word/document.xml"""
+    try:
+        with zf.open("_rels/.rels") as f:
+            for rel in ET.parse(f).getroot().iter(REL_NS + "Relationship"):
+                if rel.get("Type") == OFFICE_DOCUMENT_REL:
+                    return posixpath.normpath(rel.get("Target", "").lstrip("/"))
+    except KeyError:
+        pass
+    return DEFAULT_DOCUMENT_PART
+
+
+def _run_text(run) -> str:
+    parts = []
+    for child in run:
+        tag = child.tag
+        if tag == _T:
+            parts.append(child.text or "")
+        elif tag == _BR:
+            # 只有换行符转换为"\n"，分页符、分栏符不产生文本
+            parts.append("\n" if child.get(_BR_TYPE, "textWrapping") == "textWrapping" else "")
+        elif tag in _RUN_TEXT:
+            parts.append(_RUN_TEXT[tag])
+    return "".join(parts)
+
+
+def paragraph_text(p) -> str:
+    parts = []
+    for child in p:
+        if child.tag == _R:
+            parts.append(_run_text(child))
+        elif child.tag == _HYPERLINK:
+            parts.extend(_run_text(r) for r in child if r.tag == _R)
+    return "".join(parts)
+
+
+class DocxParagraphs:
+    """
+    按顺序逐个产出docx正文段落的文本。构造时即打开文件并定位主文档，
+    文件不存在、不是docx时在这里抛出异常；迭代时才逐段解析，每段解析完立即释放。
+    """
+
+    def __init__(self, word_path: str):
+        self.word_path = word_path
+        self._zf = zipfile.ZipFile(word_path)
+        try:
+            self._part = find_document_part(self._zf)
+            self._zf.getinfo(self._part)
+        except Exception:
+            self._zf.close()
+            raise
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            with self._zf.open(self._part) as f:
+                depth = 0
+                body = None
+                for event, elem in ET.iterparse(f, events=("start", "end")):
+                    if event == "start":
+                        depth += 1
+                        if depth == 2 and elem.tag == _BODY:
+                            body = elem
+                        continue
+                    if depth == 3 and body is not None:
+                        if elem.tag == _P:
+                            yield paragraph_text(elem)
+                        # 正文下的段落、表格处理完即释放
+                        body.clear()
+                    elif depth == 2:
+                        body = None
+                    depth -= 1
+        finally:
+            self._zf.close()
+
+
+def iter_docx_paragraphs(word_path: str) -> Iterator[str]:
+    """逐段产出 word_path 中正文段落的文本"""
+    return iter(DocxParagraphs(word_path))
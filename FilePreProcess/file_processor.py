@@ -1,12 +1,12 @@
 import os
 import logging
 import re
-from docx import Document
 from tqdm import tqdm
 
 from .title_preprocess import check_lines_and_prepend
 from .utils import clean_folder_name, load_module_titles
-from .text_splitter import split_text_by_modules
+from .text_splitter import split_stream_by_modules
+from .docx_stream import iter_docx_paragraphs
 
 def sanitize_filename(name: str) -> str:
     """
@@ -15,10 +15,53 @@ def sanitize_filename(name: str) -> str:
     """
     return re.sub(r'[\\/:\*\?"<>|]', '_', name)
 
-def process_word_file(word_path: str, output_root: str, module_config_file: str):
+def iter_document_text(first_paragraph, paragraphs):
+    """按段落产出全文片段，拼接结果与 "\n".join(全部段落文本) 一致"""
+    if first_paragraph is None:
+        return
+    yield first_paragraph
+    for text in paragraphs:
+        yield "\n" + text
+
+
+def save_module_file(output_dir: str, title: str, content: str):
+    """把一个模块的内容保存为 output_dir 下的txt文件，文件名由模块标题生成"""
+    try:
+        if '.' in title:
+            num, mod_name = title.split('.', 1)
+            num = num.strip()
+            mod_name = mod_name.strip()
+            filename = f"{num}_{mod_name}.txt"
+        else:
+            mod_name = title.strip()
+            filename = f"{mod_name}.txt"
+
+        filename = sanitize_filename(filename)
+        file_path = os.path.join(output_dir, filename)
+
+        # 检查是否需要在文件开头添加模块编号和名称
+        content = check_lines_and_prepend(content, num, mod_name)
+
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+        logging.info(f"保存模块文件: {file_path}")
+
+    except Exception as e:
+        logging.error(f"保存模块文件失败: {title}，错误: {e}")
+
+
+def process_word_file(word_path: str, output_root: str, module_config_file: str, output_dir: str = None):
     """
     读取Word文件，拆分模块，保存为txt文件。
     高鲁棒性：捕获异常，日志记录，确保目录创建。
+
+    正文从docx中流式读取（docx_stream），边读边按模块切分，每读完一个模块即写入文件，
+    不加载图片等媒体，也不在内存中保留整篇文档。
+
+    :param output_dir: 指定模块文件的写入目录（并行模式下为临时目录），
+                       默认写入 output_root/项目文件夹名
+    :return: 项目文件夹名，读取或创建目录失败时返回None
     """
     logging.info(f"开始处理文件: {word_path}")
 
@@ -27,66 +70,49 @@ def process_word_file(word_path: str, output_root: str, module_config_file: str)
         return
 
     try:
-        doc = Document(word_path)
+        paragraphs = iter_docx_paragraphs(word_path)
+        # 第一段为项目名
+        first_paragraph = next(paragraphs, None)
     except Exception as e:
         logging.error(f"读取Word文件失败: {word_path}，错误: {e}")
         return
 
     folder_name = "Unnamed_Project"
-    if doc.paragraphs and doc.paragraphs[0].text.strip():
-        folder_name = clean_folder_name(doc.paragraphs[0].text.strip())
+    if first_paragraph and first_paragraph.strip():
+        folder_name = clean_folder_name(first_paragraph.strip())
 
-    output_dir = os.path.join(output_root, folder_name)
+    if output_dir is None:
+        output_dir = os.path.join(output_root, folder_name)
     try:
         os.makedirs(output_dir, exist_ok=True)
     except Exception as e:
         logging.error(f"创建输出目录失败: {output_dir}，错误: {e}")
         return
 
-    full_text = "\n".join(p.text for p in doc.paragraphs)
+    modules = split_stream_by_modules(iter_document_text(first_paragraph, paragraphs),
+                                      load_module_titles(module_config_file))
+
+    saved = 0
+    # 模块数在读完全文前未知，进度条只显示已保存的数量
+    try:
+        with tqdm(unit="模块", desc="保存文件模块") as pbar:
+            for title, content in modules:
+                save_module_file(output_dir, title, content)
+                saved += 1
+                pbar.update(1)
+    except Exception as e:
+        logging.error(f"读取Word文件失败: {word_path}，错误: {e}")
+        return
 
-    modules = split_text_by_modules(full_text, load_module_titles(module_config_file))
-    if not modules:
-        logging.warning(f"未检测到模块标题，原始文本长度：{len(full_text)}")
+    if not saved:
+        # 全文为空时没有任何模块
+        logging.warning("未检测到模块标题，原始文本长度：0")
         complete_file = os.path.join(output_dir, "完整文本.txt")
         try:
             with open(complete_file, 'w', encoding='utf-8') as f:
-                f.write(full_text)
+                f.write("")
             logging.info(f"保存完整文本文件: {complete_file}")
         except Exception as e:
             logging.error(f"保存完整文本失败，错误: {e}")
-        return
 
-    # 用tqdm包装模块迭代，显示进度条
-    total = len(modules)
-    with tqdm(total=total, unit="模块") as pbar:
-        for title, content in modules.items():
-            # 设置进度条左侧描述为当前文件编号，末尾加冒号和空格使显示更明显
-            pbar.set_description(f"保存文件模块", refresh=True)
-            
-            try:
-                if '.' in title:
-                    num, mod_name = title.split('.', 1)
-                    num = num.strip()
-                    mod_name = mod_name.strip()
-                    filename = f"{num}_{mod_name}.txt"
-                else:
-                    mod_name = title.strip()
-                    filename = f"{mod_name}.txt"
-
-                filename = sanitize_filename(filename)
-                file_path = os.path.join(output_dir, filename)
-
-                # 检查是否需要在文件开头添加模块编号和名称
-                content = check_lines_and_prepend(content, num, mod_name)
-
-                # 检查是否需要在文件开头添加模块编号和名称
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-
-                logging.info(f"保存模块文件: {file_path}")
-
-            except Exception as e:
-                logging.error(f"保存模块文件失败: {title}，错误: {e}")
-
-            pbar.update(1)
\ No newline at end of file
+    return folder_name
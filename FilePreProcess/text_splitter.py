@@ -1,5 +1,10 @@
 import re
-from typing import Dict, List
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+NUMBERED_TITLE_PATTERN = r"^(\d+)[\.\、\)]?\s*(.+)$"
+# str.splitlines 识别的换行符
+LINE_BREAKS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
 
 
 def add_numbering_to_titles(module_titles: List[str]) -> List[str]:
@@ -13,6 +18,147 @@ def add_numbering_to_titles(module_titles: List[str]) -> List[str]:
     return numbered_titles
 
 
+class ModuleTitleMatcher:
+    """
+    模块标题行匹配器，按一份模块标题配置构建一次，之后每行只需一次从行尾向前的字典树查找。
+
+    匹配规则：一行去掉行尾空白后以某个模块名结尾即为该模块的标题行（模块名前可有序号、#、括号等任意字符），
+    多个模块名同时匹配时取配置中靠前的模块。
+    模块名以空白结尾（或为空）的少见配置无法用字典树表示，这些模块改用正则逐个匹配，结果不变。
+    """
+
+    def __init__(self, module_titles: List[str]):
+        self.module_titles = list(module_titles)
+        self._trie = {}
+        self._fallback = []  # [(模块序号, 正则)]
+
+        for idx, title in enumerate(self.module_titles):
+            # 只有带编号的标题才会被分配为模块，规则同原先逐行匹配时的写法
+            m = re.match(NUMBERED_TITLE_PATTERN, title)
+            if not m:
+                continue
+            mod_name = m.group(2)
+            if not mod_name[-1:] or mod_name[-1].isspace():
+                self._fallback.append((idx, re.compile(rf"^(?:.*){re.escape(mod_name)}\s*$")))
+                continue
+            node = self._trie
+            for ch in reversed(mod_name):
+                node = node.setdefault(ch, {})
+            # None 键保存以该节点结尾的模块名对应的最小模块序号
+            node.setdefault(None, idx)
+
+    def match(self, line: str) -> Optional[str]:
+        """返回该行对应的模块标题，不是模块标题行时返回None"""
+        best = None
+        stripped = line.rstrip()
+        node = self._trie
+        for pos in range(len(stripped) - 1, -1, -1):
+            node = node.get(stripped[pos])
+            if node is None:
+                break
+            idx = node.get(None)
+            if idx is not None and (best is None or idx < best):
+                best = idx
+        for idx, pattern in self._fallback:
+            if best is not None and idx > best:
+                break
+            if pattern.match(line):
+                best = idx if best is None else min(best, idx)
+                break
+        return self.module_titles[best] if best is not None else None
+
+
+@lru_cache(maxsize=32)
+def _get_matcher(module_titles: Tuple[str, ...]) -> ModuleTitleMatcher:
+    return ModuleTitleMatcher(list(module_titles))
+
+
+def get_title_matcher(module_titles: List[str]) -> ModuleTitleMatcher:
+    """返回模块标题对应的匹配器，同一份标题配置只构建一次"""
+    if not re.match(r"^\s*\d+[\.\、\)]?\s+", module_titles[0]):
+        module_titles = add_numbering_to_titles(module_titles)
+    return _get_matcher(tuple(module_titles))
+
+
+def iter_text_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    把依次到达的文本片段按行产出，结果与把所有片段拼接后调用 splitlines() 一致
+    （包括跨片段的"\r\n"）。
+    """
+    pending = ""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        parts = (pending + chunk).splitlines(True)
+        # 最后一段可能还不完整：没有换行符，或以"\r"结尾而下一片段以"\n"开头
+        pending = parts.pop()
+        if pending[-1] in LINE_BREAKS and pending[-1] != "\r":
+            parts.append(pending)
+            pending = ""
+        for part in parts:
+            yield part.rstrip(LINE_BREAKS)
+    if pending:
+        yield pending.rstrip(LINE_BREAKS)
+
+
+def _modules_from_lines(lines: Iterable[str], matcher: ModuleTitleMatcher,
+                        on_first_title=None) -> Iterator[Tuple[str, str]]:
+    """逐行扫描，每读完一个模块产出 (模块标题, 内容)；第一个模块标题之前的行丢弃"""
+    match = matcher.match
+    current_title = None
+    current_lines = []
+    for line in lines:
+        title = match(line)
+        if title is not None:
+            if current_title is not None:
+                yield current_title, "\n".join(current_lines).strip()
+            elif on_first_title is not None:
+                on_first_title()
+            current_title = title
+            current_lines = []
+        elif current_title is not None:
+            current_lines.append(line)
+    if current_title is not None:
+        yield current_title, "\n".join(current_lines).strip()
+
+
+def split_stream_by_modules(chunks: Iterable[str], module_titles: List[str]) -> Iterator[Tuple[str, str]]:
+    """
+    流式版本的 split_text_by_modules：chunks 依次拼接即为全文，每读完一个模块就产出 (模块标题, 内容)，
+    只在内存中保留当前模块的行，峰值内存取决于最大的模块而不是整个文档。
+    同一模块标题出现多次时会产出多次，按字典依次写入的结果与 split_text_by_modules 相同。
+    全文没有模块标题时，在读完后产出 ("全文", 全文)；全文为空时不产出任何内容。
+    """
+    if not module_titles:
+        text = "".join(chunks)
+        if text:
+            yield "全文", text.strip()
+        return
+
+    # 第一个模块标题出现之前保留原始文本，全文都没有模块标题时使用
+    preamble = {"chunks": [], "empty": True}
+
+    def remember(source):
+        for chunk in source:
+            if chunk:
+                preamble["empty"] = False
+            if preamble["chunks"] is not None:
+                preamble["chunks"].append(chunk)
+            yield chunk
+
+    def drop_preamble():
+        preamble["chunks"] = None
+
+    found = False
+    lines = iter_text_lines(remember(chunks))
+    for module in _modules_from_lines(lines, get_title_matcher(module_titles), on_first_title=drop_preamble):
+        found = True
+        yield module
+
+    if not found and not preamble["empty"]:
+        yield "全文", "".join(preamble["chunks"]).strip()
+
+
 def split_text_by_modules(text: str, module_titles: List[str]) -> Dict[str, str]:
     """
     按模块标题拆分文本，返回字典{模块标题:对应内容}。
@@ -26,48 +172,8 @@ def split_text_by_modules(text: str, module_titles: List[str]) -> Dict[str, str]
     if not module_titles:
         return {"全文": text.strip()}
 
-    if not re.match(r"^\s*\d+[\.\、\)]?\s+", module_titles[0]):
-        module_titles = add_numbering_to_titles(module_titles)
-
-    pattern_parts = []
-    for title in module_titles:
-        m = re.match(r"^(\d+)([\.\、\)]?)\s*(.+)$", title)
-        if m:
-            num, sep, mod_name = m.groups()
-            # 这里改成匹配：行尾以模块名结尾，模块名前可以有任意字符（非换行）
-            # (?:.*)表示任意字符（非换行）多次；\s*允许结尾空格
-            # re.escape(mod_name)模块名称转义
-            title_pattern = rf"^(?:.*){re.escape(mod_name)}\s*$"
-        else:
-            title_pattern = rf"^(?:.*){re.escape(title)}\s*$"
-        pattern_parts.append(title_pattern)
-
-    titles_pattern = "|".join(pattern_parts)
-
-    lines = text.splitlines()
-
-    module_positions = []
-
-    for idx, line in enumerate(lines):
-        if re.match(titles_pattern, line):
-            for title in module_titles:
-                m = re.match(r"^(\d+)[\.\、\)]?\s*(.+)$", title)
-                if m:
-                    _, mod_name = m.groups()
-                    # 同理匹配结尾模块名
-                    if re.match(rf"^(?:.*){re.escape(mod_name)}\s*$", line):
-                        module_positions.append((idx, title))
-                        break
-
-    if not module_positions:
+    modules = dict(_modules_from_lines(text.splitlines(), get_title_matcher(module_titles)))
+    if not modules:
         return {"全文": text.strip()}
 
-    modules_content = {}
-    for i, (start_idx, title) in enumerate(module_positions):
-        content_start = start_idx + 1
-        content_end = module_positions[i+1][0] if i + 1 < len(module_positions) else len(lines)
-        content_lines = lines[content_start:content_end]
-        content = "\n".join(content_lines).strip()
-        modules_content[title] = content
-
-    return modules_content
+    return modules
@@ -16,16 +16,22 @@ DEFAULT_MODULE_TITLES = [
     "实施方案"
 ]
 
-def get_log_file_path(base_dir="log"):
+# 运行日志旁边的资源统计文件（Pipeline.profiler 生成），与日志一起按保留天数清理
+PROFILE_SUFFIXES = (".profile.json", ".prof", ".prof.txt", ".collapsed.txt")
+
+def get_log_file_path(base_dir="log", run_id=None):
     """
     按照 log/YYYY/MM/DD/run_HHMMSS.log 格式，生成日志文件路径，
-    并确保目录存在。
+    并确保目录存在。传入 run_id（如任务ID）时文件名为 run_HHMMSS_<run_id>.log，避免同时运行的任务写入同一文件。
     返回完整日志文件路径字符串。
     """
     now = datetime.now()
     log_dir = os.path.join(base_dir, now.strftime("%Y"), now.strftime("%m"), now.strftime("%d"))
     os.makedirs(log_dir, exist_ok=True)
-    log_file = os.path.join(log_dir, now.strftime("run_%H_%M_%S.log"))
+    name = now.strftime("run_%H_%M_%S")
+    if run_id:
+        name += f"_{run_id}"
+    log_file = os.path.join(log_dir, f"{name}.log")
     return log_file
 
 def setup_logger(log_file=None, console=True):
@@ -52,11 +58,24 @@ def setup_logger(log_file=None, console=True):
         handlers=handlers
     )
 
+def get_current_log_file():
+    """返回当前根日志器使用的日志文件路径，没有则返回None"""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.FileHandler):
+            return handler.baseFilename
+    return None
+
+def init_worker_logger(log_file):
+    """
+    进程池子进程的初始化函数：spawn方式启动的子进程不会继承日志配置，这里重新挂上同一个日志文件；
+    fork方式下根日志器已有handler，basicConfig不会重复添加
+    """
+    setup_logger(log_file=log_file, console=False)
 
 
 def clean_old_logs(log_root_dir, days_to_keep=None):
     """
-    删除指定目录下的日志文件，并尝试删除空目录。
+    删除指定目录下的日志文件（包括运行日志旁边的性能分析结果），并尝试删除空目录。
 
     :param log_root_dir: 日志根目录，建议传入日志最顶层目录，比如 "logs"
     :param days_to_keep: 保留多少天以内的日志，None表示删除所有日志
@@ -72,7 +91,7 @@ def clean_old_logs(log_root_dir, days_to_keep=None):
     for root, dirs, files in os.walk(log_root_dir):
         for filename in files:
             file_path = os.path.join(root, filename)
-            if not filename.endswith(".log"):
+            if not filename.endswith((".log",) + PROFILE_SUFFIXES):
                 continue
 
             try:
@@ -118,15 +137,33 @@ def clean_folder_name(name: str) -> str:
     return name
 
 
+# 已读取的模块配置：{绝对路径: ((修改时间, 文件大小), 模块标题列表)}
+_module_titles_cache = {}
+
+
 def load_module_titles(config_path: str = "config.json") -> List[str]:
     """
     尝试从指定配置文件加载模块标题列表，失败则返回默认值。
+    配置文件未修改时直接返回上次读取的结果，批量处理时不必每个文件都重新读取。
     """
     if not os.path.isfile(config_path):
         # 配置文件不存在，返回默认标题
         print(f"配置文件{config_path}不存在，使用默认模块标题")
         return DEFAULT_MODULE_TITLES
 
+    key = os.path.abspath(config_path)
+    stat = os.stat(config_path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _module_titles_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return list(cached[1])
+
+    titles = _read_module_titles(config_path)
+    _module_titles_cache[key] = (version, titles)
+    return list(titles)
+
+
+def _read_module_titles(config_path: str) -> List[str]:
     try:
         with open(config_path, "r", encoding="utf-8") as f:
             config_data = json.load(f)
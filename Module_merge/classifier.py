@@ -3,21 +3,21 @@ import os
 import logging
 from SummaryExtract.api_call import chat
 from SummaryExtract.format import extract_and_format_content
+from Module_merge.merge_prepare import list_merging_module_folders, list_source_json_files
 from tqdm import tqdm
 
-def extract_all_files_content(dir_path):
+def extract_all_files_content(dir_path, store=None):
     all_contents = []
-    for filename in os.listdir(dir_path):
-        if filename.endswith(".json"):
-            file_path = os.path.join(dir_path, filename)
-            content = extract_and_format_content(file_path)
-            if content.strip():
-                all_contents.append(content)  # 只加入内容，不加前缀
+    # 只读取各项目的源json，避免把上一次生成的大纲/索引文件混入提示词
+    for file_path in list_source_json_files(dir_path, store=store):
+        content = extract_and_format_content(file_path, store=store)
+        if content.strip():
+            all_contents.append(content)  # 只加入内容，不加前缀
     return "\n".join(all_contents)
 
 
-def restructure_outline_via_llm(dir_path):
-    all_content = extract_all_files_content(dir_path)
+def restructure_outline_via_llm(dir_path, store=None):
+    all_content = extract_all_files_content(dir_path, store=store)
     # 构造 prompt，明确要求重新组合标题，且说明来源，且禁止复用
     prompt = f"""
             以下是来自不同文档，相同一级标题下的多个二级和三级标题及其摘要信息，格式示例如下：
@@ -59,28 +59,45 @@ def write_response_to_txt(dir_path, content, filename="restructured_outline.txt"
         logging.error(f"写入文件失败：{file_path}，错误：{e}")
 
 
-def batch_process_folders(parent_dir):
+def restructure_folder(folder_path, unit, manifest=None, store=None):
+    """
+    对单个模块文件夹调用 restructure_outline_via_llm 并写入 restructured_outline.txt。
+    跳过规则同 batch_process_folders；unit 为任务清单中的单元名（模块文件夹名）。
+
+    :return: 是否调用了大模型重新生成
+    """
+    output_path = os.path.join(folder_path, 'restructured_outline.txt')
+    if manifest is not None:
+        inputs = list_source_json_files(folder_path, store=store)
+        if manifest.is_fresh("restructure", unit, inputs):
+            logging.info(f"{unit} 的源文件未变化，跳过该文件夹。")
+            return False
+    elif os.path.exists(output_path):
+        logging.info(f"{output_path} 已存在，跳过该文件夹。")
+        return False
+
+    logging.info(f"开始处理文件夹：{folder_path}")
+    response = restructure_outline_via_llm(folder_path, store=store)
+    write_response_to_txt(folder_path, response)
+    if manifest is not None:
+        manifest.record("restructure", unit, inputs, [output_path])
+    return True
+
+
+def batch_process_folders(parent_dir, manifest=None, store=None):
     """
     批量处理 parent_dir 下的所有子文件夹，
     每个子文件夹调用 restructure_outline_via_llm，并写入txt文件。
     显示进度条。
-    如果已存在 restructured_outline.txt 则跳过该子文件夹。
+    如果已存在 restructured_outline.txt 则跳过该子文件夹；
+    传入 manifest 时改为按源json内容哈希判断，源文件变化后即使结果已存在也会重新生成。
     """
     parent_dir = os.path.join(parent_dir, 'merging_files')
-    subfolders = [entry for entry in os.listdir(parent_dir) if os.path.isdir(os.path.join(parent_dir, entry))]
+    subfolders = list_merging_module_folders(parent_dir)
     
     for entry in tqdm(subfolders, desc="Processing folders"):
         folder_path = os.path.join(parent_dir, entry)
-        output_path = os.path.join(folder_path, 'restructured_outline.txt')
-        if os.path.exists(output_path):
-            logging.info(f"{output_path} 已存在，跳过该文件夹。")
-            continue
-
-        logging.info(f"开始处理文件夹：{folder_path}")
         try:
-            response = restructure_outline_via_llm(folder_path)
-            write_response_to_txt(folder_path, response)
+            restructure_folder(folder_path, entry, manifest=manifest, store=store)
         except Exception as e:
             logging.error(f"处理文件夹失败：{folder_path}，错误：{e}")
-
-
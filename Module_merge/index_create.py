@@ -1,40 +1,42 @@
-import json
 import os
 import logging
+from Module_merge.merge_prepare import DERIVED_JSON_FILES, list_merging_module_folders, list_source_json_files
+from Pipeline.json_store import get_store
 
 class SourceFile:
-    def __init__(self, filepath):
+    def __init__(self, filepath, store=None):
         self.filepath = filepath
         self.data = {}
         self.source_txt = None
-        self.load()
+        self.load(store)
 
-    def load(self):
-        with open(self.filepath, 'r', encoding='utf-8') as f:
-            self.data = json.load(f)
+    def load(self, store=None):
+        # 浅拷贝后再取出source_txt，不改动存储中的源数据
+        self.data = dict(get_store(store).load_json(self.filepath))
         self.source_txt = self.data.pop('source_txt', None)
 
+def _source_item(item, sf):
+    return {
+        "start_line": item.get("start_line"),
+        "end_line": item.get("end_line"),
+        "summary": item.get("summary"),
+        "source_txt": sf.source_txt
+    }
+
 def build_source_index(source_files):
     index = {}
     for sf in source_files:
         data = sf.data
         for key, val in data.items():
-            index[key] = (val, sf)
+            index[key] = _source_item(val, sf)
             subsections = val.get("subsections", {})
             for sub_key, sub_val in subsections.items():
-                index[sub_key] = (sub_val, sf)
+                index[sub_key] = _source_item(sub_val, sf)
     return index
 
 def find_source_info_from_index(source_str, index):
     if source_str in index:
-        item, sf = index[source_str]
-        return {
-            "source_name": source_str,
-            "start_line": item.get("start_line"),
-            "end_line": item.get("end_line"),
-            "summary": item.get("summary"),
-            "source_txt": sf.source_txt
-        }
+        return {"source_name": source_str, **index[source_str]}
     else:
         return {
             "source_name": source_str,
@@ -60,40 +62,61 @@ def traverse_and_enrich(data, index):
                 for sub_key, sub_val in val["sub_sections"].items():
                     enrich_node_source_info(sub_val, index)
 
-def load_all_source_files(folder_path, exclude_file=None):
+def load_all_source_files(folder_path, exclude_file=None, store=None):
     source_files = []
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.json') and filename != exclude_file:
-            fullpath = os.path.join(folder_path, filename)
-            sf = SourceFile(fullpath)
+    # main_enriched.json 等生成文件不是源文件，list_source_json_files 已将其排除
+    for fullpath in list_source_json_files(folder_path, store=store):
+        if os.path.basename(fullpath) != exclude_file:
+            sf = SourceFile(fullpath, store=store)
             source_files.append(sf)
     return source_files
 
-def enrich_one_folder(folder_path):
+def enrich_one_folder(folder_path, store=None):
+    store = get_store(store)
     main_json_name = 'restructured_outline.json'
     main_json_path = os.path.join(folder_path, main_json_name)
-    if not os.path.isfile(main_json_path):
+    if not store.exists(main_json_path):
         logging.warning(f"{main_json_name} not found in {folder_path}, skipping.")
         return
 
-    with open(main_json_path, 'r', encoding='utf-8') as f:
-        main_data = json.load(f)
+    # 索引信息直接写入大纲数据，取副本以免改动存储中的 restructured_outline.json
+    main_data = store.load_json(main_json_path, mutable=True)
 
-    source_files = load_all_source_files(folder_path, exclude_file=main_json_name)
-    index = build_source_index(source_files)
+    if hasattr(store, 'section_index'):
+        # 章节数据库：直接按模块文件夹查询各章节，不再逐个读取源json
+        index = store.section_index(folder_path, exclude_names=DERIVED_JSON_FILES + (main_json_name,))
+    else:
+        source_files = load_all_source_files(folder_path, exclude_file=main_json_name, store=store)
+        index = build_source_index(source_files)
     traverse_and_enrich(main_data, index)
 
     output_path = os.path.join(folder_path, 'main_enriched.json')
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(main_data, f, ensure_ascii=False, indent=2)
+    store.save_json(output_path, main_data, indent=2)
     logging.info(f"Processed folder {folder_path}, output saved to main_enriched.json")
 
-def enrich_all_subfolders(root_folder):
+def enrich_folder(folder_path, unit, manifest=None, store=None):
+    """
+    生成单个模块文件夹的 main_enriched.json，
+    传入 manifest 时大纲json和各项目源json均未变化则跳过；unit 为模块文件夹名。
+    """
+    main_json_path = os.path.join(folder_path, 'restructured_outline.json')
+    if manifest is None or not get_store(store).exists(main_json_path):
+        enrich_one_folder(folder_path, store=store)  # 大纲缺失时由enrich_one_folder记录告警
+        return
+    inputs = list_source_json_files(folder_path, store=store) + [main_json_path]
+    if manifest.is_fresh("index", unit, inputs):
+        return
+    enrich_one_folder(folder_path, store=store)
+    manifest.record("index", unit, inputs, [os.path.join(folder_path, 'main_enriched.json')])
+
+def enrich_all_subfolders(root_folder, manifest=None, store=None):
+    """
+    为 merging_files 下每个模块文件夹生成 main_enriched.json。
+    传入 manifest 时，大纲json和各项目源json均未变化的模块跳过。
+    """
     root_folder = os.path.join(root_folder, 'merging_files')
-    for entry in os.listdir(root_folder):
-        subfolder = os.path.join(root_folder, entry)
-        if os.path.isdir(subfolder):
-            enrich_one_folder(subfolder)
+    for entry in list_merging_module_folders(root_folder):
+        enrich_folder(os.path.join(root_folder, entry), entry, manifest=manifest, store=store)
 
 if __name__ == "__main__":
     root_folder = 'your_root_folder_path_here'  # 请替换成实际的根目录路径
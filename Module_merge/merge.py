@@ -1,9 +1,19 @@
-import logging
+import hashlib
 import json
+import logging
 import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from SummaryExtract.api_call import chat
 from tqdm import tqdm
+from Pipeline.json_store import get_store
+from Pipeline.line_index import get_line_index
+
+# 章节合并的默认并发数（所有模块共享），实际在途请求数还受大模型客户端 max_concurrency 限制
+DEFAULT_MERGE_WORKERS = 8
+# 模块合并过程中已完成章节的结果，每完成一节追加一行；merged.txt 生成后删除
+SECTION_RESULTS_FILE = 'merged_sections.jsonl'
 
 def extract_main_title(title):
     return re.sub(r'（.*?）', '', title).strip()
@@ -21,14 +31,8 @@ def find_first_level_key(source_name, json_dict):
     return None
 
 def read_text_segment(file_path, start_line, end_line):
-    lines = []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for current_line_num, line in enumerate(f, start=1):
-            if current_line_num > end_line:
-                break
-            if current_line_num >= start_line:
-                lines.append(line.rstrip('\n'))
-    return '\n'.join(lines)
+    # 同一txt的行偏移索引只建立一次，之后按行号直接定位读取
+    return get_line_index(file_path).read_lines(start_line, end_line)
 
 def generate_merge_prompt(title, source_text):
     prompt = (
@@ -39,7 +43,64 @@ def generate_merge_prompt(title, source_text):
     prompt += "\n请将上述内容融合, 不要添加任何额外的内容或解释且按照markdown格式输出"
     return prompt
 
-def process_section(section_key, section_data):
+class SectionResults:
+    """
+    单个模块已完成章节的合并结果，保存在模块目录的 merged_sections.jsonl 中。
+    合并中途异常中断时，重新运行只请求未完成的章节；结果按prompt的哈希匹配，原文或标题变化的章节会重新合并。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._texts = {}
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                        self._texts[item['hash']] = item['text']
+                    except (ValueError, KeyError, TypeError):
+                        # 中断时最后一行可能没有写完整
+                        continue
+            if self._texts:
+                logging.info(f"读取到 {len(self._texts)} 个已完成章节的合并结果: {path}")
+
+    @staticmethod
+    def _hash(prompt):
+        return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+    def get(self, prompt):
+        with self._lock:
+            return self._texts.get(self._hash(prompt))
+
+    def add(self, section_key, prompt, text):
+        prompt_hash = self._hash(prompt)
+        line = json.dumps({"key": section_key, "hash": prompt_hash, "text": text}, ensure_ascii=False)
+        with self._lock:
+            self._texts[prompt_hash] = text
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+    def clear(self):
+        with self._lock:
+            self._texts.clear()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def merge_with_results(section_key, prompt, results=None):
+    """调用大模型合并一节；传入 results 时优先复用已完成的结果，新结果立即追加保存"""
+    if results is not None:
+        cached = results.get(prompt)
+        if cached is not None:
+            logging.info(f"章节 {section_key} 已合并，沿用上次结果。")
+            return cached
+    merged_result = chat(prompt, "merging")
+    if results is not None and merged_result is not None:
+        results.add(section_key, prompt, merged_result)
+    return merged_result
+
+def process_section(section_key, section_data, results=None):
     title = section_data['title']
     source_infos = section_data.get('source_info', [])
 
@@ -58,10 +119,9 @@ def process_section(section_key, section_data):
     prompt = generate_merge_prompt(title, full_source_text)
     logging.info(f"生成的prompt内容（section_key={section_key}，title={title}）：\n{prompt}")
 
-    merged_result = chat(prompt, "merging")
-    return merged_result
+    return merge_with_results(section_key, prompt, results)
 
-def process_first_level_section(first_level_key, first_level_val):
+def process_first_level_section(first_level_key, first_level_val, results=None):
     title = first_level_val.get('title', '无标题')
     source_infos = first_level_val.get('source_info', [])
 
@@ -84,62 +144,138 @@ def process_first_level_section(first_level_key, first_level_val):
     prompt = generate_merge_prompt(title, full_source_text)
     logging.info(f"生成的prompt内容（一级标题Key={first_level_key}，title={title}）：\n{prompt}")
 
-    merged_result = chat(prompt, "merging")
-    return merged_result
+    return merge_with_results(first_level_key, prompt, results)
 
-def merge_by_folder(root_folder):
-    json_paths = []
-    root_folder = os.path.join(root_folder, 'merging_files')
-    for dirpath, _, filenames in os.walk(root_folder):
-        if 'main_enriched.json' in filenames:
-            json_paths.append(os.path.join(dirpath, 'main_enriched.json'))
+def collect_source_txts(json_data):
+    """收集 main_enriched.json 中各 source_info 引用的原文txt路径（去重、排序）"""
+    paths = set()
+    for first_level_val in json_data.values():
+        nodes = [first_level_val] + list(first_level_val.get('sub_sections', {}).values())
+        for node in nodes:
+            for src in node.get('source_info', []):
+                if src.get('source_txt'):
+                    paths.add(src['source_txt'])
+    return sorted(paths)
 
-    if not json_paths:
-        logging.warning(f"在路径 {root_folder} 下未发现任何 main_enriched.json 文件。")
+def merge_one_folder(json_file_path, root_folder, manifest=None, store=None, executor=None):
+    """
+    合并单个模块：按 main_enriched.json 各节并发调用大模型，结果按章节顺序写入同目录的 merged.txt。
+    root_folder 为 merging_files 目录，用于生成任务清单中的单元名。
+    executor 为章节使用的线程池，批量合并时由调用方传入共享线程池；为None时临时创建。
+    跳过规则同 merge_by_folder；已完成章节的结果实时保存，某节失败时其余章节照常完成，
+    本模块不生成 merged.txt 并抛出该节的异常，重新运行时只请求未完成的章节。
+    """
+    dirpath = os.path.dirname(json_file_path)
+    output_path = os.path.join(dirpath, 'merged.txt')  # 先确定输出路径
+
+    # 跳过已合并的模块
+    if manifest is None and os.path.exists(output_path):
+        logging.info(f"已存在合并文件 {output_path}，跳过该模块。")
         return
 
-    for json_file_path in tqdm(json_paths, desc="模块文件合并", unit="个"):
-        dirpath = os.path.dirname(json_file_path)
-        output_path = os.path.join(dirpath, 'merged.txt')  # 先确定输出路径
+    json_data = get_store(store).load_json(json_file_path)
 
-        # 跳过已合并的模块
-        if os.path.exists(output_path):
-            logging.info(f"已存在合并文件 {output_path}，跳过该模块。")
-            continue
+    if manifest is not None:
+        unit = os.path.relpath(dirpath, root_folder)
+        inputs = [json_file_path] + collect_source_txts(json_data)
+        if manifest.is_fresh("merge", unit, inputs):
+            logging.info(f"模块 {unit} 的输入未变化，跳过合并。")
+            return
 
-        logging.info(f"处理文件: {json_file_path}")
+    logging.info(f"处理文件: {json_file_path}")
 
-        with open(json_file_path, 'r', encoding='utf-8') as f_json:
-            json_data = json.load(f_json)
+    results = SectionResults(os.path.join(dirpath, SECTION_RESULTS_FILE))
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=DEFAULT_MERGE_WORKERS, thread_name_prefix="merge")
 
-        merged_texts = []
+    # 按章节顺序提交，(是否为一级标题, future) 的顺序即 merged.txt 中的顺序
+    futures = []
+    for first_level_key, first_level_val in json_data.items():
+        sub_sections = first_level_val.get('sub_sections', {})
+        all_sub_empty = True
+        for second_level_key, second_level_val in sub_sections.items():
+            source_infos = second_level_val.get('source_info', [])
+            if source_infos:
+                all_sub_empty = False
+                break
 
-        for first_level_key, first_level_val in json_data.items():
-            sub_sections = first_level_val.get('sub_sections', {})
-            all_sub_empty = True
+        if all_sub_empty:
+            futures.append((True, executor.submit(process_first_level_section, first_level_key, first_level_val,
+                                                  results)))
+        else:
             for second_level_key, second_level_val in sub_sections.items():
-                source_infos = second_level_val.get('source_info', [])
-                if source_infos:
-                    all_sub_empty = False
-                    break
-
-            if all_sub_empty:
-                merged_result = process_first_level_section(first_level_key, first_level_val)
-                if merged_result:
-                    merged_texts.append(merged_result)
-            else:
-                for second_level_key, second_level_val in sub_sections.items():
-                    if second_level_val.get('source_info'):
-                        merged_result = process_section(second_level_key, second_level_val)
-                        merged_texts.append(merged_result)
-                    else:
-                        logging.info(f"跳过二级标题 {second_level_key} 因为 source_info 为空。")
-
-        final_merged_text = "\n\n".join(merged_texts)
-
-        with open(output_path, 'w', encoding='utf-8') as f_out:
-            f_out.write(final_merged_text)
-        logging.info(f"合并内容: {final_merged_text}")
-
-        logging.info(f"已生成合并文件：{output_path}")
+                if second_level_val.get('source_info'):
+                    futures.append((False, executor.submit(process_section, second_level_key, second_level_val,
+                                                           results)))
+                else:
+                    logging.info(f"跳过二级标题 {second_level_key} 因为 source_info 为空。")
+
+    try:
+        # 等待全部章节结束，已完成的章节都已保存，再抛出第一个失败章节的异常
+        error = None
+        for future in as_completed([future for _, future in futures]):
+            if future.exception() is not None and error is None:
+                error = future.exception()
+        if error is not None:
+            logging.error(f"模块 {dirpath} 有章节合并失败，已完成的章节将在下次运行时沿用: {error}")
+            raise error
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+
+    merged_texts = []
+    for first_level, future in futures:
+        merged_result = future.result()
+        # 一级标题的空结果不输出，与逐节串行合并时一致
+        if merged_result or not first_level:
+            merged_texts.append(merged_result)
+
+    final_merged_text = "\n\n".join(merged_texts)
+
+    with open(output_path, 'w', encoding='utf-8') as f_out:
+        f_out.write(final_merged_text)
+    logging.info(f"合并内容: {final_merged_text}")
+
+    logging.info(f"已生成合并文件：{output_path}")
+    results.clear()
+    if manifest is not None:
+        manifest.record("merge", unit, inputs, [output_path])
+
+def merge_by_folder(root_folder, manifest=None, store=None, max_workers=DEFAULT_MERGE_WORKERS):
+    """
+    对 merging_files 下每个模块的 main_enriched.json 调用大模型合并，生成 merged.txt。
+
+    未传入 manifest 时已存在 merged.txt 的模块跳过；
+    传入 manifest 时按 main_enriched.json 及其引用的原文txt内容哈希判断是否需要重新合并。
+    各模块并发处理，所有模块的章节共享 max_workers 个并发请求；有模块失败时，
+    其余模块照常完成后抛出第一个失败模块的异常。
+    """
+    json_paths = []
+    root_folder = os.path.join(root_folder, 'merging_files')
+    for path in get_store(store).walk_json(root_folder):
+        if os.path.basename(path) == 'main_enriched.json':
+            json_paths.append(path)
+
+    if not json_paths:
+        logging.warning(f"在路径 {root_folder} 下未发现任何 main_enriched.json 文件。")
+        return
 
+    # 模块线程只负责读写文件和等待章节结果，不占用章节线程池的并发数
+    error = None
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="merge") as section_executor, \
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="merge-module") as module_executor:
+        futures = {
+            module_executor.submit(merge_one_folder, json_file_path, root_folder,
+                                   manifest=manifest, store=store, executor=section_executor): json_file_path
+            for json_file_path in json_paths
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="模块文件合并", unit="个"):
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(f"模块合并失败: {futures[future]}，异常: {e}")
+                if error is None:
+                    error = e
+    if error is not None:
+        raise error
@@ -1,27 +1,46 @@
-import json
 import os
 import shutil
 import logging
+from Pipeline.json_store import get_store
 
-def get_unique_file_path(folder, filename):
+def get_unique_file_path(folder, filename, store=None):
     """
     生成文件夹folder内唯一的文件路径，避免名称冲突。
     """
+    store = get_store(store)
     base_name, ext = os.path.splitext(filename)
     candidate = filename
     count = 1
-    while os.path.exists(os.path.join(folder, candidate)):
+    while store.exists(os.path.join(folder, candidate)):
         candidate = f"{base_name}_{count}{ext}"
         count += 1
     return os.path.join(folder, candidate)
 
-def merge_json_files_with_suffix(base_root):
-    src_root = os.path.join(base_root, 'Summary')
-    parent_dir = os.path.dirname(src_root.rstrip(os.sep))
-    merging_dir = os.path.join(parent_dir, 'merging_files')
+# 模块文件夹中由后续步骤生成的json，不属于从Summary复制过来的源文件
+DERIVED_JSON_FILES = ('restructured_outline.json', 'main_enriched.json')
+
+def list_source_json_files(folder, store=None):
+    """
+    返回模块文件夹中从Summary复制过来的各项目json文件路径（按文件名排序）。
+    """
+    return [
+        os.path.join(folder, f) for f in get_store(store).list_json(folder)
+        if f not in DERIVED_JSON_FILES
+    ]
+
+# merging_files 下最终Word生成步骤的输出文件夹（TxtoWord），不是模块文件夹
+WORD_OUTPUT_FOLDERS = ('reformat_tilte', 'word_files')
+
+def list_merging_module_folders(merging_dir):
+    """merging_files 下的模块文件夹名（排除 WORD_OUTPUT_FOLDERS）"""
+    return [
+        entry for entry in os.listdir(merging_dir)
+        if entry not in WORD_OUTPUT_FOLDERS and os.path.isdir(os.path.join(merging_dir, entry))
+    ]
 
-    # 新增部分：删除merging_files下的reformat_title和word_files文件夹
-    for subfolder in ['reformat_title', 'word_files']:
+def clean_word_output_folders(merging_dir):
+    """删除merging_files下的reformat_tilte和word_files文件夹"""
+    for subfolder in WORD_OUTPUT_FOLDERS:
         folder_to_delete = os.path.join(merging_dir, subfolder)
         if os.path.exists(folder_to_delete) and os.path.isdir(folder_to_delete):
             try:
@@ -30,68 +49,103 @@ def merge_json_files_with_suffix(base_root):
             except Exception as e:
                 logging.error(f"删除文件夹 {folder_to_delete} 失败：{e}")
 
-    subfolders = [f for f in os.listdir(src_root) if os.path.isdir(os.path.join(src_root, f))]
+def list_summary_sources(src_root, store=None):
+    """
+    返回 Summary 下的项目子文件夹列表（排序后）和模块json文件名列表，
+    模块列表以第一个项目子文件夹中的json文件为准。
+    """
+    subfolders = sorted(f for f in os.listdir(src_root) if os.path.isdir(os.path.join(src_root, f)))
     if not subfolders:
         logging.info("A下面没有子文件夹，程序退出")
-        return
+        return [], []
 
     first_folder_path = os.path.join(src_root, subfolders[0])
-    json_filenames = [f for f in os.listdir(first_folder_path) if f.endswith('.json')]
-
+    json_filenames = get_store(store).list_json(first_folder_path)
     if not json_filenames:
         logging.info(f"第一个子文件夹 {subfolders[0]} 中没有json文件，程序退出")
+    return subfolders, json_filenames
+
+def prepare_module_folder(src_root, merging_dir, json_name, subfolders, manifest=None, store=None):
+    """
+    把各项目的 json_name 复制到 merging_dir/模块名/ 下（同名文件加后缀），并处理标题重名。
+
+    未传入 manifest 时，已存在的模块文件夹整体跳过；
+    传入 manifest 时按各项目源json的内容哈希判断，有变化的模块清理旧副本后重新复制。
+    store 为内存模式时复制和重命名都只在内存中进行。
+
+    :return: 是否重新复制了该模块
+    """
+    folder_name = os.path.splitext(json_name)[0]
+    folder_path = os.path.join(merging_dir, folder_name)
+    inputs = [os.path.join(src_root, sub, json_name) for sub in subfolders]
+    store = get_store(store)
+
+    if manifest is not None:
+        if manifest.is_fresh("prepare", folder_name, inputs):
+            logging.info(f"模块 {folder_name} 的源文件未变化，跳过复制。")
+            return False
+        # 源文件有变化：删除旧副本后重新复制，后续步骤生成的文件保留
+        for old_path in list_source_json_files(folder_path, store=store):
+            store.remove(old_path)
+    elif os.path.exists(folder_path):
+        logging.info(f"目标文件夹 {folder_path} 已存在，跳过该文件夹的复制。")
+        return False
+    os.makedirs(folder_path, exist_ok=True)
+
+    # 按项目顺序复制，避免同名覆盖
+    for src_json_path in inputs:
+        if store.exists(src_json_path):
+            unique_dst_path = get_unique_file_path(folder_path, json_name, store=store)  # 文件名带后缀
+            store.copy(src_json_path, unique_dst_path)
+            logging.info(f"复制 {src_json_path} 到 {unique_dst_path}")
+
+    rename_duplicate_titles_in_folder(folder_path, store=store)
+    if manifest is not None:
+        manifest.record("prepare", folder_name, inputs, list_source_json_files(folder_path, store=store))
+    return True
+
+def merge_json_files_with_suffix(base_root, manifest=None, store=None):
+    """
+    把 Summary/各项目/X.json 复制到 merging_files/X/ 下，并处理标题重名。
+    是否跳过已有模块见 prepare_module_folder。
+    """
+    src_root = os.path.join(base_root, 'Summary')
+    parent_dir = os.path.dirname(src_root.rstrip(os.sep))
+    merging_dir = os.path.join(parent_dir, 'merging_files')
+
+    # 新增部分：删除merging_files下的reformat_tilte和word_files文件夹
+    # 使用任务清单时Word输出由清单跟踪是否过期，不再每次删除
+    if manifest is None:
+        clean_word_output_folders(merging_dir)
+
+    subfolders, json_filenames = list_summary_sources(src_root, store=store)
+    if not json_filenames:
         return
 
-    # 新增：记录已经存在的目标文件夹，后续跳过
-    existing_folders = set()
     for json_name in json_filenames:
-        folder_name = os.path.splitext(json_name)[0]
-        folder_path = os.path.join(merging_dir, folder_name)
-        if os.path.exists(folder_path):
-            logging.info(f"目标文件夹 {folder_path} 已存在，跳过该文件夹的复制。")
-            existing_folders.add(folder_name)
-            continue
-        os.makedirs(folder_path, exist_ok=True)
-
-    # 遍历所有子文件夹，将对应json文件复制到对应文件夹，避免同名覆盖
-    for folder_name in subfolders:
-        folder_path = os.path.join(src_root, folder_name)
-        for json_name in json_filenames:
-            folder_short_name = os.path.splitext(json_name)[0]
-            if folder_short_name in existing_folders:
-                # 如果已存在，则跳过
-                continue
-            src_json_path = os.path.join(folder_path, json_name)
-            if os.path.exists(src_json_path):
-                target_folder = os.path.join(merging_dir, folder_short_name)  # 目标文件夹
-                unique_dst_path = get_unique_file_path(target_folder, json_name)  # 文件名带后缀
-                shutil.copy2(src_json_path, unique_dst_path)
-                logging.info(f"复制 {src_json_path} 到 {unique_dst_path}")
-    
-    # 对每个子文件夹执行重命名冲突处理
-    rename_all_subfolders_in_merging(merging_dir)
+        prepare_module_folder(src_root, merging_dir, json_name, subfolders, manifest=manifest, store=store)
+
     logging.info(f"所有文件已复制到 {merging_dir}，并处理了重命名冲突。")
     
-def rename_duplicate_titles_in_folder(folder):
+def rename_duplicate_titles_in_folder(folder, store=None):
     """
     对folder下所有json文件，检查一级和二级标题重复情况，给重复标题加编号区分。
     
     修改原文件。
     """
 
+    store = get_store(store)
     # 读取所有json数据，存储结构： {filename: json_data}
     json_datas = {}
-    for fname in os.listdir(folder):
-        if not fname.endswith('.json'):
+    # 只处理各项目的源json，后续步骤生成的大纲/索引文件不参与重名检查
+    for fpath in list_source_json_files(folder, store=store):
+        fname = os.path.basename(fpath)
+        try:
+            data = store.load_json(fpath)
+        except Exception as e:
+            logging.error(f"读取JSON失败 {fpath}: {e}")
             continue
-        fpath = os.path.join(folder, fname)
-        with open(fpath, 'r', encoding='utf-8') as f:
-            try:
-                data = json.load(f)
-            except Exception as e:
-                logging.error(f"读取JSON失败 {fpath}: {e}")
-                continue
-            json_datas[fname] = data
+        json_datas[fname] = data
 
     # --- 统计一级标题出现情况 ---
     # 结构: {一级标题: [ (文件名, 原始标题) ]}
@@ -192,8 +246,7 @@ def rename_duplicate_titles_in_folder(folder):
         # 保存回文件
         fpath = os.path.join(folder, fname)
         try:
-            with open(fpath, 'w', encoding='utf-8') as f:
-                json.dump(new_data, f, ensure_ascii=False, indent=2)
+            store.save_json(fpath, new_data, indent=2)
             logging.info(f"已更新文件标题: {fpath}")
         except Exception as e:
             logging.error(f"写文件失败 {fpath}: {e}")
@@ -202,8 +255,7 @@ def rename_all_subfolders_in_merging(merging_dir):
     """
     遍历merging_files目录下所有子文件夹，执行重命名冲突处理。
     """
-    for subfolder in os.listdir(merging_dir):
+    for subfolder in list_merging_module_folders(merging_dir):
         subfolder_path = os.path.join(merging_dir, subfolder)
-        if os.path.isdir(subfolder_path):
-            logging.info(f"处理子文件夹: {subfolder_path}")
-            rename_duplicate_titles_in_folder(subfolder_path)
\ No newline at end of file
+        logging.info(f"处理子文件夹: {subfolder_path}")
+        rename_duplicate_titles_in_folder(subfolder_path)
\ No newline at end of file
@@ -1,7 +1,8 @@
-import json
 import os
 import re
 import logging
+from Pipeline.json_store import get_store
+from Module_merge.merge_prepare import WORD_OUTPUT_FOLDERS
 
 def read_txt_to_string(filepath):
     """
@@ -83,15 +84,14 @@ def parse_content(text):
     
     return data
 
-def write_json(data, filename):
+def write_json(data, filename, store=None):
     """
     将Python字典写入JSON文件，保持中文正常显示，格式化缩进。
     """
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    get_store(store).save_json(filename, data, indent=4)
     logging.info(f"数据成功写入文件: {filename}")
 
-def process_text_to_json(input_filepath: str):
+def process_text_to_json(input_filepath: str, store=None):
     """
     从输入文本文件读取内容，经过过滤、清洗和解析后，写入与输入文件同名的JSON文件。
     """
@@ -103,20 +103,35 @@ def process_text_to_json(input_filepath: str):
     base, _ = os.path.splitext(input_filepath)
     output_filepath = base + '.json'
     
-    write_json(parsed_content, output_filepath)
+    write_json(parsed_content, output_filepath, store=store)
 
-def batch_process_txt_json(folder_path: str):
+def outline_txt_to_json(txt_path: str, unit: str, manifest=None, store=None):
+    """
+    把单个 restructured_outline.txt 解析为同名json，txt内容未变化时跳过。
+    unit 为任务清单中的单元名（模块文件夹名）。
+    """
+    json_path = os.path.splitext(txt_path)[0] + '.json'
+    if manifest is not None and manifest.is_fresh("outline_json", unit, [txt_path]):
+        return
+    logging.info(f"Processing file: {txt_path}")
+    process_text_to_json(txt_path, store=store)
+    if manifest is not None:
+        manifest.record("outline_json", unit, [txt_path], [json_path])
+
+def batch_process_txt_json(folder_path: str, manifest=None, store=None):
     """
     递归遍历文件夹，处理所有 .txt 文件，调用 process_text_to_json。
+    传入 manifest 时，txt内容未变化的文件跳过。
     """
     folder_path = os.path.join(folder_path, 'merging_files')
-    for root, _, files in os.walk(folder_path):
+    for root, dirnames, files in os.walk(folder_path):
+        if root == folder_path:
+            dirnames[:] = [d for d in dirnames if d not in WORD_OUTPUT_FOLDERS]
         for filename in files:
             if filename == 'restructured_outline.txt':
                 txt_path = os.path.join(root, filename)
-                logging.info(f"Processing file: {txt_path}")
                 try:
-                    process_text_to_json(txt_path)
+                    outline_txt_to_json(txt_path, os.path.relpath(root, folder_path), manifest=manifest, store=store)
                 except Exception as e:
                     logging.error(f"处理文件 {txt_path} 时出错: {e}", exc_info=True)
 
@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+import threading
+import time
+
+# 断点续跑记录：保存在 output_root/checkpoint.json，记录本次运行各步骤的完成情况，每个步骤开始和完成时写盘。
+# 步骤内各处理单元（文件、项目、模块）的完成情况由任务清单（Pipeline.manifest，断点续跑时每完成一个单元即追加到清单日志）记录，
+# 已完成的大模型回复保存在 output_root/llm_replies.sqlite3，续跑时相同请求直接沿用，不再重复调用。
+
+CHECKPOINT_NAME = "checkpoint.json"
+REPLY_DB_NAME = "llm_replies.sqlite3"
+
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+def load_checkpoint(output_root, filename=CHECKPOINT_NAME):
+    """读取断点记录，不存在或无法解析时返回 None"""
+    path = os.path.join(output_root, filename)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logging.error(f"读取断点记录失败: {path}，错误: {e}")
+        return None
+
+
+class RunCheckpoint:
+    """
+    单次运行的断点记录。
+
+    文件结构：
+    {
+        "version": 1,
+        "run_id": ..., "status": "running" | "done" | "failed",
+        "created": ..., "updated": ..., "resumed": 续跑次数,
+        "current_step": 正在执行的步骤,
+        "steps": {步骤: {"status": "running" | "done", "elapsed": 耗时, "finished": 完成时间, "units": {...}}},
+        "result_path": ..., "error": ...
+    }
+    resume=True 时在已有记录上继续（已完成步骤的记录保留），否则重新开始。
+    """
+
+    def __init__(self, output_root, run_id=None, resume=False, filename=CHECKPOINT_NAME):
+        self.path = os.path.join(output_root, filename)
+        self._lock = threading.Lock()
+        previous = load_checkpoint(output_root, filename) if resume else None
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        if previous is not None:
+            self.data = previous
+            self.data["resumed"] = self.data.get("resumed", 0) + 1
+            self.data.update(status=STATUS_RUNNING, error=None, result_path=None)
+        else:
+            if resume:
+                logging.warning(f"没有找到断点记录 {self.path}，将从头开始处理")
+            self.data = {
+                "version": 1,
+                "run_id": run_id,
+                "status": STATUS_RUNNING,
+                "created": now,
+                "resumed": 0,
+                "current_step": None,
+                "steps": {},
+                "result_path": None,
+                "error": None,
+            }
+        if run_id:
+            self.data["run_id"] = run_id
+        self.save()
+
+    def completed_steps(self):
+        with self._lock:
+            return [name for name, step in self.data["steps"].items() if step.get("status") == STATUS_DONE]
+
+    def step_started(self, step):
+        with self._lock:
+            entry = self.data["steps"].setdefault(step, {})
+            # 续跑时已完成的步骤重新执行（由任务清单跳过已完成的单元），保留上次的完成记录直到本次完成
+            if entry.get("status") != STATUS_DONE:
+                entry["status"] = STATUS_RUNNING
+            self.data["current_step"] = step
+        self.save()
+
+    def step_done(self, step, elapsed, units=None):
+        """units 为该步骤各处理单元的统计，如 {"summary": {"hits": 3, "misses": 2}}"""
+        with self._lock:
+            entry = self.data["steps"].setdefault(step, {})
+            entry.update(status=STATUS_DONE, elapsed=round(elapsed, 3),
+                         finished=time.strftime("%Y-%m-%d %H:%M:%S"))
+            if units:
+                entry["units"] = units
+            if self.data["current_step"] == step:
+                self.data["current_step"] = None
+        self.save()
+
+    def finish(self, result_path):
+        with self._lock:
+            self.data.update(status=STATUS_DONE, result_path=result_path, current_step=None)
+        self.save()
+
+    def fail(self, error):
+        with self._lock:
+            self.data.update(status=STATUS_FAILED, error=str(error))
+        self.save()
+
+    def save(self):
+        with self._lock:
+            self.data["updated"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,438 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from check_format import check_module_files
+from FilePreProcess.batch_runner import STAGING_DIR_NAME, commit_staged_files, record_split
+from FilePreProcess.file_processor import process_word_file
+from Module_merge.classifier import restructure_folder
+from Module_merge.index_create import enrich_folder
+from Module_merge.merge import merge_one_folder
+from Module_merge.merge_prepare import clean_word_output_folders, list_summary_sources, prepare_module_folder
+from Module_merge.text_to_json import outline_txt_to_json
+from SummaryExtract.batch_summary_extract import summarize_json_file
+from SummaryExtract.format import format_summary_file
+from SummaryExtract.title_extract import process_txt_file
+from TxtoWord.title_fromat import reformat_one_folder
+from TxtoWord.txt_to_word import build_final_document
+from TxtoWord.md_render import DEFAULT_RENDERER
+from .json_store import get_store
+from .scheduler import DagScheduler
+
+STEP_SPLIT = "文档切分"
+STEP_CHECK = "检查模块文件"
+STEP_TITLE = "提取多级标题"
+STEP_SUMMARY = "提取摘要"
+STEP_FORMAT = "格式化JSON文件"
+STEP_PREPARE = "合并文件预处理"
+STEP_RESTRUCTURE = "重组标题"
+STEP_OUTLINE = "结果格式化为JSON"
+STEP_INDEX = "生成索引"
+STEP_MERGE = "合并章节文件"
+STEP_MERGE_ALL = "合并所有文件"
+STEP_WORD = "生成最终Word文档"
+
+# 与串行流程的12个步骤一一对应，进度按此顺序和数量计算
+PIPELINE_STEPS = [
+    STEP_SPLIT, STEP_CHECK, STEP_TITLE, STEP_SUMMARY, STEP_FORMAT, STEP_PREPARE,
+    STEP_RESTRUCTURE, STEP_OUTLINE, STEP_INDEX, STEP_MERGE, STEP_MERGE_ALL, STEP_WORD,
+]
+
+# 各步骤在任务清单中对应的记录键
+MANIFEST_STEPS = {
+    STEP_SPLIT: ["split"],
+    STEP_TITLE: ["title"],
+    STEP_SUMMARY: ["summary"],
+    STEP_FORMAT: ["format"],
+    STEP_PREPARE: ["prepare"],
+    STEP_RESTRUCTURE: ["restructure"],
+    STEP_OUTLINE: ["outline_json"],
+    STEP_INDEX: ["index"],
+    STEP_MERGE: ["merge"],
+    STEP_WORD: ["word_module", "word_merge"],
+}
+
+# 内存模式下的检查点：大模型步骤完成后把中间json写盘，异常中断时不丢失已生成的结果
+CHECKPOINT_STEPS = (STEP_SUMMARY, STEP_RESTRUCTURE, STEP_MERGE)
+# 大模型调用的任务类型 -> 所属步骤，并发执行时用于按步骤统计调用
+LLM_TASK_STEPS = {"summarization": STEP_SUMMARY, "structuring": STEP_RESTRUCTURE, "merging": STEP_MERGE}
+
+
+class DagPipeline:
+    """
+    以任务依赖图的方式运行全流程：每个Word文件切分完成后，其项目的标题提取/摘要/格式化
+    立即开始，不必等待其他文件；各模块的预处理→重组→索引→合并→转Word也按模块独立推进，
+    大模型调用（llm）、pandoc转换（pandoc）和本地处理（cpu）分别使用各自的线程池。
+
+    与串行流程保持一致的地方：
+    - 切分结果按文件名顺序提交到项目文件夹，同名项目后处理的文件覆盖先处理的文件；
+    - 模块列表在全部切分完成后确定，规则同 merge_json_files_with_suffix；
+    - 各单元的跳过规则（任务清单或已有结果）沿用各步骤的单元处理函数。
+    """
+
+    def __init__(self, input_dir, output_root, module_config_file, manifest=None, pool_sizes=None,
+                 progress_callback=None, enable_summary=False, enable_restructure=False, store=None,
+                 word_renderer=DEFAULT_RENDERER, run_checkpoint=None):
+        self.input_dir = input_dir
+        self.output_root = output_root
+        self.module_config_file = module_config_file
+        self.manifest = manifest
+        self.store = get_store(store)
+        self.progress_callback = progress_callback
+        self.enable_summary = enable_summary
+        self._section_executor = None
+        self.enable_restructure = enable_restructure
+        self.word_renderer = word_renderer
+        self.run_checkpoint = run_checkpoint
+
+        self.summary_root = os.path.join(output_root, 'Summary')
+        self.merging_dir = os.path.join(output_root, 'merging_files')
+        self.staging_root = os.path.join(output_root, STAGING_DIR_NAME)
+
+        self.scheduler = DagScheduler(pool_sizes, on_progress=self._on_progress)
+        self._lock = threading.RLock()
+
+        self.files = []
+        self.results = []
+        self.cached = []
+        self.finished = []
+        self.next_commit = 0
+        self._all_split = False
+
+        self._chain_tail = {}      # {(项目文件夹, 模块名): 该项目该模块最后一个任务}
+        self._module_deps = {}     # {模块名: 模块预处理前需要完成的任务}
+        self._project_modules = {}  # {项目文件夹: 本次切分得到的模块名}
+
+        self.history = []
+        self._started = set()
+        self._reported = set()
+        self._percent = 0.0
+
+    # ---------- 文档切分 ----------
+
+    def _build_split_tasks(self):
+        self.files = sorted(f for f in os.listdir(self.input_dir) if f.lower().endswith('.docx')) \
+            if os.path.isdir(self.input_dir) else []
+        logging.info(f"检测到的Word文件数量: {len(self.files)}, 文件列表: {self.files}")
+
+        total = len(self.files)
+        self.results = [{"file": f, "folder": None, "error": None} for f in self.files]
+        self.cached = [False] * total
+        self.finished = [False] * total
+        shutil.rmtree(self.staging_root, ignore_errors=True)
+
+        for idx, file in enumerate(self.files):
+            word_path = os.path.join(self.input_dir, file)
+            if self.manifest is not None and self.manifest.is_fresh(
+                    "split", file, [word_path, self.module_config_file]):
+                self.results[idx]["folder"] = self.manifest.get_extra("split", file).get("folder")
+                self.cached[idx] = True
+                self.finished[idx] = True
+                logging.info(f"文件未变化，跳过切分: {file}")
+                continue
+            self.scheduler.add_task(f"split:{idx}", lambda i=idx: self._split_one(i),
+                                    resource="cpu", step=STEP_SPLIT)
+
+        # 开头连续的缓存文件直接提交；没有待切分文件时在这里进入模块阶段
+        self._commit_ready()
+
+    def _split_one(self, idx):
+        word_path = os.path.join(self.input_dir, self.files[idx])
+        logging.info(f"准备处理文件: {word_path}")
+        staging_dir = os.path.join(self.staging_root, str(idx))
+        try:
+            self.results[idx]["folder"] = process_word_file(
+                word_path, self.output_root, self.module_config_file, output_dir=staging_dir)
+        except Exception as e:
+            logging.error(f"处理文件出错: {word_path}，错误: {e}")
+            self.results[idx]["error"] = str(e)
+        with self._lock:
+            self.finished[idx] = True
+            self._commit_ready()
+        return self.results[idx]["folder"]
+
+    def _commit_ready(self):
+        """按文件顺序提交连续完成的切分结果，并为提交的项目添加后续任务"""
+        with self._lock:
+            total = len(self.files)
+            while self.next_commit < total and self.finished[self.next_commit]:
+                idx = self.next_commit
+                result = self.results[idx]
+                staging_dir = os.path.join(self.staging_root, str(idx))
+                if not self.cached[idx] and result["folder"] and os.path.isdir(staging_dir):
+                    try:
+                        commit_staged_files(staging_dir, os.path.join(self.output_root, result["folder"]))
+                        record_split(self.manifest, os.path.join(self.input_dir, result["file"]),
+                                     self.module_config_file, self.output_root, result)
+                    except Exception as e:
+                        logging.error(f"移动模块文件失败: {staging_dir}，错误: {e}")
+                        result["error"] = str(e)
+                if result["folder"] and not result["error"]:
+                    self._add_project_tasks(idx, result["folder"])
+                self.next_commit += 1
+
+            if self.next_commit == total and not self._all_split:
+                self._all_split = True
+                shutil.rmtree(self.staging_root, ignore_errors=True)
+                self._on_all_split()
+
+    # ---------- 项目阶段：标题 → 摘要 → 格式化 ----------
+
+    def _add_project_tasks(self, idx, folder):
+        project_dir = os.path.join(self.output_root, folder)
+        txt_files = sorted(f for f in os.listdir(project_dir) if f.endswith('.txt')) \
+            if os.path.isdir(project_dir) else []
+        split_deps = [f"split:{idx}"] if f"split:{idx}" in self.scheduler.tasks else []
+
+        for txt_name in txt_files:
+            module = os.path.splitext(txt_name)[0]
+            self._project_modules.setdefault(folder, set()).add(module)
+            key = (folder, module)
+            # 同名项目的多次提交按顺序串联，避免并发写同一文件
+            deps = split_deps + ([self._chain_tail[key]] if key in self._chain_tail else [])
+            txt_path = os.path.join(project_dir, txt_name)
+
+            tail = self.scheduler.add_task(
+                f"title:{folder}/{module}#{idx}",
+                lambda p=txt_path: process_txt_file(self.output_root, p, manifest=self.manifest, store=self.store),
+                deps=deps, resource="cpu", step=STEP_TITLE)
+
+            if self.enable_summary:
+                unit = os.path.join(folder, f"{module}.json")
+                title_json = os.path.join(self.output_root, 'Title', folder, f"{module}.json")
+                summary_json = os.path.join(self.summary_root, folder, f"{module}.json")
+                tail = self.scheduler.add_task(
+                    f"summary:{folder}/{module}#{idx}",
+                    lambda t=title_json, s=summary_json, u=unit: summarize_json_file(
+                        t, s, u, manifest=self.manifest, store=self.store, executor=self._section_executor),
+                    deps=[tail], resource="llm", step=STEP_SUMMARY)
+                tail = self.scheduler.add_task(
+                    f"format:{folder}/{module}#{idx}",
+                    lambda s=summary_json, u=unit: self._format_if_exists(s, u),
+                    deps=[tail], resource="cpu", step=STEP_FORMAT)
+                self._module_deps.setdefault(f"{module}.json", []).append(tail)
+
+            self._chain_tail[key] = tail
+
+    def _format_if_exists(self, summary_json, unit):
+        if self.store.exists(summary_json):
+            format_summary_file(summary_json, unit, manifest=self.manifest, store=self.store)
+
+    def _add_existing_format_tasks(self):
+        """摘要步骤停用时，与串行流程一样清洗 Summary 下已有的json"""
+        if not os.path.isdir(self.summary_root):
+            return
+        for full_path in self.store.walk_json(self.summary_root):
+            unit = os.path.relpath(full_path, self.summary_root)
+            name = self.scheduler.add_task(
+                f"format:{unit}",
+                lambda p=full_path, u=unit: format_summary_file(p, u, manifest=self.manifest, store=self.store),
+                resource="cpu", step=STEP_FORMAT)
+            self._module_deps.setdefault(os.path.basename(full_path), []).append(name)
+
+    # ---------- 模块阶段：预处理 → 重组 → 大纲json → 索引 → 合并 → 转Word ----------
+
+    def _on_all_split(self):
+        sched = self.scheduler
+        sched.seal(STEP_SPLIT)
+        logging.info("所有Word文件切分完成，开始确定模块列表")
+
+        # 只检查切分得到的项目文件夹，此时项目的标题等任务已经在 output_root 下建立了 Title 等输出目录
+        project_folders = list(dict.fromkeys(r["folder"] for r in self.results if r["folder"] and not r["error"]))
+        sched.add_task("check_module_files",
+                       lambda: check_module_files(self.output_root, self.module_config_file, folders=project_folders),
+                       resource="cpu", step=STEP_CHECK)
+        sched.seal(STEP_CHECK)
+
+        if not self.enable_summary:
+            self._add_existing_format_tasks()
+        for step in (STEP_TITLE, STEP_SUMMARY, STEP_FORMAT):
+            sched.seal(step)
+
+        # 使用任务清单时Word输出由清单跟踪是否过期，不再每次删除
+        if self.manifest is None:
+            clean_word_output_folders(self.merging_dir)
+
+        if self.enable_summary:
+            json_names = self._summary_module_names()
+        elif os.path.isdir(self.summary_root):
+            json_names = list_summary_sources(self.summary_root, store=self.store)[1]
+        else:
+            logging.warning(f"路径不存在: {self.summary_root}")
+            json_names = []
+
+        final_deps = []
+        for json_name in json_names:
+            final_deps.extend(self._add_module_tasks(json_name))
+
+        sched.add_task("word_merge", lambda: build_final_document(self.output_root, manifest=self.manifest,
+                                                                  renderer=self.word_renderer),
+                       deps=final_deps, resource="cpu", step=STEP_WORD)
+
+        for step in (STEP_PREPARE, STEP_RESTRUCTURE, STEP_OUTLINE, STEP_INDEX, STEP_MERGE,
+                     STEP_MERGE_ALL, STEP_WORD):
+            sched.seal(step)
+
+    def _summary_module_names(self):
+        """
+        摘要步骤启用时的模块json文件名列表，规则同串行流程的 list_summary_sources：
+        以 Summary 下排序后第一个项目文件夹中的json为准。此时本次的摘要可能还没有生成，
+        第一个项目是本次切分的项目时，把其模块txt对应的json一并计入。
+        """
+        existing = []
+        if os.path.isdir(self.summary_root):
+            existing = [f for f in os.listdir(self.summary_root) if os.path.isdir(os.path.join(self.summary_root, f))]
+        folders = sorted(set(existing) | set(self._project_modules))
+        if not folders:
+            return []
+        first = folders[0]
+        names = set(self.store.list_json(os.path.join(self.summary_root, first))) if first in existing else set()
+        names.update(f"{m}.json" for m in self._project_modules.get(first, ()))
+        return sorted(names)
+
+    def _add_module_tasks(self, json_name):
+        """添加单个模块的任务链，返回最终合并Word需要等待的任务"""
+        sched = self.scheduler
+        module = os.path.splitext(json_name)[0]
+        folder_path = os.path.join(self.merging_dir, module)
+
+        tail = sched.add_task(f"prepare:{module}", lambda: self._prepare_module(json_name),
+                              deps=self._module_deps.get(json_name, []), resource="cpu", step=STEP_PREPARE)
+        if self.enable_restructure:
+            tail = sched.add_task(f"restructure:{module}",
+                                  lambda: restructure_folder(folder_path, module, manifest=self.manifest,
+                                                             store=self.store),
+                                  deps=[tail], resource="llm", step=STEP_RESTRUCTURE)
+        tail = sched.add_task(f"outline_json:{module}", lambda: self._outline_module(folder_path, module),
+                              deps=[tail], resource="cpu", step=STEP_OUTLINE)
+        tail = sched.add_task(f"index:{module}",
+                              lambda: enrich_folder(folder_path, module, manifest=self.manifest, store=self.store),
+                              deps=[tail], resource="cpu", step=STEP_INDEX)
+        tail = sched.add_task(f"merge:{module}", lambda: self._merge_module(folder_path),
+                              deps=[tail], resource="llm", step=STEP_MERGE)
+        if module[:1].isdigit():
+            tail = sched.add_task(f"word_module:{module}",
+                                  lambda: reformat_one_folder(self.merging_dir, module, manifest=self.manifest,
+                                                              renderer=self.word_renderer),
+                                  deps=[tail], resource="pandoc", step=STEP_WORD)
+        return [tail]
+
+    def _prepare_module(self, json_name):
+        # 项目列表在任务执行时读取，包含之前运行留下的项目，与串行流程一致
+        subfolders = sorted(f for f in os.listdir(self.summary_root)
+                            if os.path.isdir(os.path.join(self.summary_root, f)))
+        prepare_module_folder(self.summary_root, self.merging_dir, json_name, subfolders,
+                              manifest=self.manifest, store=self.store)
+
+    def _outline_module(self, folder_path, module):
+        txt_path = os.path.join(folder_path, 'restructured_outline.txt')
+        if os.path.isfile(txt_path):
+            outline_txt_to_json(txt_path, module, manifest=self.manifest, store=self.store)
+
+    def _merge_module(self, folder_path):
+        json_path = os.path.join(folder_path, 'main_enriched.json')
+        if self.store.exists(json_path):
+            merge_one_folder(json_path, self.merging_dir, manifest=self.manifest, store=self.store,
+                             executor=self._section_executor)
+        else:
+            logging.warning(f"模块 {folder_path} 缺少 main_enriched.json，跳过合并。")
+
+    # ---------- 进度 ----------
+
+    def _on_progress(self, scheduler):
+        steps = scheduler.snapshot_steps()
+        with self._lock:
+            now = time.time()
+            done_fraction = 0.0
+            current = None
+            for step in PIPELINE_STEPS:
+                stats = steps.get(step)
+                if stats and stats["start"] is not None and step not in self._started:
+                    self._step_started(step)
+                if stats and stats["sealed"] and stats["finished"] == stats["total"]:
+                    done_fraction += 1
+                    if step not in self._reported:
+                        self._step_done(step, stats["end"] - stats["start"], failed=stats["failed"])
+                    continue
+                if stats and stats["total"]:
+                    done_fraction += stats["finished"] / stats["total"]
+                if current is None and stats and stats["start"] is not None:
+                    current = step
+            if current is None:
+                current = next((s for s in PIPELINE_STEPS if s not in self._reported), PIPELINE_STEPS[-1])
+
+            # 运行中追加任务会让步骤完成比例回落，进度只增不减
+            self._percent = max(self._percent, done_fraction / len(PIPELINE_STEPS) * 100)
+            stats = steps.get(current) or {}
+            start = stats.get("start")
+            elapsed = (stats.get("end") or now) - start if start else 0
+
+            # 多个工作线程都会触发回调，持锁调用保证外部收到的进度有序
+            if self.progress_callback:
+                self.progress_callback(
+                    percent=self._percent,
+                    current_step_name=current,
+                    current_step_elapsed=elapsed,
+                    history=self.history.copy()
+                )
+
+    def _step_started(self, step):
+        # 调用方需持有 self._lock
+        self._started.add(step)
+        if self.run_checkpoint is not None:
+            self.run_checkpoint.step_started(step)
+
+    def _step_done(self, step, elapsed, failed=0):
+        # 调用方需持有 self._lock；与串行流程的 step_done 一样记录耗时、保存中间结果和断点，
+        # 有任务失败或被跳过的步骤在断点记录中保持未完成
+        self._reported.add(step)
+        self.history.append({'name': step, 'time': elapsed})
+        logging.info(f"{step} 完成，耗时 {elapsed:.2f} 秒" + (f"，{failed} 个任务失败或跳过" if failed else ""))
+        units = self._checkpoint(step)
+        if self.run_checkpoint is not None and not failed:
+            self.run_checkpoint.step_done(step, elapsed, units=units)
+
+    def _checkpoint(self, step):
+        """保存该步骤的中间结果和任务清单，返回各处理单元的统计 {记录键: {"hits", "misses"}}"""
+        if step in CHECKPOINT_STEPS:
+            self.store.flush()
+        units = {}
+        if self.manifest is None:
+            return units
+        for key in MANIFEST_STEPS.get(step, []):
+            hits, misses = self.manifest.summary(key)
+            logging.info(f"{step}[{key}] 缓存命中 {hits} 个，重新处理 {misses} 个")
+            units[key] = {"hits": hits, "misses": misses}
+        self.manifest.save()
+        return units
+
+    def run(self):
+        """构建任务图并执行，返回最终Word文档路径；有任务失败时在全部任务结束后抛出 RuntimeError"""
+        logging.info(f"按任务依赖图运行，线程池大小: {self.scheduler.pool_sizes}")
+        # 摘要/合并任务只负责读写文件，章节请求统一提交到这个线程池，并发数与llm线程池一致
+        self._section_executor = ThreadPoolExecutor(max_workers=self.scheduler.pool_sizes["llm"],
+                                                    thread_name_prefix="dag-llm-section")
+        try:
+            self._build_split_tasks()
+            results = self.scheduler.run()
+        finally:
+            self._section_executor.shutdown(wait=True)
+            # 有任务失败时也保存已完成的单元，续跑时直接沿用
+            self.store.flush()
+            if self.manifest is not None:
+                self.manifest.save()
+        return results.get("word_merge")
+
+
+def run_dag_pipeline(input_dir, output_root, module_config_file, manifest=None, pool_sizes=None,
+                     progress_callback=None, enable_summary=False, enable_restructure=False, store=None,
+                     word_renderer=DEFAULT_RENDERER, run_checkpoint=None):
+    """按任务依赖图运行全流程，参数含义见 DagPipeline 和 process_word_documents"""
+    pipeline = DagPipeline(input_dir, output_root, module_config_file, manifest=manifest,
+                           pool_sizes=pool_sizes, progress_callback=progress_callback,
+                           enable_summary=enable_summary, enable_restructure=enable_restructure,
+                           store=store, word_renderer=word_renderer, run_checkpoint=run_checkpoint)
+    return pipeline.run()
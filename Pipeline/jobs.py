@@ -0,0 +1,405 @@
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+# 多任务队列：每个任务有单独的输入、输出目录，任务记录保存在 jobs/jobs.sqlite3，
+# 最多同时运行 max_workers 个任务，每个任务在单独的子进程中执行 process_word_documents。
+# 日志配置、大模型调用统计和流式输出监听都是进程级的，放在子进程中各任务互不干扰；
+# 子进程通过队列把进度和结果发回主进程，由主进程更新任务记录并转发给 on_event（如推送到前端）。
+# 任务都记录断点（Pipeline.checkpoint），失败或服务重启中断的任务可以用 resume 从断点继续。
+#
+# 目录结构：
+#   jobs/jobs.sqlite3          任务记录
+#   jobs/<任务ID>/input/       上传的Word文件
+#   jobs/<任务ID>/output/      中间文件和最终结果
+#   jobs/<任务ID>/module_config.json
+
+JOBS_ROOT = "jobs"
+JOB_DB_NAME = "jobs.sqlite3"
+DEFAULT_MAX_WORKERS = 2
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+# 服务重启时仍在运行的任务
+STATUS_INTERRUPTED = "interrupted"
+FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED, STATUS_INTERRUPTED)
+# 可以从断点继续的任务状态
+RESUMABLE_STATUSES = (STATUS_FAILED, STATUS_INTERRUPTED)
+
+# 子进程发回的事件类型
+EVENT_STARTED = "started"
+EVENT_PROGRESS = "progress"
+EVENT_DONE = "done"
+EVENT_FAILED = "failed"
+
+# 子进程推送流式输出进度的最小间隔（秒）
+STREAM_EVENT_INTERVAL = 0.5
+# 检查子进程是否退出的间隔（秒）
+POLL_INTERVAL = 0.5
+
+_JSON_COLUMNS = ("params", "progress", "llm_report")
+
+
+def new_job_id():
+    """按提交时间排序的任务ID，如 20240610143012-3f2a9c1d"""
+    return f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+class JobTable:
+    """任务记录表（SQLite），params/progress/llm_report 以json文本保存，读取时解析为字典"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " owner TEXT,"
+                " status TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " started REAL,"
+                " finished REAL,"
+                " params TEXT NOT NULL,"
+                " progress TEXT,"
+                " result_path TEXT,"
+                " error TEXT,"
+                " llm_report TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_owner ON jobs(owner)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        job = dict(row)
+        for column in _JSON_COLUMNS:
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+    def insert(self, job_id, owner, params, status=STATUS_QUEUED):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, owner, status, created, params) VALUES (?, ?, ?, ?, ?)",
+                (job_id, owner, status, time.time(), json.dumps(params, ensure_ascii=False))
+            )
+
+    def update(self, job_id, **fields):
+        if not fields:
+            return
+        values = [json.dumps(v, ensure_ascii=False) if k in _JSON_COLUMNS and v is not None else v
+                  for k, v in fields.items()]
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", values + [job_id])
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def list(self, owner=None, status=None, limit=50):
+        """按提交时间倒序列出任务，owner/status 为 None 时不过滤"""
+        sql, args = "SELECT * FROM jobs WHERE 1 = 1", []
+        if owner is not None:
+            sql += " AND owner = ?"
+            args.append(owner)
+        if status is not None:
+            sql += " AND status = ?"
+            args.append(status)
+        sql += " ORDER BY created DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def run_job(job_id, params, events):
+    """
+    子进程入口：执行一次 process_word_documents，进度和结果以 (事件类型, 任务ID, 内容) 放入 events 队列。
+    """
+    # 在子进程中导入，主进程（网页服务）不必加载整个处理流程
+    from file_merge_pipeline import process_word_documents
+    from SummaryExtract.llm_client import StreamMonitor, add_stream_listener
+    from SummaryExtract.llm_telemetry import LLMTelemetry
+
+    events.put((EVENT_STARTED, job_id, {"pid": os.getpid(), "time": time.time()}))
+
+    def progress_callback(percent, current_step_name=None, current_step_elapsed=None, history=None):
+        events.put((EVENT_PROGRESS, job_id, {
+            "percent": percent,
+            "current_step_name": current_step_name,
+            "current_step_elapsed": current_step_elapsed or 0,
+            "history": history,
+        }))
+
+    stream_monitor = StreamMonitor()
+    last_stream_event = {"time": 0}
+
+    def stream_listener(event):
+        # 大模型流式输出进度作为 llm_stream 子事件发回，最多每 STREAM_EVENT_INTERVAL 秒一次
+        stream_monitor(event)
+        now = time.time()
+        if not event["done"] and now - last_stream_event["time"] < STREAM_EVENT_INTERVAL:
+            return
+        last_stream_event["time"] = now
+        events.put((EVENT_PROGRESS, job_id, {"sub_event": "llm_stream", "llm": stream_monitor.snapshot()}))
+
+    add_stream_listener(stream_listener)
+    telemetry = LLMTelemetry()
+    try:
+        result_path = process_word_documents(
+            input_dir=params["input_dir"],
+            output_root=params["output_dir"],
+            log_root_dir=params.get("log_root_dir", "log"),
+            days_to_keep=params.get("days", 7),
+            module_config_file=params["module_config"],
+            progress_callback=progress_callback,
+            telemetry=telemetry,
+            run_id=job_id,
+            checkpoint=True,
+            resume=params.get("resume", False),
+            **params.get("options", {})
+        )
+        events.put((EVENT_DONE, job_id, {"result_path": result_path, "llm_report": telemetry.summary()}))
+    except Exception as e:
+        logging.exception(f"任务 {job_id} 处理异常:")
+        events.put((EVENT_FAILED, job_id, {"error": str(e), "llm_report": telemetry.summary()}))
+
+
+class JobManager:
+    """
+    任务队列和子进程池。
+
+    用法：job_id = manager.new_job() 创建任务目录，把上传文件保存到 manager.input_dir(job_id) 后
+    调用 manager.submit(job_id, owner, module_config)；任务按提交顺序排队，最多同时运行 max_workers 个。
+    on_event(事件类型, 任务ID, 内容) 在主进程的事件线程中调用，事件类型为 started/progress/done/failed，
+    done 的内容含 result_path 和 llm_report，failed 的内容含 error。
+
+    start() 启动后台线程，并恢复上次服务退出时的任务：排队中的继续排队，运行中的标记为 interrupted。
+    子进程用 spawn 方式启动（与Windows一致），网页服务的主模块需要有 if __name__ == "__main__" 保护。
+    """
+
+    def __init__(self, root=JOBS_ROOT, max_workers=DEFAULT_MAX_WORKERS, on_event=None, log_root_dir="log",
+                 options=None):
+        self.root = os.path.abspath(root)
+        self.max_workers = max(1, max_workers)
+        self.on_event = on_event
+        self.log_root_dir = os.path.abspath(log_root_dir)
+        # 传给 process_word_documents 的其他参数，如 {"use_dag": True}
+        self.options = dict(options or {})
+        self.table = JobTable(os.path.join(self.root, JOB_DB_NAME))
+
+        self._ctx = multiprocessing.get_context("spawn")
+        self._events = None
+        self._pending = deque()
+        self._running = {}  # {任务ID: Process}
+        self._cond = threading.Condition()
+        self._started = False
+        self._stopping = False
+        self._threads = []
+
+    # ---- 目录 ----
+
+    def job_dir(self, job_id):
+        return os.path.join(self.root, job_id)
+
+    def input_dir(self, job_id):
+        return os.path.join(self.job_dir(job_id), "input")
+
+    def output_dir(self, job_id):
+        return os.path.join(self.job_dir(job_id), "output")
+
+    def new_job(self):
+        """生成任务ID并创建输入、输出目录"""
+        job_id = new_job_id()
+        os.makedirs(self.input_dir(job_id))
+        os.makedirs(self.output_dir(job_id))
+        return job_id
+
+    def discard(self, job_id):
+        """删除尚未提交的任务目录（如上传失败时）"""
+        if self.table.get(job_id) is None:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    # ---- 提交与查询 ----
+
+    def submit(self, job_id, owner, module_config, days=7):
+        """提交任务排队执行，返回任务记录"""
+        params = {
+            "input_dir": self.input_dir(job_id),
+            "output_dir": self.output_dir(job_id),
+            "module_config": os.path.abspath(module_config),
+            "days": days,
+            "log_root_dir": self.log_root_dir,
+            "options": self.options,
+        }
+        self.table.insert(job_id, owner, params)
+        self.start()
+        with self._cond:
+            self._pending.append(job_id)
+            self._cond.notify_all()
+        logging.info(f"任务 {job_id} 已提交，排队任务 {len(self._pending)} 个，运行中 {len(self._running)} 个")
+        return self.table.get(job_id)
+
+    def resume(self, job_id):
+        """
+        让失败或中断的任务从断点继续：重新排队，子进程以 resume=True 运行，已完成的单元和大模型回复直接沿用。
+        返回任务记录，任务不存在时返回 None，状态不允许续跑时抛出 ValueError。
+        """
+        self.start()
+        with self._cond:
+            job = self.table.get(job_id)
+            if job is None:
+                return None
+            if job["status"] not in RESUMABLE_STATUSES:
+                raise ValueError(f"任务状态为 {job['status']}，只有失败或中断的任务可以继续")
+            params = dict(job["params"], resume=True)
+            self.table.update(job_id, status=STATUS_QUEUED, params=params, finished=None, error=None,
+                              result_path=None)
+            self._pending.append(job_id)
+            self._cond.notify_all()
+        logging.info(f"任务 {job_id} 从断点继续，已重新排队")
+        return self.table.get(job_id)
+
+    def get(self, job_id):
+        return self.table.get(job_id)
+
+    def list(self, owner=None, status=None, limit=50):
+        return self.table.list(owner=owner, status=status, limit=limit)
+
+    def queue_position(self, job_id):
+        """排队中的任务前面还有几个任务，不在队列中时返回 None"""
+        with self._cond:
+            try:
+                return list(self._pending).index(job_id)
+            except ValueError:
+                return None
+
+    # ---- 后台线程 ----
+
+    def start(self):
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+            self._events = self._ctx.Queue()
+            for job in reversed(self.table.list(status=STATUS_RUNNING, limit=0)):
+                self.table.update(job["id"], status=STATUS_INTERRUPTED, finished=time.time(),
+                                  error="服务重启时任务未完成")
+            self._pending.extend(job["id"] for job in reversed(self.table.list(status=STATUS_QUEUED, limit=0)))
+        for target, name in ((self._schedule_loop, "job-scheduler"), (self._event_loop, "job-events")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def shutdown(self, wait=True):
+        """停止调度新任务；wait=True 时等待运行中的任务结束"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            running = list(self._running.values())
+        if wait:
+            for process in running:
+                process.join()
+        if self._events is not None:
+            self._events.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _launch(self, job_id):
+        job = self.table.get(job_id)
+        if job is None or job["status"] != STATUS_QUEUED:
+            return
+        process = self._ctx.Process(target=run_job, args=(job_id, job["params"], self._events),
+                                    name=f"job-{job_id}", daemon=False)
+        self.table.update(job_id, status=STATUS_RUNNING, started=time.time())
+        process.start()
+        self._running[job_id] = process
+        logging.info(f"任务 {job_id} 开始运行，子进程 {process.pid}")
+
+    def _reap(self):
+        for job_id, process in list(self._running.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self._running[job_id]
+            job = self.table.get(job_id)
+            if process.exitcode != 0 and job and job["status"] == STATUS_RUNNING:
+                # 子进程异常退出（如被系统终止），没有发回结果
+                error = f"处理进程异常退出，退出码 {process.exitcode}"
+                self.table.update(job_id, status=STATUS_FAILED, finished=time.time(), error=error)
+                self._notify(EVENT_FAILED, job_id, {"error": error})
+
+    def _schedule_loop(self):
+        with self._cond:
+            while not self._stopping:
+                self._reap()
+                while self._pending and len(self._running) < self.max_workers:
+                    job_id = self._pending.popleft()
+                    try:
+                        self._launch(job_id)
+                    except Exception as e:
+                        logging.exception(f"任务 {job_id} 启动失败:")
+                        self.table.update(job_id, status=STATUS_FAILED, finished=time.time(), error=str(e))
+                        self._notify(EVENT_FAILED, job_id, {"error": str(e)})
+                self._cond.wait(POLL_INTERVAL)
+
+    def _event_loop(self):
+        while True:
+            try:
+                item = self._events.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            kind, job_id, payload = item
+            try:
+                self._handle_event(kind, job_id, payload)
+            except Exception as e:
+                logging.exception(f"任务 {job_id} 事件处理异常: {e}")
+            if kind in (EVENT_DONE, EVENT_FAILED):
+                with self._cond:
+                    self._cond.notify_all()
+
+    def _handle_event(self, kind, job_id, payload):
+        if kind == EVENT_PROGRESS and payload.get("sub_event") is None:
+            self.table.update(job_id, progress=payload)
+        elif kind == EVENT_DONE:
+            self.table.update(job_id, status=STATUS_DONE, finished=time.time(),
+                              result_path=payload["result_path"], llm_report=payload["llm_report"])
+            logging.info(f"任务 {job_id} 处理完成: {payload['result_path']}")
+        elif kind == EVENT_FAILED:
+            self.table.update(job_id, status=STATUS_FAILED, finished=time.time(), error=payload["error"],
+                              llm_report=payload.get("llm_report"))
+            logging.warning(f"任务 {job_id} 处理失败: {payload['error']}")
+        self._notify(kind, job_id, payload)
+
+    def _notify(self, kind, job_id, payload):
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(kind, job_id, payload)
+        except Exception as e:
+            logging.exception(f"任务 {job_id} 事件回调异常: {e}")
@@ -0,0 +1,199 @@
+import copy
+import json
+import logging
+import os
+import shutil
+import threading
+
+
+class JsonStore:
+    """
+    中间JSON文件（Title/Summary/merging_files下的json）的统一读写入口。
+
+    - memory=False（默认）：直接读写磁盘，行为与原来逐步骤读写文件一致；
+    - memory=True：save_json 只把数据保存在内存中，后续步骤 load_json 直接拿到Python对象，
+      不再重复序列化、写盘、读盘和解析；调用 flush()（检查点）时才把改动写入磁盘，
+      写出的内容与磁盘模式逐字节一致；
+    - debug=True：内存模式下每次保存同时写盘，便于调试时查看中间结果。
+
+    内存模式下 load_json 返回的是共享对象，调用方需要修改时传入 mutable=True 获取副本。
+    路径统一按绝对路径保存。
+    """
+
+    def __init__(self, memory=False, debug=False):
+        self.memory = memory
+        self.debug = debug
+        self._data = {}      # {路径: 对象}
+        self._indent = {}    # {路径: 缩进}
+        self._bytes = {}     # {路径: 序列化结果}，供计算哈希和落盘复用
+        self._dirty = set()  # 尚未写盘的路径
+        self._removed = set()  # 已删除但磁盘上可能还存在的路径
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _norm(path):
+        return os.path.abspath(path)
+
+    @staticmethod
+    def _write(path, data, indent):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+
+    def load_json(self, path, mutable=False):
+        """读取json；文件不存在时抛出 FileNotFoundError"""
+        if not self.memory:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        key = self._norm(path)
+        with self._lock:
+            if key in self._data:
+                data = self._data[key]
+                return copy.deepcopy(data) if mutable else data
+            if key in self._removed:
+                raise FileNotFoundError(f"文件已删除: {path}")
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        with self._lock:
+            # 缓存磁盘上的原始内容，同一轮运行中再次读取不必重新解析
+            self._data.setdefault(key, data)
+            data = self._data[key]
+        return copy.deepcopy(data) if mutable else data
+
+    def save_json(self, path, data, indent=2):
+        if not self.memory:
+            self._write(path, data, indent)
+            return
+
+        key = self._norm(path)
+        with self._lock:
+            self._data[key] = data
+            self._indent[key] = indent
+            self._bytes.pop(key, None)
+            self._removed.discard(key)
+            self._dirty.add(key)
+            if self.debug:
+                self._flush_one(key)
+
+    def exists(self, path):
+        if not self.memory:
+            return os.path.isfile(path)
+        key = self._norm(path)
+        with self._lock:
+            if key in self._data:
+                return True
+            if key in self._removed:
+                return False
+        return os.path.isfile(path)
+
+    def remove(self, path):
+        if not self.memory:
+            os.remove(path)
+            return
+        key = self._norm(path)
+        with self._lock:
+            self._data.pop(key, None)
+            self._bytes.pop(key, None)
+            self._dirty.discard(key)
+            self._removed.add(key)
+            if self.debug and os.path.isfile(key):
+                os.remove(key)
+                self._removed.discard(key)
+
+    def copy(self, src_path, dst_path):
+        """复制json；内存模式下目标与源共享同一对象，直到任一方被重新保存"""
+        if not self.memory:
+            shutil.copy2(src_path, dst_path)
+            return
+        key = self._norm(src_path)
+        data = self.load_json(src_path)
+        with self._lock:
+            indent = self._indent.get(key, 2)
+        self.save_json(dst_path, data, indent=indent)
+
+    def list_json(self, folder):
+        """返回 folder 下的json文件名（排序后），包含尚未写盘的文件"""
+        names = set()
+        if os.path.isdir(folder):
+            names.update(f for f in os.listdir(folder) if f.endswith('.json'))
+        if self.memory:
+            folder_key = self._norm(folder)
+            with self._lock:
+                names.update(os.path.basename(k) for k in self._data if os.path.dirname(k) == folder_key)
+                names.difference_update(os.path.basename(k) for k in self._removed
+                                        if os.path.dirname(k) == folder_key)
+        return sorted(names)
+
+    def walk_json(self, root):
+        """
+        递归列出 root 下所有json文件路径：磁盘上的文件按 os.walk 顺序在前，
+        内存中尚未写盘的新文件排序后附在最后。
+        """
+        paths = []
+        for dirpath, _, files in os.walk(root):
+            for file in files:
+                if file.lower().endswith('.json'):
+                    paths.append(os.path.join(dirpath, file))
+        if not self.memory:
+            return paths
+
+        root_key = self._norm(root)
+        with self._lock:
+            removed = set(self._removed)
+            pending = sorted(k for k in self._data
+                             if k.startswith(root_key + os.sep) and k.lower().endswith('.json'))
+        seen = {self._norm(p) for p in paths}
+        paths = [p for p in paths if self._norm(p) not in removed]
+        paths.extend(k for k in pending if k not in seen)
+        return paths
+
+    def is_pending(self, path):
+        """内存模式下该路径是否有尚未写盘的改动"""
+        if not self.memory:
+            return False
+        key = self._norm(path)
+        with self._lock:
+            return key in self._dirty or key in self._removed
+
+    def dumps(self, path):
+        """返回待写盘内容的字节串（与写盘结果一致），路径已删除时返回None"""
+        key = self._norm(path)
+        with self._lock:
+            if key not in self._data:
+                return None
+            if key not in self._bytes:
+                text = json.dumps(self._data[key], ensure_ascii=False, indent=self._indent.get(key, 2))
+                # 与文本模式写文件的换行转换保持一致（json中的换行只出现在缩进结构里）
+                self._bytes[key] = text.replace('\n', os.linesep).encode('utf-8')
+            return self._bytes[key]
+
+    def _flush_one(self, key):
+        if key in self._data:
+            os.makedirs(os.path.dirname(key), exist_ok=True)
+            with open(key, 'wb') as f:
+                f.write(self.dumps(key))
+        self._dirty.discard(key)
+
+    def flush(self):
+        """检查点：把内存中的改动写入磁盘，返回写入的文件数"""
+        if not self.memory:
+            return 0
+        with self._lock:
+            for key in sorted(self._removed):
+                if os.path.isfile(key):
+                    os.remove(key)
+            self._removed.clear()
+            written = len(self._dirty)
+            for key in sorted(self._dirty):
+                self._flush_one(key)
+        if written:
+            logging.info(f"中间结果已写入磁盘，共 {written} 个json文件")
+        return written
+
+
+# 未指定存储时使用的磁盘存储
+DISK_STORE = JsonStore()
+
+
+def get_store(store=None):
+    return store if store is not None else DISK_STORE
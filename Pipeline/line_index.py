@@ -0,0 +1,188 @@
+import codecs
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+
+# 文本文件的行号 -> 字节偏移索引，用于按行号区间随机读取切分后的模块txt（摘要提取、章节合并都按 source_info 的行号取原文）。
+# 索引建立一次后缓存在txt旁边的隐藏文件中（.<文件名>.lineidx），按txt的大小和修改时间校验，txt变化后自动重建；
+# 读取时用mmap直接取出区间内的字节，不必每次从第一行扫描。
+# 行的划分与以文本模式 open(path, encoding="utf-8") 逐行读取一致："\n"、"\r\n"、单独的"\r"都算换行，读出后统一为"\n"。
+
+INDEX_SUFFIX = ".lineidx"
+INDEX_MAGIC = b"LINEIDX1"
+_HEADER = struct.Struct("<8sQqQ")  # 魔数、txt大小、txt修改时间(ns)、偏移数
+# 进程内缓存的索引个数
+MAX_CACHED_INDEXES = 64
+
+_NEWLINE_PATTERN = re.compile(rb"\r\n?|\n")
+_DECODE_CHUNK = 1 << 20
+
+_cache = OrderedDict()  # {绝对路径: LineIndex}
+_cache_lock = threading.Lock()
+
+
+def index_path(txt_path):
+    """txt对应的索引文件路径"""
+    folder, name = os.path.split(os.path.abspath(txt_path))
+    return os.path.join(folder, f".{name}{INDEX_SUFFIX}")
+
+
+def is_index_file(name):
+    return os.path.basename(name).startswith(".") and name.endswith(INDEX_SUFFIX)
+
+
+def _check_utf8(data):
+    # 与逐行读取时一样，文件不是合法utf-8时抛出 UnicodeDecodeError；分块解码，不生成整个文件的字符串
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for pos in range(0, len(data), _DECODE_CHUNK):
+        decoder.decode(data[pos:pos + _DECODE_CHUNK])
+    decoder.decode(b"", final=True)
+
+
+def scan_line_offsets(data):
+    """
+    扫描字节内容，返回各行起始偏移，最后一项为文件末尾：第i行（从1开始）为 data[offsets[i-1]:offsets[i]]。
+    """
+    offsets = array("Q", [0])
+    if data.find(b"\r") < 0:
+        pos = data.find(b"\n")
+        while pos >= 0:
+            offsets.append(pos + 1)
+            pos = data.find(b"\n", pos + 1)
+    else:
+        offsets.extend(m.end() for m in _NEWLINE_PATTERN.finditer(data))
+    if offsets[-1] != len(data):
+        offsets.append(len(data))
+    return offsets
+
+
+class LineIndex:
+    """单个txt的行偏移索引，len() 为行数"""
+
+    def __init__(self, path, offsets, size, mtime_ns):
+        self.path = path
+        self.offsets = offsets
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _byte_range(self, start_line, end_line):
+        # 行号从1开始，包含end_line行，越界部分忽略
+        start_idx = max(0, start_line - 1)
+        end_idx = min(len(self), end_line)
+        if end_idx <= start_idx:
+            return None
+        return self.offsets[start_idx], self.offsets[end_idx]
+
+    def read_bytes(self, start_line, end_line):
+        byte_range = self._byte_range(start_line, end_line)
+        if byte_range is None:
+            return b""
+        start, end = byte_range
+        # 每次读取单独映射，不长期占用文件句柄（Windows下占用时无法覆盖txt）
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm[start:end]
+
+    def read_text(self, start_line, end_line):
+        """返回 start_line~end_line 行的原文，保留每行末尾的换行符，与 "".join(f.readlines()[...]) 一致"""
+        data = self.read_bytes(start_line, end_line)
+        text = data.decode("utf-8")
+        if b"\r" in data:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
+
+    def read_lines(self, start_line, end_line):
+        """返回 start_line~end_line 行去掉行尾换行符后以"\n"连接的文本"""
+        text = self.read_text(start_line, end_line)
+        return text[:-1] if text.endswith("\n") else text
+
+
+def _load_index_file(path, size, mtime_ns):
+    """读取磁盘上的索引，不存在、已过期或损坏时返回 None"""
+    try:
+        with open(index_path(path), "rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                return None
+            magic, idx_size, idx_mtime, count = _HEADER.unpack(header)
+            if magic != INDEX_MAGIC or idx_size != size or idx_mtime != mtime_ns:
+                return None
+            offsets = array("Q")
+            offsets.frombytes(f.read())
+    except (OSError, ValueError):
+        return None
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    if len(offsets) != count or not offsets or offsets[0] != 0 or offsets[-1] != size:
+        return None
+    return offsets
+
+
+def _save_index_file(path, offsets, size, mtime_ns):
+    target = index_path(path)
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    data = array("Q", offsets)
+    if sys.byteorder == "big":
+        data.byteswap()
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(INDEX_MAGIC, size, mtime_ns, len(offsets)))
+            f.write(data.tobytes())
+        os.replace(tmp_path, target)
+    except OSError as e:
+        # 目录只读等情况下只在内存中使用索引
+        logging.debug(f"行索引写入失败 {target}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def build_line_index(path):
+    """扫描txt生成行偏移"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return array("Q", [0])
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            _check_utf8(mm)
+            return scan_line_offsets(mm)
+
+
+def get_line_index(path):
+    """
+    返回 path 的行索引：优先使用进程内缓存，其次读取磁盘上的索引文件，都不可用时扫描一遍txt重建并写入索引文件。
+    txt不存在时抛出 FileNotFoundError，不是合法utf-8时抛出 UnicodeDecodeError。
+    """
+    key = os.path.abspath(path)
+    st = os.stat(key)
+    with _cache_lock:
+        index = _cache.get(key)
+        if index is not None and index.size == st.st_size and index.mtime_ns == st.st_mtime_ns:
+            _cache.move_to_end(key)
+            return index
+
+    offsets = _load_index_file(key, st.st_size, st.st_mtime_ns)
+    if offsets is None:
+        offsets = build_line_index(key)
+        _save_index_file(key, offsets, st.st_size, st.st_mtime_ns)
+    index = LineIndex(key, offsets, st.st_size, st.st_mtime_ns)
+
+    with _cache_lock:
+        _cache[key] = index
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CACHED_INDEXES:
+            _cache.popitem(last=False)
+    return index
+
+
+def read_line_range(path, start_line, end_line):
+    """按行号区间读取txt原文（包含end_line行，行号从1开始），保留行尾换行符"""
+    return get_line_index(path).read_text(start_line, end_line)
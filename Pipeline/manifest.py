@@ -0,0 +1,203 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+MANIFEST_NAME = "manifest.json"
+# 断点续跑时每完成一个单元追加一行记录，清单整体写盘后清空
+JOURNAL_SUFFIX = ".journal"
+
+
+class Manifest:
+    """
+    任务清单：记录每个步骤中每个处理单元（文件、项目或模块）的输入和输出内容哈希。
+
+    再次运行时，输入哈希未变且输出文件仍然存在的单元视为缓存命中，可直接跳过；
+    清单中的 last_run 字段记录最近一次运行各步骤的命中/未命中单元。
+
+    文件结构：
+    {
+        "version": 1,
+        "steps": {步骤: {单元: {"inputs": {路径: 哈希}, "outputs": {路径: 哈希}, "extra": {...}}}},
+        "files": {路径: {"size": ..., "mtime_ns": ..., "sha256": ...}},
+        "last_run": {步骤: {"hits": [...], "misses": [...]}}
+    }
+    output_root 下的路径以相对路径保存，其余路径保存为绝对路径。
+
+    传入内存模式的 store（Pipeline.json_store.JsonStore）时，尚未写盘的json按待写入内容计算哈希，
+    与写盘后的文件哈希一致。
+
+    journal=True 时（断点续跑）每次 record 把该单元的记录追加到 manifest.json.journal，
+    不必每完成一个单元就重写整个清单；save()（各步骤完成时）写入完整清单后清空日志，
+    load() 读取清单后按顺序补上日志中的记录。
+    """
+
+    def __init__(self, output_root, filename=MANIFEST_NAME, store=None, journal=False):
+        self.root = os.path.abspath(output_root)
+        self.path = os.path.join(self.root, filename)
+        self.store = store
+        self.journal = journal
+        self.journal_path = self.path + JOURNAL_SUFFIX
+        self._journal_file = None
+        self._journal_lock = threading.Lock()
+        self.steps = {}
+        self.files = {}  # 哈希缓存，大小和修改时间不变时不重新读取文件
+        self.last_run = {}
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            self._replay_journal()
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.steps = data.get("steps", {})
+            self.files = data.get("files", {})
+        except Exception as e:
+            logging.error(f"读取任务清单失败: {self.path}，错误: {e}，将重新生成")
+            self.steps = {}
+            self.files = {}
+        self._replay_journal()
+
+    def _replay_journal(self):
+        """补上上次运行在清单写盘后追加的单元记录（中断时最后一行可能不完整，忽略）"""
+        if not os.path.isfile(self.journal_path):
+            return
+        replayed = 0
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    logging.warning(f"任务清单日志中有无法解析的记录，已忽略: {self.journal_path}")
+                    continue
+                self.steps.setdefault(item["step"], {})[item["unit"]] = item["entry"]
+                replayed += 1
+        if replayed:
+            logging.info(f"从任务清单日志补充了 {replayed} 条单元记录")
+
+    def save(self):
+        with self._lock:
+            data = {
+                "version": 1,
+                "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "steps": self.steps,
+                "files": self.files,
+                "last_run": self.last_run,
+            }
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+            # 日志中的记录都已包含在清单中
+            with self._journal_lock:
+                if self._journal_file is not None:
+                    self._journal_file.close()
+                    self._journal_file = None
+                if os.path.exists(self.journal_path):
+                    os.remove(self.journal_path)
+
+    def _key(self, path):
+        path = os.path.abspath(path)
+        if path == self.root or path.startswith(self.root + os.sep):
+            return os.path.relpath(path, self.root)
+        return path
+
+    def _abs(self, key):
+        return key if os.path.isabs(key) else os.path.join(self.root, key)
+
+    def file_hash(self, path):
+        """返回文件内容的sha256，文件不存在时返回None"""
+        if self.store is not None and self.store.is_pending(path):
+            content = self.store.dumps(path)
+            return hashlib.sha256(content).hexdigest() if content is not None else None
+
+        key = self._key(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            cached = self.files.get(key)
+            if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+                return cached["sha256"]
+
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+
+        with self._lock:
+            self.files[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+        return digest
+
+    def _exists(self, path):
+        if self.store is not None and self.store.is_pending(path):
+            return self.store.exists(path)
+        return os.path.exists(path)
+
+    def _hash_paths(self, paths):
+        return {self._key(p): self.file_hash(p) for p in paths}
+
+    def _mark(self, step, unit, hit):
+        with self._lock:
+            stats = self.last_run.setdefault(step, {"hits": [], "misses": []})
+            stats["hits" if hit else "misses"].append(unit)
+
+    def is_fresh(self, step, unit, inputs, **params):
+        """
+        判断处理单元是否可以跳过：清单中有记录、输入哈希一致且记录的输出文件都存在。
+        params 为影响输出的参数（如 renderer），与记录时 extra 中的同名值不一致时也需要重新处理。
+        结果同时计入 last_run 统计。
+        """
+        with self._lock:
+            entry = self.steps.get(step, {}).get(unit)
+        fresh = (
+            entry is not None
+            and entry["inputs"] == self._hash_paths(inputs)
+            and all(self._exists(self._abs(k)) for k in entry["outputs"])
+            and all(entry.get("extra", {}).get(k) == v for k, v in params.items())
+        )
+        self._mark(step, unit, fresh)
+        return fresh
+
+    def record(self, step, unit, inputs, outputs, **extra):
+        """处理完成后记录单元的输入、输出哈希；extra 保存步骤需要的附加信息（如项目文件夹名）"""
+        entry = {
+            "inputs": self._hash_paths(inputs),
+            "outputs": self._hash_paths(outputs),
+        }
+        if extra:
+            entry["extra"] = extra
+        with self._lock:
+            self.steps.setdefault(step, {})[unit] = entry
+        if self.journal:
+            line = json.dumps({"step": step, "unit": unit, "entry": entry}, ensure_ascii=False)
+            with self._journal_lock:
+                if self._journal_file is None:
+                    os.makedirs(self.root, exist_ok=True)
+                    self._journal_file = open(self.journal_path, 'a', encoding='utf-8')
+                self._journal_file.write(line + "\n")
+                self._journal_file.flush()
+
+    def get_extra(self, step, unit):
+        with self._lock:
+            entry = self.steps.get(step, {}).get(unit)
+        return (entry or {}).get("extra", {})
+
+    def get_outputs(self, step, unit):
+        with self._lock:
+            entry = self.steps.get(step, {}).get(unit)
+        return [self._abs(k) for k in (entry or {}).get("outputs", {})]
+
+    def summary(self, step):
+        """返回 (命中数, 未命中数)"""
+        stats = self.last_run.get(step, {"hits": [], "misses": []})
+        return len(stats["hits"]), len(stats["misses"])
@@ -0,0 +1,351 @@
+import cProfile
+import gc
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+# 输出文件的后缀定义在底层的日志工具中（clean_old_logs 按后缀清理），这里沿用
+from FilePreProcess.utils import PROFILE_SUFFIXES
+
+try:
+    import psutil
+except ImportError:  # 未安装时内存和读写字节数改从 /proc/self 读取（仅Linux），其他平台记为 None
+    psutil = None
+
+# 流程各步骤的资源统计：CPU时间、内存峰值（RSS）、读写字节数、打开的文件数和垃圾回收停顿，
+# 可对指定的一个步骤额外做函数级分析（cProfile 或采样）。结果保存在运行日志旁边：
+#   log/YYYY/MM/DD/run_HH_MM_SS.profile.json            各步骤的资源统计
+#   log/YYYY/MM/DD/run_HH_MM_SS.<步骤名>.prof / .prof.txt   cProfile 结果（pstats 格式）和按累计耗时排序的文本
+#   log/YYYY/MM/DD/run_HH_MM_SS.<步骤名>.collapsed.txt    采样结果（折叠调用栈，可用 flamegraph.pl / speedscope 查看）
+
+PROFILE_MODES = ("cprofile", "sample")
+
+# 内存采样间隔和调用栈采样间隔（秒）
+RSS_INTERVAL = 0.05
+SAMPLE_INTERVAL = 0.005
+# 文本结果中列出的函数数
+TOP_FUNCTIONS = 40
+
+# 打开文件的审计钩子只能添加不能移除，添加一次后按当前活动的统计对象分发
+_open_listeners = []
+_open_hook_installed = False
+_open_lock = threading.Lock()
+
+
+def _open_audit_hook(event, args):
+    if event != "open" or not _open_listeners:
+        return
+    path, mode, flags = args
+    if mode:
+        write = any(ch in mode for ch in "wax+")
+    else:
+        write = bool((flags or 0) & (os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_CREAT))
+    for listener in list(_open_listeners):
+        listener(path, write)
+
+
+def _add_open_listener(listener):
+    global _open_hook_installed
+    with _open_lock:
+        if not _open_hook_installed:
+            sys.addaudithook(_open_audit_hook)
+            _open_hook_installed = True
+        _open_listeners.append(listener)
+
+
+def _remove_open_listener(listener):
+    with _open_lock:
+        if listener in _open_listeners:
+            _open_listeners.remove(listener)
+
+
+def current_rss():
+    """当前进程的常驻内存（字节），无法获取时返回 None"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def io_counters():
+    """进程累计读写字节数 (读, 写)，包括缓存命中的读写；无法获取时返回 None"""
+    if psutil is not None:
+        try:
+            counters = psutil.Process().io_counters()
+        except (AttributeError, psutil.Error):
+            return None
+        return (getattr(counters, "read_chars", counters.read_bytes),
+                getattr(counters, "write_chars", counters.write_bytes))
+    try:
+        values = {}
+        with open("/proc/self/io", "r", encoding="ascii") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                values[key] = int(value)
+        return values["rchar"], values["wchar"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _format_mb(value):
+    return f"{value / 1024 / 1024:.1f} MB" if value is not None else "未知"
+
+
+def _cpu_times():
+    # 本进程所有线程的CPU时间，以及已结束的子进程（如文档切分的进程池）的CPU时间
+    times = os.times()
+    return time.process_time(), times.children_user + times.children_system
+
+
+class _StackSampler:
+    """定时读取各线程的调用栈，按折叠调用栈统计样本数"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="step-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own or names.get(ident, "").startswith("step-"):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def top_functions(self, limit=TOP_FUNCTIONS):
+        """按自身样本数和包含子调用的样本数排序的函数列表"""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        return own.most_common(limit), total.most_common(limit)
+
+
+class StepProfiler:
+    """
+    按步骤统计资源占用，begin/end 之间为一个步骤，步骤之间不重叠。
+
+    :param log_file: 本次运行的日志文件，结果保存在同一目录、以日志文件名为前缀
+    :param profile_step: 需要函数级分析的步骤名，None 表示只做资源统计
+    :param profile_mode: "cprofile"（确定性分析，只统计调用 begin 的线程）或 "sample"（定时采样所有线程的调用栈，
+                         适合大模型调用等多线程步骤，开销较小）
+    """
+
+    def __init__(self, log_file, profile_step=None, profile_mode="cprofile", sample_interval=SAMPLE_INTERVAL):
+        if profile_mode not in PROFILE_MODES:
+            raise ValueError(f"不支持的分析方式: {profile_mode}，可选 {PROFILE_MODES}")
+        self.prefix = os.path.splitext(log_file)[0]
+        self.profile_step = profile_step
+        self.profile_mode = profile_mode
+        self.sample_interval = sample_interval
+        self.steps = []
+        self._current = None
+        self._lock = threading.Lock()
+        self._rss_stop = threading.Event()
+        self._rss_thread = None
+        self._peak_rss = None
+        self._gc_start = None
+        self._installed = False
+
+    # ---- 钩子 ----
+
+    def _on_gc(self, phase, info):
+        current = self._current
+        if current is None:
+            return
+        if phase == "start":
+            self._gc_start = time.perf_counter()
+        elif self._gc_start is not None:
+            pause = time.perf_counter() - self._gc_start
+            self._gc_start = None
+            gc_stats = current["gc"]
+            gc_stats["collections"][info["generation"]] += 1
+            gc_stats["pause_total"] += pause
+            gc_stats["pause_max"] = max(gc_stats["pause_max"], pause)
+
+    def _on_open(self, path, write):
+        current = self._current
+        # 统计自身读取 /proc 的操作不计入
+        if current is None or isinstance(path, int):
+            return
+        path = os.fsdecode(path)
+        if path.startswith("/proc/"):
+            return
+        with self._lock:
+            (current["written"] if write else current["read"]).add(path)
+
+    def _sample_rss(self):
+        while not self._rss_stop.wait(RSS_INTERVAL):
+            rss = current_rss()
+            if rss is not None and (self._peak_rss is None or rss > self._peak_rss):
+                self._peak_rss = rss
+
+    def _install(self):
+        if self._installed:
+            return
+        gc.callbacks.append(self._on_gc)
+        _add_open_listener(self._on_open)
+        self._rss_thread = threading.Thread(target=self._sample_rss, name="step-rss", daemon=True)
+        self._rss_thread.start()
+        self._installed = True
+
+    def close(self):
+        """移除钩子并停止采样线程"""
+        if not self._installed:
+            return
+        self._rss_stop.set()
+        self._rss_thread.join()
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        _remove_open_listener(self._on_open)
+        self._installed = False
+
+    # ---- 步骤 ----
+
+    def begin(self, step):
+        if self._current is not None:
+            self.end()
+        self._install()
+        rss = current_rss()
+        self._peak_rss = rss
+        current = {
+            "step": step,
+            "wall": time.perf_counter(),
+            "cpu": _cpu_times(),
+            "io": io_counters(),
+            "rss_start": rss,
+            "read": set(),
+            "written": set(),
+            "gc": {"collections": [0, 0, 0], "pause_total": 0.0, "pause_max": 0.0},
+            "profiler": None,
+        }
+        if step == self.profile_step:
+            if self.profile_mode == "cprofile":
+                current["profiler"] = cProfile.Profile()
+                current["profiler"].enable()
+            else:
+                current["profiler"] = _StackSampler(self.sample_interval)
+                current["profiler"].start()
+        self._current = current
+
+    def end(self, step=None):
+        """结束当前步骤，返回该步骤的统计结果"""
+        current = self._current
+        if current is None or (step is not None and step != current["step"]):
+            return None
+        profiler = current["profiler"]
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        elif profiler is not None:
+            profiler.stop()
+        self._current = None
+
+        wall = time.perf_counter() - current["wall"]
+        cpu, children_cpu = _cpu_times()
+        io_end = io_counters()
+        rss = current_rss()
+        peak = max(v for v in (self._peak_rss, rss, current["rss_start"], 0) if v is not None)
+        gc_stats = current["gc"]
+        stats = {
+            "step": current["step"],
+            "wall": round(wall, 3),
+            "cpu": round(cpu - current["cpu"][0], 3),
+            "children_cpu": round(children_cpu - current["cpu"][1], 3),
+            "rss_start": current["rss_start"],
+            "rss_end": rss,
+            "rss_peak": peak or None,
+            "bytes_read": io_end[0] - current["io"][0] if io_end and current["io"] else None,
+            "bytes_written": io_end[1] - current["io"][1] if io_end and current["io"] else None,
+            "files_read": len(current["read"] - current["written"]),
+            "files_written": len(current["written"]),
+            "gc_collections": gc_stats["collections"],
+            "gc_pause_total": round(gc_stats["pause_total"], 4),
+            "gc_pause_max": round(gc_stats["pause_max"], 4),
+        }
+        if profiler is not None:
+            stats["profile"] = self._save_profile(current["step"], profiler)
+        self.steps.append(stats)
+
+        logging.info(
+            f"{stats['step']} 资源统计：CPU {stats['cpu']:.2f} 秒（子进程 {stats['children_cpu']:.2f} 秒），"
+            f"内存峰值 {_format_mb(stats['rss_peak'])}，"
+            f"读 {_format_mb(stats['bytes_read'])}，写 {_format_mb(stats['bytes_written'])}，"
+            f"读取文件 {stats['files_read']} 个，写入文件 {stats['files_written']} 个，"
+            f"垃圾回收 {sum(stats['gc_collections'])} 次共停顿 {stats['gc_pause_total'] * 1000:.1f} 毫秒"
+        )
+        return stats
+
+    def _save_profile(self, step, profiler):
+        base = f"{self.prefix}.{step}"
+        if isinstance(profiler, cProfile.Profile):
+            path = base + ".prof"
+            profiler.dump_stats(path)
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            with open(base + ".prof.txt", "w", encoding="utf-8") as f:
+                f.write(text.getvalue())
+        else:
+            path = base + ".collapsed.txt"
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in profiler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            own, total = profiler.top_functions()
+            with open(base + ".prof.txt", "w", encoding="utf-8") as f:
+                f.write(f"采样 {profiler.samples} 次，间隔 {profiler.interval * 1000:.1f} 毫秒（按墙钟时间采样，包括等待中的线程）\n\n")
+                f.write("按自身样本数：\n")
+                f.writelines(f"{count:>8}  {name}\n" for name, count in own)
+                f.write("\n按包含子调用的样本数：\n")
+                f.writelines(f"{count:>8}  {name}\n" for name, count in total)
+        logging.info(f"{step} 性能分析结果已保存至 {path}")
+        return path
+
+    def save(self):
+        """写出各步骤的资源统计，返回文件路径"""
+        if self._current is not None:
+            self.end()
+        path = self.prefix + ".profile.json"
+        report = {
+            "profile_step": self.profile_step,
+            "profile_mode": self.profile_mode if self.profile_step else None,
+            "psutil": psutil is not None,
+            "steps": self.steps,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logging.info(f"各步骤资源统计已保存至 {path}")
+        return path
@@ -0,0 +1,210 @@
+import logging
+import threading
+import time
+
+# 任务进度推送：任务子进程发回的进度事件只更新内存中的状态并标记为待推送，由推送线程合并后按任务推送给
+# 订阅该任务的客户端（Socket.IO 房间），每个任务最多每秒 max_rate 次，且只推送与上次相比变化的字段。
+# 步骤耗时和总耗时只在步骤切换或订阅时推送一次基准值，由浏览器本地计时，进度不变时不再推送。
+# 大模型无输出时长（llm.idle）同样由浏览器从推送时的值往上计时，流卡住、不再有事件时也能提示。
+
+DEFAULT_MAX_RATE = 2
+
+# 浮点进度按0.1%取整后比较，避免步骤内微小变化触发推送
+PERCENT_DIGITS = 1
+
+
+def job_room(job_id):
+    return f"job:{job_id}"
+
+
+class ProgressHub:
+    """
+    运行中任务的进度状态和按任务合并限速的推送。
+
+    emit(事件名, 内容, room) 负责实际推送（如 socketio.emit(event, data, to=room)）；
+    推送内容：
+      progress_update 全量（full=True，订阅时或任务开始时）：job_id、seq、percent、current_step_name、
+          step_elapsed、total_elapsed（秒，浏览器据此本地计时）、history [{"name", "time"}]、
+          llm（其中 idle 为推送时已无输出的秒数，浏览器据此本地计时）
+      progress_update 增量：job_id、seq 和变化的字段，新完成的步骤以 history_append 给出
+    任务结束时先丢弃未推送的增量，再推送 process_done / process_error，保证结束事件之后不会再有进度推送。
+    """
+
+    def __init__(self, emit, max_rate=DEFAULT_MAX_RATE):
+        self.emit = emit
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        self._states = {}  # {任务ID: 进度状态}
+        self._sent = {}  # {任务ID: 上次推送时的字段}
+        self._due = {}  # {任务ID: 最早可以推送的时间}，有待推送的变化时才在其中
+        self._cond = threading.Condition()
+        # 推送按任务有序：合并增量和推送结束事件都持有该锁，结束事件之后不会再推送旧的增量
+        self._emit_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    # ---- 状态更新（任务事件线程中调用） ----
+
+    def job_started(self, job_id, started=None):
+        now = time.time()
+        with self._cond:
+            self._states[job_id] = {
+                "seq": 0,
+                "started": started or now,
+                "percent": 0,
+                "current_step_name": "无",
+                "step_started": None,
+                "history": [],
+                "llm": None,
+                "llm_at": None,
+            }
+            data = self._snapshot(job_id, now)
+            self._sent[job_id] = self._fields(self._states[job_id])
+            self._due.pop(job_id, None)
+        # 断点续跑时同一任务会再次开始，房间内的客户端需要全量刷新
+        with self._emit_lock:
+            self._emit("progress_update", data, job_id)
+
+    def update(self, job_id, payload):
+        """payload 为任务子进程发回的进度事件内容"""
+        with self._cond:
+            state = self._states.get(job_id)
+            if state is None:
+                return
+            if payload.get("sub_event") == "llm_stream":
+                state["llm"] = payload["llm"]
+                state["llm_at"] = time.time()
+            else:
+                step_name = payload.get("current_step_name")
+                if step_name and step_name != state["current_step_name"]:
+                    state["current_step_name"] = step_name
+                    state["step_started"] = time.time() - (payload.get("current_step_elapsed") or 0)
+                if payload.get("percent") is not None:
+                    state["percent"] = round(payload["percent"], PERCENT_DIGITS)
+                history = payload.get("history")
+                if history is not None and len(history) != len(state["history"]):
+                    state["history"] = [{"name": h["name"], "time": round(h["time"], 1)} for h in history]
+            if job_id not in self._due:
+                self._due[job_id] = self._sent[job_id]["time"] + self.min_interval
+                self._cond.notify()
+
+    def finish(self, job_id, event, data):
+        """任务结束：清除进度状态并向房间推送结束事件，data 中补充总耗时"""
+        with self._emit_lock:
+            with self._cond:
+                state = self._states.pop(job_id, None)
+                self._sent.pop(job_id, None)
+                self._due.pop(job_id, None)
+            if state is not None:
+                data.setdefault("total_elapsed", round(time.time() - state["started"], 1))
+            self._emit(event, data, job_id)
+
+    def snapshot(self, job_id):
+        """运行中任务的全量进度，任务未运行时返回 None"""
+        with self._cond:
+            if job_id not in self._states:
+                return None
+            return self._snapshot(job_id, time.time())
+
+    # ---- 推送线程 ----
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="progress-hub", daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _loop(self):
+        while True:
+            with self._emit_lock:
+                with self._cond:
+                    if self._stopping:
+                        return
+                    now = time.time()
+                    ready = [job_id for job_id, due in self._due.items() if due <= now]
+                    updates = [(job_id, self._delta(job_id, now)) for job_id in ready]
+                for job_id, data in updates:
+                    if data is not None:
+                        self._emit("progress_update", data, job_id)
+            with self._cond:
+                if self._stopping:
+                    return
+                if self._due:
+                    timeout = max(0.0, min(self._due.values()) - time.time())
+                else:
+                    timeout = None
+                if timeout is None or timeout > 0:
+                    self._cond.wait(timeout)
+
+    # ---- 推送内容（持有 self._cond 时调用） ----
+
+    @staticmethod
+    def _fields(state):
+        return {
+            "percent": state["percent"],
+            "current_step_name": state["current_step_name"],
+            "history_len": len(state["history"]),
+            "llm": state["llm"],
+            "time": time.time(),
+        }
+
+    def _snapshot(self, job_id, now):
+        state = self._states[job_id]
+        return {
+            "job_id": job_id,
+            "full": True,
+            "seq": state["seq"],
+            "percent": state["percent"],
+            "current_step_name": state["current_step_name"],
+            "step_elapsed": round(now - state["step_started"], 1) if state["step_started"] else 0,
+            "total_elapsed": round(now - state["started"], 1),
+            "history": list(state["history"]),
+            "llm": self._llm(state, now),
+        }
+
+    @staticmethod
+    def _llm(state, now):
+        """推送的大模型流式状态：idle 补上收到事件到推送之间的时间"""
+        llm = state["llm"]
+        if not llm or not llm.get("active"):
+            return llm
+        return dict(llm, idle=round(llm.get("idle", 0) + now - state["llm_at"], 1))
+
+    def _delta(self, job_id, now):
+        """与上次推送相比变化的字段，没有变化时返回 None"""
+        self._due.pop(job_id, None)
+        state = self._states.get(job_id)
+        sent = self._sent.get(job_id)
+        if state is None or sent is None:
+            return None
+        data = {}
+        if state["percent"] != sent["percent"]:
+            data["percent"] = state["percent"]
+        if state["current_step_name"] != sent["current_step_name"]:
+            data["current_step_name"] = state["current_step_name"]
+            data["step_elapsed"] = round(now - state["step_started"], 1) if state["step_started"] else 0
+        if len(state["history"]) > sent["history_len"]:
+            data["history_append"] = state["history"][sent["history_len"]:]
+        elif len(state["history"]) < sent["history_len"]:
+            data["history"] = list(state["history"])
+        if state["llm"] != sent["llm"]:
+            data["llm"] = self._llm(state, now)
+        if not data:
+            return None
+        state["seq"] += 1
+        data.update(job_id=job_id, seq=state["seq"])
+        self._sent[job_id] = self._fields(state)
+        return data
+
+    def _emit(self, event, data, job_id):
+        try:
+            self.emit(event, data, job_room(job_id))
+        except Exception as e:
+            logging.warning(f"任务 {job_id} 进度推送失败: {e}")
@@ -0,0 +1,192 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 资源类别及默认并发数：cpu 为本地解析/写文件，llm 为大模型调用，pandoc 为文档转换子进程
+DEFAULT_POOL_SIZES = {
+    "cpu": 4,
+    "llm": 4,
+    "pandoc": 2,
+}
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class Task:
+    def __init__(self, name, func, deps, resource, step):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.resource = resource
+        self.step = step
+        self.state = PENDING
+        self.result = None
+        self.error = None
+        self.dependents = []
+
+
+class DagScheduler:
+    """
+    按依赖图调度任务：任务的全部依赖完成后提交到所属资源类别的线程池执行。
+
+    - 任务可在运行过程中继续添加（例如切分完成后再添加该项目的后续任务），
+      依赖必须是已添加的任务。
+    - 任务失败时，所有直接或间接依赖它的任务标记为 skipped，不影响其他分支；
+      全部任务结束后 run() 抛出 RuntimeError（原因为第一个失败任务的异常）。
+    - 每个任务属于一个步骤（step），步骤调用 seal(step) 后不再添加新任务，
+      全部任务结束即视为该步骤完成，进度按步骤完成比例推算。
+    """
+
+    def __init__(self, pool_sizes=None, on_progress=None):
+        self.pool_sizes = dict(DEFAULT_POOL_SIZES)
+        self.pool_sizes.update(pool_sizes or {})
+        self.on_progress = on_progress
+        self.tasks = {}
+        self._cond = threading.Condition()
+        self._executors = {}
+        self._unfinished = 0
+        # {step: {"total", "finished", "failed", "sealed", "start", "end"}}，failed 含失败和跳过的任务
+        self.steps = {}
+
+    def _step_stats(self, step):
+        return self.steps.setdefault(step, {"total": 0, "finished": 0, "failed": 0, "sealed": False,
+                                            "start": None, "end": None})
+
+    def add_task(self, name, func, deps=(), resource="cpu", step=None):
+        """添加任务并返回任务名；若依赖都已完成且调度器在运行，立即提交。"""
+        if resource not in self.pool_sizes:
+            raise ValueError(f"未知的资源类别: {resource}")
+        with self._cond:
+            if name in self.tasks:
+                raise ValueError(f"任务名重复: {name}")
+            for dep in deps:
+                if dep not in self.tasks:
+                    raise ValueError(f"任务 {name} 依赖的任务 {dep} 不存在")
+            task = Task(name, func, deps, resource, step)
+            self.tasks[name] = task
+            self._unfinished += 1
+            stats = self._step_stats(step)
+            stats["total"] += 1
+            for dep in task.deps:
+                self.tasks[dep].dependents.append(task)
+
+            if any(self.tasks[dep].state in (FAILED, SKIPPED) for dep in task.deps):
+                self._finish(task, SKIPPED, error="依赖任务失败")
+            elif self._executors:
+                self._submit_if_ready(task)
+        return name
+
+    def seal(self, step):
+        """声明步骤不会再添加任务"""
+        with self._cond:
+            stats = self._step_stats(step)
+            stats["sealed"] = True
+            if stats["finished"] == stats["total"] and stats["end"] is None:
+                stats["end"] = time.time()
+                if stats["start"] is None:
+                    stats["start"] = stats["end"]
+            self._cond.notify_all()
+        self._notify_progress()
+
+    def is_step_complete(self, step):
+        with self._cond:
+            stats = self.steps.get(step)
+            return bool(stats and stats["sealed"] and stats["finished"] == stats["total"])
+
+    def snapshot_steps(self):
+        """返回各步骤统计的副本，供进度回调读取"""
+        with self._cond:
+            return {step: dict(stats) for step, stats in self.steps.items()}
+
+    def _submit_if_ready(self, task):
+        if task.state != PENDING:
+            return
+        if all(self.tasks[dep].state == DONE for dep in task.deps):
+            task.state = RUNNING
+            stats = self._step_stats(task.step)
+            if stats["start"] is None:
+                stats["start"] = time.time()
+            self._executors[task.resource].submit(self._run_task, task)
+
+    def _run_task(self, task):
+        # 完成处理放在工作线程中执行，不在持有锁的提交线程里回调
+        result, error = None, None
+        try:
+            result = task.func()
+        except Exception as e:
+            error = e
+        self._on_task_done(task, result, error)
+
+    def _on_task_done(self, task, result, error):
+        with self._cond:
+            if error is None:
+                task.result = result
+                self._finish(task, DONE)
+            else:
+                logging.error(f"任务 {task.name} 执行失败: {error}", exc_info=error)
+                self._finish(task, FAILED, error=error)
+            self._cond.notify_all()
+        self._notify_progress()
+
+    def _finish(self, task, state, error=None):
+        # 调用方需持有 self._cond
+        task.state = state
+        task.error = error
+        self._unfinished -= 1
+        stats = self._step_stats(task.step)
+        stats["finished"] += 1
+        if state != DONE:
+            stats["failed"] += 1
+        if stats["sealed"] and stats["finished"] == stats["total"]:
+            stats["end"] = time.time()
+            if stats["start"] is None:
+                stats["start"] = stats["end"]
+
+        for child in task.dependents:
+            if child.state != PENDING:
+                continue
+            if state == DONE:
+                if self._executors:
+                    self._submit_if_ready(child)
+            else:
+                logging.warning(f"任务 {child.name} 因依赖 {task.name} 失败而跳过")
+                self._finish(child, SKIPPED, error="依赖任务失败")
+
+    def _notify_progress(self):
+        if self.on_progress:
+            try:
+                self.on_progress(self)
+            except Exception as e:
+                logging.error(f"进度回调出错: {e}")
+
+    def run(self):
+        """
+        执行所有任务（包括运行中新添加的任务），全部结束后返回 {任务名: 结果}。
+        有任务失败时抛出 RuntimeError，其 __cause__ 为第一个失败任务的异常。
+        """
+        self._executors = {
+            resource: ThreadPoolExecutor(max_workers=max(1, size), thread_name_prefix=f"dag-{resource}")
+            for resource, size in self.pool_sizes.items()
+        }
+        try:
+            with self._cond:
+                for task in list(self.tasks.values()):
+                    self._submit_if_ready(task)
+                while self._unfinished > 0:
+                    self._cond.wait()
+        finally:
+            for executor in self._executors.values():
+                executor.shutdown(wait=True)
+            self._executors = {}
+
+        failed = [t for t in self.tasks.values() if t.state == FAILED]
+        if failed:
+            names = [t.name for t in failed]
+            logging.error(f"共有 {len(failed)} 个任务失败: {names}")
+            raise RuntimeError(f"共有 {len(failed)} 个任务失败: {names}") from failed[0].error
+        return {name: t.result for name, t in self.tasks.items() if t.state == DONE}
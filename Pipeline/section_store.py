@@ -0,0 +1,309 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+SECTION_DB_NAME = "sections.sqlite3"
+
+
+def section_rows(data):
+    """
+    从标题/摘要json中取出各章节，按 index_create.build_source_index 的遍历顺序返回
+    [(标题, 层级, 上级标题, 起始行, 结束行, 摘要)]，层级1为json顶层章节、2为其 subsections。
+    """
+    rows = []
+    if not isinstance(data, dict):
+        return rows
+    for key, val in data.items():
+        if key == "source_txt" or not isinstance(val, dict):
+            continue
+        rows.append((key, 1, None, val.get("start_line"), val.get("end_line"), val.get("summary")))
+        subsections = val.get("subsections", {})
+        if isinstance(subsections, dict):
+            for sub_key, sub_val in subsections.items():
+                if isinstance(sub_val, dict):
+                    rows.append((sub_key, 2, key, sub_val.get("start_line"), sub_val.get("end_line"),
+                                 sub_val.get("summary")))
+    return rows
+
+
+def _column_value(value):
+    # 非标量值（一般不会出现）按json文本保存
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+class SectionStore:
+    """
+    用一个SQLite数据库代替 Title/Summary/merging_files 下的中间json文件，接口与 Pipeline.json_store.JsonStore 相同。
+
+    - documents 表按路径保存每个json的序列化文本（与写盘内容逐字节一致，任务清单按它计算哈希）；
+    - sections 表保存各章节的标题、起止行号、摘要和 source_txt，按项目、模块、标题建索引，
+      生成索引等步骤直接查询，不必逐个读取json；
+    - 数据库不存在的路径回退到磁盘上的json（例如换用数据库前已生成的文件）；
+    - debug=True 时每次保存同时写出json文件，也可以随时用 export_json_tree 导出原来的目录结构。
+    数据库使用 WAL 模式，进程内的写入由锁串行化，其他进程（如导出命令）可以同时读取。
+    output_root 下的路径以相对路径保存，数据库可以随输出目录一起移动。
+    """
+
+    def __init__(self, db_path, root=None, debug=False):
+        self.db_path = db_path
+        self.root = os.path.abspath(root or os.path.dirname(os.path.abspath(db_path)))
+        self.debug = debug
+        self._lock = threading.RLock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " path TEXT PRIMARY KEY,"
+                " folder TEXT NOT NULL,"
+                " name TEXT NOT NULL,"
+                " source_txt TEXT,"
+                " indent INTEGER,"
+                " data TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sections ("
+                " path TEXT NOT NULL,"
+                " seq INTEGER NOT NULL,"
+                " project TEXT,"
+                " module TEXT,"
+                " title TEXT NOT NULL,"
+                " level INTEGER NOT NULL,"
+                " parent TEXT,"
+                " start_line,"
+                " end_line,"
+                " summary,"
+                " PRIMARY KEY (path, seq))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_folder ON documents(folder)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sections_project ON sections(project)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sections_module ON sections(module)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sections_title ON sections(title)")
+
+    def _key(self, path):
+        path = os.path.abspath(path)
+        if path == self.root or path.startswith(self.root + os.sep):
+            return os.path.relpath(path, self.root)
+        return path
+
+    def _abs(self, key):
+        return key if os.path.isabs(key) else os.path.join(self.root, key)
+
+    def _row(self, path, columns="data"):
+        with self._lock:
+            return self._conn.execute(f"SELECT {columns} FROM documents WHERE path = ?",
+                                      (self._key(path),)).fetchone()
+
+    @staticmethod
+    def _serialize(data, indent):
+        return json.dumps(data, ensure_ascii=False, indent=indent)
+
+    def load_json(self, path, mutable=False):
+        """读取json；数据库和磁盘上都没有时抛出 FileNotFoundError。每次返回新解析的对象，可直接修改"""
+        row = self._row(path)
+        if row is not None:
+            return json.loads(row[0])
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_json(self, path, data, indent=2):
+        key = self._key(path)
+        text = self._serialize(data, indent)
+        source_txt = data.get("source_txt") if isinstance(data, dict) else None
+        if not isinstance(source_txt, str):
+            source_txt = None
+        project = module = None
+        if source_txt:
+            project = os.path.basename(os.path.dirname(source_txt))
+            module = os.path.splitext(os.path.basename(source_txt))[0]
+        sections = [
+            (key, seq, project, module, title, level, parent, _column_value(start), _column_value(end),
+             _column_value(summary))
+            for seq, (title, level, parent, start, end, summary) in enumerate(section_rows(data))
+        ]
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (path, folder, name, source_txt, indent, data)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, os.path.dirname(key), os.path.basename(key), source_txt, indent, text)
+            )
+            self._conn.execute("DELETE FROM sections WHERE path = ?", (key,))
+            self._conn.executemany("INSERT INTO sections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", sections)
+        if self.debug:
+            self._write_file(self._abs(key), text)
+
+    @staticmethod
+    def _write_file(path, text):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def exists(self, path):
+        return self._row(path, "1") is not None or os.path.isfile(path)
+
+    def remove(self, path):
+        with self._lock, self._conn:
+            key = self._key(path)
+            deleted = self._conn.execute("DELETE FROM documents WHERE path = ?", (key,)).rowcount
+            self._conn.execute("DELETE FROM sections WHERE path = ?", (key,))
+        if os.path.isfile(path):
+            os.remove(path)
+        elif not deleted:
+            raise FileNotFoundError(f"文件不存在: {path}")
+
+    def copy(self, src_path, dst_path):
+        row = self._row(src_path, "indent")
+        self.save_json(dst_path, self.load_json(src_path), indent=row[0] if row is not None else 2)
+
+    def _folder_names(self, folder):
+        with self._lock:
+            rows = self._conn.execute("SELECT name FROM documents WHERE folder = ?", (self._key(folder),)).fetchall()
+        return {name for (name,) in rows}
+
+    def list_json(self, folder):
+        """返回 folder 下的json文件名（排序后），包含数据库中和磁盘上的文件"""
+        names = self._folder_names(folder)
+        if os.path.isdir(folder):
+            names.update(f for f in os.listdir(folder) if f.endswith('.json'))
+        return sorted(names)
+
+    def walk_json(self, root):
+        """
+        递归列出 root 下所有json文件路径：磁盘上的文件按 os.walk 顺序在前，
+        只在数据库中的文件排序后附在最后。
+        """
+        paths = []
+        for dirpath, _, files in os.walk(root):
+            for file in files:
+                if file.lower().endswith('.json'):
+                    paths.append(os.path.join(dirpath, file))
+        seen = {os.path.abspath(p) for p in paths}
+        root_abs = os.path.abspath(root)
+        with self._lock:
+            keys = [k for (k,) in self._conn.execute("SELECT path FROM documents").fetchall()]
+        pending = sorted(p for p in map(self._abs, keys)
+                         if p.startswith(root_abs + os.sep) and p.lower().endswith('.json'))
+        paths.extend(p for p in pending if p not in seen)
+        return paths
+
+    def is_pending(self, path):
+        """数据库中的json都视为尚未写盘，任务清单按 dumps 的内容计算哈希"""
+        return self._row(path, "1") is not None
+
+    def dumps(self, path):
+        """返回与写盘结果一致的字节串，数据库中没有该路径时返回None"""
+        row = self._row(path)
+        if row is None:
+            return None
+        return row[0].replace('\n', os.linesep).encode('utf-8')
+
+    def flush(self):
+        """每次保存都已提交到数据库，检查点无需额外写盘"""
+        return 0
+
+    def section_index(self, folder, exclude_names=()):
+        """
+        返回 folder 下各json中章节标题到 {start_line, end_line, summary, source_txt} 的映射，
+        与逐个读取json后调用 index_create.build_source_index 的结果相同（同名标题以文件名靠后的为准）。
+        """
+        index = {}
+        folder_key = self._key(folder)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT d.name, s.title, s.start_line, s.end_line, s.summary, d.source_txt"
+                " FROM sections s JOIN documents d ON s.path = d.path"
+                " WHERE d.folder = ? ORDER BY d.name, s.seq", (folder_key,)
+            ).fetchall()
+        by_name = {}
+        for name, title, start, end, summary, source_txt in rows:
+            by_name.setdefault(name, []).append((title, start, end, summary, source_txt))
+        in_db = self._folder_names(folder)
+
+        for name in self.list_json(folder):
+            if name in exclude_names:
+                continue
+            if name in in_db:
+                items = by_name.get(name, [])
+            else:
+                data = self.load_json(os.path.join(folder, name))
+                source_txt = data.get("source_txt") if isinstance(data, dict) else None
+                items = [(title, start, end, summary, source_txt)
+                         for title, _, _, start, end, summary in section_rows(data)]
+            for title, start, end, summary, source_txt in items:
+                index[title] = {"start_line": start, "end_line": end, "summary": summary, "source_txt": source_txt}
+        return index
+
+    def find_sections(self, project=None, module=None, title=None):
+        """按项目、模块、标题查询章节，返回字典列表"""
+        conditions, params = [], []
+        for column, value in (("s.project", project), ("s.module", module), ("s.title", title)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT s.path, s.project, s.module, s.title, s.level, s.parent, s.start_line, s.end_line,"
+                " s.summary, d.source_txt FROM sections s JOIN documents d ON s.path = d.path"
+                f"{where} ORDER BY s.path, s.seq", params
+            )
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def export_json_tree(self, output_root=None):
+        """
+        把数据库中的json按原来的目录结构写出（默认写到 root 下），返回写出的文件数。
+        root 之外的绝对路径只在导出到 root 时写出。
+        """
+        target = os.path.abspath(output_root or self.root)
+        with self._lock:
+            rows = self._conn.execute("SELECT path, data FROM documents ORDER BY path").fetchall()
+        written = 0
+        for key, text in rows:
+            if os.path.isabs(key):
+                if target != self.root:
+                    logging.warning(f"跳过输出目录之外的json: {key}")
+                    continue
+                path = key
+            else:
+                path = os.path.join(target, key)
+            self._write_file(path, text)
+            written += 1
+        logging.info(f"已从 {self.db_path} 导出 {written} 个json文件到 {target}")
+        return written
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="章节数据库工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="按原来的 Title/Summary/merging_files 目录结构导出json，便于调试")
+    export.add_argument("output_root", help="流程输出目录（数据库所在目录）")
+    export.add_argument("--db", default=None, help=f"数据库路径，默认为 output_root/{SECTION_DB_NAME}")
+    export.add_argument("--out", default=None, help="导出目录，默认为 output_root")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db_path = args.db or os.path.join(args.output_root, SECTION_DB_NAME)
+    if not os.path.isfile(db_path):
+        raise SystemExit(f"数据库不存在: {db_path}")
+    store = SectionStore(db_path, root=args.output_root)
+    try:
+        count = store.export_json_tree(args.out)
+    finally:
+        store.close()
+    print(f"已导出 {count} 个json文件")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 import json
-from openai import OpenAI
-from .system_set import get_config
+from .llm_client import get_client
 
 def load_api_config(config_file="api_config.json"):
     with open(config_file, "r", encoding="utf-8") as f:
@@ -8,8 +7,7 @@ def load_api_config(config_file="api_config.json"):
     return config["api_key"], config["base_url"]
 
 def chat_with_context():
-    api_key, base_url = load_api_config()
-    client = OpenAI(api_key=api_key, base_url=base_url)
+    client = get_client().client
     messages = [{"role": "system", "content": "你是一个友好的AI助手。"}]
 
     print("和AI助手开始对话，输入 'quit' 来结束。")
@@ -33,8 +31,7 @@ def chat_with_context():
         messages.append({"role": "assistant", "content": ai_reply})
 
 def chat_without_context(user_input):
-    api_key, base_url = load_api_config()
-    client = OpenAI(api_key=api_key, base_url=base_url)
+    client = get_client().client
     messages = [
         {"role": "system", "content": "你是一个友好的AI助手。"},
         {"role": "user", "content": user_input}
@@ -51,25 +48,14 @@ def chat_without_context(user_input):
     ai_reply = response.choices[0].message.content
     return ai_reply
 
-def chat(user_input, task_type="default"):
+def chat(user_input, task_type="default", timeout=None):
     """"
     task_type: "summarization", "merging", "structuring" 或其他类型
+    timeout: 单次请求超时（秒），默认使用任务配置或 api_config.json 中的设置
+    所有调用共享同一个客户端（连接池和并发上限），见 llm_client.LLMClient
     """
-    config = get_config(task_type)
-    api_key, base_url = load_api_config()
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    
-    messages = [
-        {"role": "system", "content": config.get("system_prompt", "你是一个智能文档助手。")},
-        {"role": "user", "content": user_input}
-    ]
-    
-    response = client.chat.completions.create(
-        model=config.get("model", "deepseek-chat"),
-        messages=messages,
-        temperature=config.get("temperature", 0.7),
-        max_tokens=config.get("max_tokens", 4096),
-        stream=config.get("stream", False)
-    )
-    
-    return response.choices[0].message.content
+    return get_client().chat(user_input, task_type, timeout=timeout)
+
+async def achat(user_input, task_type="default", timeout=None):
+    """chat 的异步版本"""
+    return await get_client().achat(user_input, task_type, timeout=timeout)
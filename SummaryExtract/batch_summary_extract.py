@@ -1,10 +1,54 @@
 import os
-import json
 import logging
-from .summary_extract import process_json_and_generate_summaries
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .summary_extract import process_json_and_generate_summaries, load_json_file, DEFAULT_SECTION_WORKERS
 from tqdm import tqdm
+from Pipeline.json_store import get_store
 
-def batch_process_json_dir(base_dir: str):
+def get_source_txt(json_filepath: str, store=None):
+    """返回标题json中记录的原文txt路径，缺失时返回空字符串"""
+    return load_json_file(json_filepath, store=store).get("source_txt") or ""
+
+def summarize_json_file(input_json_path: str, output_json_path: str, unit: str, manifest=None, store=None,
+                        executor=None, timeout=None):
+    """
+    为单个标题json生成摘要并保存到output_json_path。
+
+    Args:
+        unit (str): 任务清单中的单元名，一般为 "项目文件夹/文件名"
+        manifest (Manifest): 任务清单，标题json及其原文txt均未变化时跳过
+        store (JsonStore): 中间json存储，默认直接读写磁盘
+        executor (Executor): 章节摘要共享的线程池，见 process_json_and_generate_summaries
+        timeout (float): 单个章节请求的超时（秒）
+
+    Returns:
+        bool: 是否调用了大模型重新生成
+    """
+    inputs = [input_json_path]
+    if manifest is not None:
+        inputs.append(get_source_txt(input_json_path, store=store))
+        if manifest.is_fresh("summary", unit, inputs):
+            return False
+
+    failed_sections = []
+    processed_json = process_json_and_generate_summaries(input_json_path, store=store, executor=executor,
+                                                         timeout=timeout, failed_sections=failed_sections)
+
+    if processed_json:
+        os.makedirs(os.path.dirname(output_json_path), exist_ok=True)
+        get_store(store).save_json(output_json_path, processed_json, indent=2)
+        logging.info(f"已处理并保存: {output_json_path}")
+        if failed_sections:
+            # 不写入任务清单，下次运行时重新生成
+            logging.warning(f"{unit} 有 {len(failed_sections)} 个章节摘要生成失败: {failed_sections}")
+        elif manifest is not None:
+            manifest.record("summary", unit, inputs, [output_json_path])
+    else:
+        logging.warning(f"处理结果为空，跳过保存: {input_json_path}")
+    return True
+
+def batch_process_json_dir(base_dir: str, manifest=None, store=None, max_workers=DEFAULT_SECTION_WORKERS,
+                           timeout=None):
     """
     基于以下目录结构批量处理JSON文件：
     base_dir/
@@ -23,6 +67,10 @@ def batch_process_json_dir(base_dir: str):
     Args:
         base_dir (str): 根目录路径，例如：
                         D:\python_workspace\LLM_apply\FileMerge\SummaryExtract\high_words
+        manifest (Manifest): 任务清单，标题json及其原文txt均未变化时跳过
+        store (JsonStore): 中间json存储，内存模式下直接使用上一步保存的标题数据
+        max_workers (int): 所有文件的章节共享的并发请求数
+        timeout (float): 单个章节请求的超时（秒），超时的章节摘要留空，不影响其他章节
 
     Returns:
         None
@@ -38,30 +86,32 @@ def batch_process_json_dir(base_dir: str):
 
     subfolders = [f for f in os.listdir(title_dir) if os.path.isdir(os.path.join(title_dir, f))]
 
-    # 遍历子文件夹，添加进度条
-    for subfolder_name in tqdm(subfolders, desc="处理子文件夹"):
+    # 先收集所有文件，再把全部文件的章节交给同一个线程池并发处理
+    jobs = []
+    for subfolder_name in subfolders:
         subfolder_path = os.path.join(title_dir, subfolder_name)
 
         output_subfolder_path = os.path.join(summary_dir, subfolder_name)
         os.makedirs(output_subfolder_path, exist_ok=True)
 
         # 只保留json文件
-        json_files = [f for f in os.listdir(subfolder_path) if f.endswith(".json")]
-
-        # 遍历该子文件夹中的json文件，添加进度条
-        for file_name in tqdm(json_files, desc=f"处理{subfolder_name}中的文件", leave=False):
-            input_json_path = os.path.join(subfolder_path, file_name)
-            output_json_path = os.path.join(output_subfolder_path, file_name)
+        for file_name in get_store(store).list_json(subfolder_path):
+            jobs.append((os.path.join(subfolder_path, file_name),
+                         os.path.join(output_subfolder_path, file_name),
+                         os.path.join(subfolder_name, file_name)))
 
+    # 文件线程只负责读写和等待章节结果，不占用章节线程池的并发数
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summary") as section_executor, \
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summary-file") as file_executor:
+        futures = {
+            file_executor.submit(summarize_json_file, input_json_path, output_json_path, unit,
+                                 manifest=manifest, store=store, executor=section_executor, timeout=timeout):
+                input_json_path
+            for input_json_path, output_json_path, unit in jobs
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="处理摘要文件"):
             try:
-                processed_json = process_json_and_generate_summaries(input_json_path)
-
-                if processed_json:
-                    with open(output_json_path, "w", encoding="utf-8") as f_out:
-                        json.dump(processed_json, f_out, ensure_ascii=False, indent=2)
-                    logging.info(f"已处理并保存: {output_json_path}")
-                else:
-                    logging.warning(f"处理结果为空，跳过保存: {input_json_path}")
-
+                future.result()
             except Exception as e:
-                logging.error(f"处理文件失败: {input_json_path}，异常: {e}")
+                logging.error(f"处理文件失败: {futures[future]}，异常: {e}")
+
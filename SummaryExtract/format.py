@@ -1,17 +1,16 @@
 import os
-import json
 import re
 import logging
 
 from tqdm import tqdm
+from Pipeline.json_store import get_store
 
-def load_json_file(filepath):
-    with open(filepath, "r", encoding="utf-8") as f:
-        return json.load(f)
+def load_json_file(filepath, store=None, mutable=False):
+    return get_store(store).load_json(filepath, mutable=mutable)
     
 
-def extract_and_format_content(file_path):
-    data = load_json_file(file_path)
+def extract_and_format_content(file_path, store=None):
+    data = load_json_file(file_path, store=store)
     result_lines = []
     # 遍历二级标题
     for second_level_title, second_level_content in data.items():
@@ -52,9 +51,9 @@ def clean_summary(text: str) -> str:
     text = re.sub(r'^(摘要：|摘要)', '', text).lstrip()
     return text
 
-def process_json_file(file_path):
+def process_json_file(file_path, store=None):
     try:
-        data = load_json_file(file_path)
+        data = load_json_file(file_path, store=store, mutable=True)
     except Exception as e:
         logging.error(f"读取JSON文件失败: {file_path}，错误: {e}")
         return
@@ -80,13 +79,26 @@ def process_json_file(file_path):
 
     if changed:
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            get_store(store).save_json(file_path, data, indent=2)
             logging.info(f"已处理并保存文件: {file_path}")
         except Exception as e:
             logging.error(f"保存JSON文件失败: {file_path}，错误: {e}")
 
-def recursive_process_folder(folder_path):
+def format_summary_file(file_path, unit, manifest=None, store=None):
+    """清洗单个摘要json，unit为任务清单中的单元名（相对Summary目录的路径）"""
+    # clean_summary会去掉首行，重复执行会误删内容，因此按处理后的哈希判断是否已清洗
+    if manifest is not None and manifest.is_fresh("format", unit, [file_path]):
+        return
+    process_json_file(file_path, store=store)
+    if manifest is not None:
+        manifest.record("format", unit, [file_path], [file_path])
+
+def recursive_process_folder(folder_path, manifest=None, store=None):
+    """
+    清洗 folder_path/Summary 下所有json文件中的摘要字段（原地修改）。
+    传入 manifest 时，已清洗且之后未被改动的文件不再重复处理；
+    store 为内存模式时，清洗结果保存在内存中，不再逐个文件重写。
+    """
     summary_folder = os.path.join(folder_path, 'Summary')
     json_files = []
 
@@ -94,11 +106,7 @@ def recursive_process_folder(folder_path):
         print(f"路径不存在: {summary_folder}")
         return
 
-    for root, dirs, files in os.walk(summary_folder):
-        for file in files:
-            if file.lower().endswith('.json'):
-                full_path = os.path.join(root, file)
-                json_files.append(full_path)
+    json_files.extend(get_store(store).walk_json(summary_folder))
 
     for file_path in tqdm(json_files, desc="JSON文件格式化"):
-        process_json_file(file_path)
\ No newline at end of file
+        format_summary_file(file_path, os.path.relpath(file_path, summary_folder), manifest=manifest, store=store)
\ No newline at end of file
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join("cache", "llm_cache.sqlite3")
+DEFAULT_MAX_MB = 512
+
+
+class LLMCache:
+    """
+    大模型回复的磁盘缓存（SQLite），相同请求直接返回上次的回复。
+
+    - 缓存键为 model、system_prompt、用户提示词、temperature、max_tokens 的哈希；
+    - 总大小超过 max_bytes 时按最近访问时间淘汰（LRU）；
+    - hits / misses 统计本进程内的命中情况；
+    - max_bytes 为 None 时不限大小（如断点续跑保存的本次运行回复）。
+    多个进程可以共用同一个缓存文件（SQLite WAL 模式）。
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " task_type TEXT,"
+                " response TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+
+    @staticmethod
+    def make_key(request):
+        """根据请求参数（LLMClient.build_request 的结果）生成缓存键"""
+        messages = request["messages"]
+        system_prompt = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user_prompt = "\n".join(m["content"] for m in messages if m["role"] == "user")
+        payload = json.dumps(
+            [request["model"], system_prompt, user_prompt, request["temperature"], request["max_tokens"]],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """返回缓存的回复，未命中返回None"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response, task_type=None):
+        if response is None:
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, task_type, response, size, created, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, task_type, response, size, now, now)
+            )
+            self._evict()
+
+    def _evict(self):
+        # 调用方需持有 self._lock 并处于事务中；max_bytes 为 None 时不淘汰
+        if self.max_bytes is None:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        logging.info(f"大模型缓存超过上限，淘汰 {len(evicted)} 条最久未使用的记录")
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total}
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,432 @@
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+import weakref
+
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI, OpenAI
+from .llm_cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_MB, LLMCache
+from .llm_telemetry import DEFAULT_PRICING, call_cost, emit_call
+from .summary_planner import estimate_tokens
+from .system_set import get_config
+
+DEFAULT_API_CONFIG = "api_config.json"
+# api_config.json 中可选的连接参数，未配置时使用这里的默认值
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 600
+DEFAULT_MAX_RETRIES = 2
+# 流式输出时向监听器报告进度的最小间隔（秒）
+STREAM_REPORT_INTERVAL = 0.5
+
+_stream_listeners = []
+_stream_lock = threading.Lock()
+_stream_ids = itertools.count(1)
+
+
+def add_stream_listener(listener):
+    """
+    注册流式输出监听器，所有线程中的流式请求都会调用 listener(event)，event 字段：
+    id（请求编号）、task_type、tokens（已收到的token数，按内容分片计数，为近似值）、
+    elapsed（秒）、tokens_per_sec、done（请求是否结束）、error（请求是否出错）。
+    """
+    with _stream_lock:
+        _stream_listeners.append(listener)
+
+
+def remove_stream_listener(listener):
+    with _stream_lock:
+        if listener in _stream_listeners:
+            _stream_listeners.remove(listener)
+
+
+# 本进程当前运行的回复记录（LLMCache），断点续跑时由 process_word_documents 设置
+_reply_journal = None
+
+
+def set_reply_journal(journal):
+    """
+    设置回复记录，None 为取消。设置后每个成功的回复都写入记录，相同请求优先返回记录中的回复，
+    不受任务配置的 cache 开关和回复缓存淘汰的影响，用于续跑时沿用已经完成的大模型调用。
+    """
+    global _reply_journal
+    _reply_journal = journal
+
+
+class StreamProgress:
+    """单个流式请求的进度：开始、每隔 STREAM_REPORT_INTERVAL 秒和结束时通知监听器"""
+
+    def __init__(self, task_type):
+        self.id = next(_stream_ids)
+        self.task_type = task_type
+        self.tokens = 0
+        self.start = time.time()
+        self._last_report = self.start
+        self._report(done=False)
+
+    def update(self, content):
+        if not content:
+            return
+        self.tokens += 1
+        now = time.time()
+        if now - self._last_report >= STREAM_REPORT_INTERVAL:
+            self._last_report = now
+            self._report(done=False)
+
+    def finish(self, error=False):
+        self._report(done=True, error=error)
+
+    def _report(self, done, error=False):
+        with _stream_lock:
+            listeners = list(_stream_listeners)
+        if not listeners:
+            return
+        elapsed = time.time() - self.start
+        event = {
+            "id": self.id,
+            "task_type": self.task_type,
+            "tokens": self.tokens,
+            "elapsed": elapsed,
+            "tokens_per_sec": self.tokens / elapsed if elapsed > 0 else 0.0,
+            "done": done,
+            "error": error,
+        }
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logging.warning(f"流式输出监听器异常: {e}")
+
+
+class StreamMonitor:
+    """
+    汇总所有流式请求的进度，可直接作为监听器注册（add_stream_listener(monitor)）。
+    snapshot() 返回当前在途请求数、累计token数、在途请求的总输出速度，以及距最近一次收到输出的秒数，
+    用于区分“模型输出慢”和“请求卡住没有输出”。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}
+        self._finished_tokens = 0
+        self._last_token_time = None
+
+    def __call__(self, event):
+        with self._lock:
+            previous = self._active.get(event["id"])
+            if previous is None or event["tokens"] > previous["tokens"]:
+                self._last_token_time = time.time()
+            if event["done"]:
+                self._active.pop(event["id"], None)
+                self._finished_tokens += event["tokens"]
+            else:
+                self._active[event["id"]] = event
+
+    def snapshot(self):
+        with self._lock:
+            active = list(self._active.values())
+            idle = time.time() - self._last_token_time if active and self._last_token_time else 0.0
+            return {
+                "active": len(active),
+                "tokens": self._finished_tokens + sum(e["tokens"] for e in active),
+                "tokens_per_sec": sum(e["tokens_per_sec"] for e in active),
+                "idle": idle,
+            }
+
+
+class LLMClient:
+    """
+    长期复用的大模型客户端：配置只读取一次，同步/异步各保留一个 OpenAI 客户端，
+    底层 HTTP 连接池保持长连接复用，不再每次调用都重新握手。
+
+    max_concurrency 为同时在途的请求上限：同步调用（chat）在所有线程间共享该上限，
+    异步调用（achat）在同一事件循环内共享该上限。
+
+    api_config.json 中的 cache_path（设为空字符串或null则关闭）和 cache_max_mb 配置回复缓存，
+    get_config(task_type) 返回 "cache": False 的任务类型不读写缓存。
+    set_reply_journal 设置的回复记录（断点续跑）优先于回复缓存查找，且所有任务类型都读写。
+
+    任务配置 "stream": True 时以流式方式请求，返回值仍为完整文本，
+    输出进度通过 add_stream_listener 注册的监听器报告。
+
+    每次调用结束后通过 llm_telemetry.emit_call 发送用量、耗时、重试次数和费用记录，
+    价格默认使用 llm_telemetry.DEFAULT_PRICING，可在 api_config.json 的 pricing 中按模型覆盖。
+    """
+
+    def __init__(self, config_file=DEFAULT_API_CONFIG, max_concurrency=None, timeout=None, max_retries=None,
+                 cache_path=None):
+        with open(config_file, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        self.api_key = config["api_key"]
+        self.base_url = config["base_url"]
+        self.max_concurrency = max_concurrency or config.get("max_concurrency", DEFAULT_MAX_CONCURRENCY)
+        self.timeout = timeout or config.get("timeout", DEFAULT_TIMEOUT)
+        self.max_retries = max_retries if max_retries is not None else config.get("max_retries", DEFAULT_MAX_RETRIES)
+        self.pricing = dict(DEFAULT_PRICING)
+        self.pricing.update(config.get("pricing") or {})
+
+        if cache_path is None:
+            cache_path = config.get("cache_path", DEFAULT_CACHE_PATH)
+        self.cache = None
+        if cache_path:
+            max_mb = config.get("cache_max_mb", DEFAULT_MAX_MB)
+            self.cache = LLMCache(cache_path, max_bytes=int(max_mb * 1024 * 1024))
+
+        self._lock = threading.Lock()
+        self._client = None
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        # 异步客户端的连接与事件循环绑定，按事件循环分别创建
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = OpenAI(api_key=self.api_key, base_url=self.base_url,
+                                          timeout=self.timeout, max_retries=self.max_retries)
+        return self._client
+
+    def _async_state(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._async_clients.get(loop)
+            if state is None:
+                state = (
+                    AsyncOpenAI(api_key=self.api_key, base_url=self.base_url,
+                                timeout=self.timeout, max_retries=self.max_retries),
+                    asyncio.Semaphore(self.max_concurrency),
+                )
+                self._async_clients[loop] = state
+        return state
+
+    @staticmethod
+    def build_request(user_input, task_type="default", timeout=None):
+        """按任务类型生成请求参数；timeout 为单次请求超时（秒），未指定时使用任务配置中的 timeout"""
+        config = get_config(task_type)
+        request = {
+            "model": config.get("model", "deepseek-chat"),
+            "messages": [
+                {"role": "system", "content": config.get("system_prompt", "你是一个智能文档助手。")},
+                {"role": "user", "content": user_input}
+            ],
+            "temperature": config.get("temperature", 0.7),
+            "max_tokens": config.get("max_tokens", 4096),
+            "stream": config.get("stream", False),
+        }
+        if request["stream"]:
+            # 流式响应的最后一个分片带上用量统计
+            request["stream_options"] = {"include_usage": True}
+        timeout = timeout or config.get("timeout")
+        if timeout:
+            request["timeout"] = timeout
+        return request, config.get("cache", True)
+
+    def _cache_key(self, request, use_cache):
+        if self.cache is None or not use_cache:
+            return None
+        return self.cache.make_key(request)
+
+    def _lookup(self, request, task_type, use_cache, start):
+        """依次查找回复记录和回复缓存，返回 (回复, 缓存键, 记录键)，都未命中时回复为None"""
+        journal = _reply_journal
+        journal_key = journal.make_key(request) if journal is not None else None
+        if journal_key is not None:
+            content = journal.get(journal_key)
+            if content is not None:
+                logging.info(f"沿用已完成的大模型回复（{task_type}）")
+                self._record_call(request, task_type, start, content=content, cached=True)
+                return content, None, journal_key
+        key = self._cache_key(request, use_cache)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logging.info(f"大模型缓存命中（{task_type}）")
+                self._record_call(request, task_type, start, content=cached, cached=True)
+                if journal_key is not None:
+                    journal.put(journal_key, cached, task_type)
+                return cached, key, journal_key
+        return None, key, journal_key
+
+    def _store(self, content, task_type, key, journal_key):
+        if key is not None:
+            self.cache.put(key, content, task_type)
+        journal = _reply_journal
+        if journal_key is not None and journal is not None:
+            journal.put(journal_key, content, task_type)
+
+    @staticmethod
+    def _collect_stream(chunks, progress):
+        """返回 (完整文本, 用量, 首个token到达时间)"""
+        parts = []
+        usage = None
+        first_token = None
+        for chunk in chunks:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if chunk.choices:
+                content = chunk.choices[0].delta.content or ""
+                if content and first_token is None:
+                    first_token = time.time()
+                parts.append(content)
+                progress.update(content)
+        return "".join(parts), usage, first_token
+
+    def _retries_on_error(self, error):
+        # 失败时拿不到原始响应，按 openai 客户端的重试规则推算：连接错误、超时、408/409/429/5xx 会重试到上限
+        if isinstance(error, APIConnectionError):
+            return self.max_retries
+        if isinstance(error, APIStatusError) and (error.status_code in (408, 409, 429) or error.status_code >= 500):
+            return self.max_retries
+        return 0
+
+    def _record_call(self, request, task_type, start, content=None, usage=None, first_token=None, retries=0,
+                     cached=False, error=None):
+        end = time.time()
+        estimated = usage is None and not cached
+        prompt_tokens = completion_tokens = cache_hit_tokens = 0
+        if usage is not None:
+            prompt_tokens = usage.prompt_tokens or 0
+            completion_tokens = usage.completion_tokens or 0
+            details = getattr(usage, "prompt_tokens_details", None)
+            cache_hit_tokens = (getattr(usage, "prompt_cache_hit_tokens", None)
+                                or getattr(details, "cached_tokens", None) or 0)
+        elif not cached:
+            # 接口未返回用量（如请求失败或服务不支持）时按本地估算
+            prompt_tokens = sum(estimate_tokens(m["content"]) for m in request["messages"])
+            completion_tokens = estimate_tokens(content or "")
+        emit_call({
+            "task_type": task_type,
+            "model": request["model"],
+            "stream": request["stream"],
+            "cached": cached,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "usage_estimated": estimated,
+            "latency": round(end - start, 3),
+            "ttft": round((first_token or end) - start, 3),
+            "retries": retries,
+            "cost": 0.0 if cached else call_cost(self.pricing, request["model"], prompt_tokens, completion_tokens,
+                                                 cache_hit_tokens),
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+            "start": round(start, 3),
+        })
+
+    def chat(self, user_input, task_type="default", timeout=None):
+        """同步调用，返回模型回复文本"""
+        request, use_cache = self.build_request(user_input, task_type, timeout)
+        start = time.time()
+        cached, key, journal_key = self._lookup(request, task_type, use_cache, start)
+        if cached is not None:
+            return cached
+
+        with self._slots:
+            # 流式请求在发出前就开始计时，收不到首个token的请求也能被发现
+            progress = StreamProgress(task_type) if request["stream"] else None
+            start = time.time()
+            try:
+                raw = self.client.chat.completions.with_raw_response.create(**request)
+                response = raw.parse()
+                if progress is not None:
+                    content, usage, first_token = self._collect_stream(response, progress)
+                else:
+                    content, usage, first_token = response.choices[0].message.content, response.usage, None
+            except Exception as e:
+                if progress is not None:
+                    progress.finish(error=True)
+                self._record_call(request, task_type, start, retries=self._retries_on_error(e), error=e)
+                raise
+            if progress is not None:
+                progress.finish()
+            self._record_call(request, task_type, start, content=content, usage=usage, first_token=first_token,
+                              retries=raw.retries_taken)
+
+        self._store(content, task_type, key, journal_key)
+        return content
+
+    async def achat(self, user_input, task_type="default", timeout=None):
+        """异步调用，返回模型回复文本"""
+        request, use_cache = self.build_request(user_input, task_type, timeout)
+        start = time.time()
+        cached, key, journal_key = self._lookup(request, task_type, use_cache, start)
+        if cached is not None:
+            return cached
+
+        client, slots = self._async_state()
+        async with slots:
+            progress = StreamProgress(task_type) if request["stream"] else None
+            start = time.time()
+            try:
+                raw = await client.chat.completions.with_raw_response.create(**request)
+                response = raw.parse()
+                if progress is not None:
+                    parts = []
+                    usage = None
+                    first_token = None
+                    async for chunk in response:
+                        if getattr(chunk, "usage", None) is not None:
+                            usage = chunk.usage
+                        if chunk.choices:
+                            part = chunk.choices[0].delta.content or ""
+                            if part and first_token is None:
+                                first_token = time.time()
+                            parts.append(part)
+                            progress.update(part)
+                    content = "".join(parts)
+                else:
+                    content, usage, first_token = response.choices[0].message.content, response.usage, None
+            except Exception as e:
+                if progress is not None:
+                    progress.finish(error=True)
+                self._record_call(request, task_type, start, retries=self._retries_on_error(e), error=e)
+                raise
+            if progress is not None:
+                progress.finish()
+            self._record_call(request, task_type, start, content=content, usage=usage, first_token=first_token,
+                              retries=raw.retries_taken)
+
+        self._store(content, task_type, key, journal_key)
+        return content
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+            if self.cache is not None:
+                self.cache.close()
+                self.cache = None
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def get_client():
+    """返回进程内共享的大模型客户端（首次调用时读取 api_config.json）"""
+    global _shared_client
+    if _shared_client is None:
+        with _shared_lock:
+            if _shared_client is None:
+                _shared_client = LLMClient()
+                logging.info(f"大模型客户端已创建，最大并发数: {_shared_client.max_concurrency}")
+    return _shared_client
+
+
+def cache_stats():
+    """返回共享客户端的缓存统计，客户端未创建或未启用缓存时返回None"""
+    client = _shared_client
+    if client is None or client.cache is None:
+        return None
+    return client.cache.stats()
+
+
+def configure_client(**kwargs):
+    """按指定参数（config_file、max_concurrency、timeout、max_retries、cache_path）重建共享客户端"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is not None:
+            _shared_client.close()
+        _shared_client = LLMClient(**kwargs)
+    return _shared_client
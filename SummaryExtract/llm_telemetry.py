@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import threading
+import time
+
+# 大模型调用统计：LLMClient 每完成一次调用（包括缓存命中和失败）都向已注册的监听器发送一条记录，
+# LLMTelemetry 作为监听器按步骤、任务类型和整个任务汇总，写入输出目录下的 llm_report.json。
+
+REPORT_NAME = "llm_report.json"
+
+# 每百万token的价格（元），api_config.json 中的 pricing 字段可按模型覆盖，
+# 如 {"pricing": {"deepseek-chat": {"input": 2, "input_cache_hit": 0.5, "output": 8}}}
+DEFAULT_PRICING = {
+    "deepseek-chat": {"input": 2.0, "input_cache_hit": 0.5, "output": 8.0},
+    "deepseek-reasoner": {"input": 4.0, "input_cache_hit": 1.0, "output": 16.0},
+}
+
+_call_listeners = []
+_call_lock = threading.Lock()
+
+
+def add_call_listener(listener):
+    """
+    注册调用记录监听器，每次大模型调用结束后调用 listener(record)，record 字段：
+    task_type、model、stream、cached（是否命中本地回复缓存）、prompt_tokens、completion_tokens、
+    usage_estimated（接口未返回用量时按本地估算）、latency（秒）、ttft（首个token的等待时间，非流式请求等于latency）、
+    retries（重试次数）、cost（元）、error（失败时为异常类型和信息，否则为None）、start（开始时间戳）。
+    """
+    with _call_lock:
+        _call_listeners.append(listener)
+
+
+def remove_call_listener(listener):
+    with _call_lock:
+        if listener in _call_listeners:
+            _call_listeners.remove(listener)
+
+
+def emit_call(record):
+    with _call_lock:
+        listeners = list(_call_listeners)
+    for listener in listeners:
+        try:
+            listener(record)
+        except Exception as e:
+            logging.warning(f"大模型调用统计监听器异常: {e}")
+
+
+def call_cost(pricing, model, prompt_tokens, completion_tokens, cache_hit_tokens=0):
+    """按每百万token价格计算费用（元），未配置价格的模型返回0"""
+    price = pricing.get(model)
+    if not price:
+        return 0.0
+    cache_hit_tokens = min(cache_hit_tokens or 0, prompt_tokens)
+    return (
+        (prompt_tokens - cache_hit_tokens) * price.get("input", 0)
+        + cache_hit_tokens * price.get("input_cache_hit", price.get("input", 0))
+        + completion_tokens * price.get("output", 0)
+    ) / 1_000_000
+
+
+def _percentile(values, ratio):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(ratio * len(values)))]
+
+
+def aggregate_calls(records):
+    """汇总一组调用记录"""
+    requests = [r for r in records if not r["cached"]]
+    succeeded = [r for r in requests if r["error"] is None]
+    latencies = [r["latency"] for r in succeeded]
+    ttfts = [r["ttft"] for r in succeeded]
+    return {
+        "calls": len(records),
+        "requests": len(requests),
+        "cache_hits": len(records) - len(requests),
+        "errors": len(requests) - len(succeeded),
+        "retries": sum(r["retries"] for r in requests),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in requests),
+        "completion_tokens": sum(r["completion_tokens"] for r in requests),
+        "estimated_calls": sum(1 for r in requests if r["usage_estimated"]),
+        "cost": round(sum(r["cost"] for r in requests), 6),
+        "latency_total": round(sum(r["latency"] for r in requests), 3),
+        "latency_avg": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "latency_p95": round(_percentile(latencies, 0.95), 3),
+        "ttft_avg": round(sum(ttfts) / len(ttfts), 3) if ttfts else 0.0,
+    }
+
+
+class LLMTelemetry:
+    """
+    单个任务（一次 process_word_documents 运行）的大模型调用统计，注册为监听器后开始记录。
+
+    调用所属的步骤：串行流程由 set_step 设置当前步骤；各步骤并发执行时（依赖图模式）按 step_by_task
+    把任务类型映射到步骤（摘要、重组、合并三类调用各自只出现在一个步骤中）。
+    """
+
+    def __init__(self, step_by_task=None):
+        self.step_by_task = dict(step_by_task or {})
+        self.started = time.time()
+        self.finished = None
+        self._step = None
+        self._records = []
+        self._lock = threading.Lock()
+
+    def set_step(self, step):
+        with self._lock:
+            self._step = step
+
+    def __call__(self, record):
+        with self._lock:
+            step = self._step or self.step_by_task.get(record["task_type"]) or "其他"
+            self._records.append(dict(record, step=step))
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def summary(self):
+        """按整个任务、步骤和任务类型汇总（不含逐次调用记录），用于推送给前端"""
+        records = self.records()
+        by_step, by_task = {}, {}
+        for record in records:
+            by_step.setdefault(record["step"], []).append(record)
+            by_task.setdefault(record["task_type"], []).append(record)
+        end = self.finished or time.time()
+        return {
+            "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+            "elapsed": round(end - self.started, 3),
+            "total": aggregate_calls(records),
+            "by_step": {step: aggregate_calls(items) for step, items in by_step.items()},
+            "by_task": {task: aggregate_calls(items) for task, items in by_task.items()},
+        }
+
+    def finish(self):
+        self.finished = time.time()
+
+    def save(self, output_root, filename=REPORT_NAME):
+        """写出汇总和逐次调用记录，返回报告路径"""
+        report = self.summary()
+        report["calls"] = self.records()
+        path = os.path.join(output_root, filename)
+        os.makedirs(output_root, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        total = report["total"]
+        logging.info(
+            f"大模型调用统计：请求 {total['requests']} 次（缓存命中 {total['cache_hits']} 次，失败 {total['errors']} 次，"
+            f"重试 {total['retries']} 次），输入 {total['prompt_tokens']} tokens，输出 {total['completion_tokens']} tokens，"
+            f"费用约 {total['cost']:.4f} 元，报告已保存至 {path}"
+        )
+        return path
@@ -0,0 +1,288 @@
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .summary_planner import NESTED_FLAG, PACK_MARKER_PATTERN
+from .system_set import get_config
+
+# 本地模拟的大模型服务（兼容 OpenAI chat.completions 接口），用于在不调用真实接口的情况下测试和压测流程。
+# 按 system_prompt 识别任务类型，返回 parse_llm_output、text_to_json.parse_content 等解析函数能处理的固定格式内容。
+
+TASK_TYPES = ("summarization", "merging", "structuring")
+FILLER = "本段为模拟输出内容，用于测试流程吞吐量。"
+
+
+def detect_task_type(messages):
+    """根据请求中的 system_prompt 判断任务类型，未匹配时返回 default"""
+    system_prompt = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    for task_type in TASK_TYPES:
+        if system_prompt == get_config(task_type)["system_prompt"]:
+            return task_type
+    return "default"
+
+
+def _filler(tokens):
+    # 按每个汉字约1个token估算
+    repeat = max(1, tokens // len(FILLER))
+    return FILLER * repeat
+
+
+def mock_summarization(prompt, tokens):
+    """按 build_prompt / build_simple_section_prompt 的格式生成摘要，合并请求按章节分别生成"""
+    if PACK_MARKER_PATTERN.search(prompt):
+        return mock_packed_summarization(prompt, tokens)
+    match = re.search(r"二级标题（(.+?)）整体摘要", prompt) or re.search(r"二级标题“(.+?)”", prompt)
+    section_title = match.group(1).strip() if match else "1.1 模拟章节"
+    subsection_titles = []
+    for line in prompt.splitlines():
+        m = re.match(r"\s*(\d+\.\d+\.\d+ [^\n：]+?)\s*$", line)
+        if m and m.group(1) not in subsection_titles:
+            subsection_titles.append(m.group(1))
+
+    parts = ["二级标题摘要：", section_title, _filler(tokens // (len(subsection_titles) + 1)), ""]
+    if subsection_titles:
+        parts.append("三级标题摘要：")
+        for title in subsection_titles:
+            parts.extend([f"{title}：", _filler(tokens // (len(subsection_titles) + 1)), ""])
+    return "\n".join(parts) + "\n"
+
+
+def mock_packed_summarization(prompt, tokens):
+    """按 build_packed_prompt 要求的格式，为每个“【章节N】”输出一段摘要"""
+    text = prompt.split("以下是各章节文本：", 1)[-1]
+    headers = list(PACK_MARKER_PATTERN.finditer(text))
+    per_section = tokens // max(1, len(headers))
+    parts = []
+    for pos, match in enumerate(headers):
+        body = text[match.end():headers[pos + 1].start() if pos + 1 < len(headers) else len(text)]
+        title = match.group(0).strip()[len(f"【章节{match.group(1)}】"):]
+        parts.append(f"【章节{match.group(1)}】")
+        if title.endswith(NESTED_FLAG):
+            title = title[:-len(NESTED_FLAG)]
+            parts.append(mock_summarization(f"二级标题（{title}）整体摘要\n{body}", per_section))
+        else:
+            parts.append(_filler(per_section) + "\n")
+    return "\n".join(parts)
+
+
+def mock_structuring(prompt, tokens):
+    """按 classifier 要求的大纲格式，把提示词中的二级标题两两组合成新的大纲"""
+    titles = []
+    for m in re.finditer(r"^\s*\"?##(?!#)(.+?)：'", prompt, re.M):
+        title = m.group(1).strip()
+        if title not in titles:
+            titles.append(title)
+    if not titles:
+        titles = ["1.1 模拟章节"]
+
+    lines = []
+    for idx in range(0, len(titles), 2):
+        group = titles[idx:idx + 2]
+        num = idx // 2 + 1
+        sources = "、".join(f'"{t}"' for t in group)
+        lines.append(f"## {num}. 模拟标题{num}（由{sources}组合）")
+        lines.append("")
+        for sub, title in enumerate(group, start=1):
+            lines.append(f"### {num}.{sub} {title.split(' ', 1)[-1]}")
+            lines.append(f"- {_filler(tokens // len(titles))}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def mock_merging(prompt, tokens):
+    """按合并提示词中的标题生成一段markdown"""
+    match = re.search(r"标题：'(.+?)'", prompt)
+    title = match.group(1) if match else "模拟标题"
+    return f"## {title}\n\n### 模拟小节\n\n{_filler(tokens)}\n"
+
+
+MOCK_OUTPUTS = {
+    "summarization": mock_summarization,
+    "structuring": mock_structuring,
+    "merging": mock_merging,
+}
+
+
+def mock_response(messages, tokens):
+    task_type = detect_task_type(messages)
+    prompt = "\n".join(m.get("content", "") for m in messages if m.get("role") == "user")
+    builder = MOCK_OUTPUTS.get(task_type)
+    content = builder(prompt, tokens) if builder else _filler(tokens)
+    return task_type, prompt, content
+
+
+class MockLLMServer:
+    """
+    本地模拟大模型服务。
+
+    :param latency: 每个请求返回首个token前的等待时间（秒）
+    :param token_rate: 每秒输出的token数，0表示不限速
+    :param error_rate: 请求返回500错误的概率
+    :param tokens: 每个回复的大致token数
+    stats() 返回请求数、错误数、输入/输出token数（按字符数估算）及各任务类型的请求数。
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_rate=0, error_rate=0.0, tokens=200,
+                 seed=None):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.tokens = tokens
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "by_task": {}}
+        self._thread = None
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logging.debug("模拟大模型服务: " + format % args)
+
+            def do_POST(self):
+                server._handle(self)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        logging.info(f"模拟大模型服务已启动: {self.base_url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["by_task"] = dict(self._stats["by_task"])
+            return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.update(requests=0, errors=0, prompt_tokens=0, completion_tokens=0, by_task={})
+
+    def _send_json(self, handler, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _handle(self, handler):
+        length = int(handler.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(handler.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(handler, 400, {"error": {"message": "请求体不是合法的json"}})
+            return
+        if not handler.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(handler, 404, {"error": {"message": f"不支持的接口: {handler.path}"}})
+            return
+
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+        task_type, prompt, content = mock_response(body.get("messages", []), self.tokens)
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["by_task"][task_type] = self._stats["by_task"].get(task_type, 0) + 1
+            if failed:
+                self._stats["errors"] += 1
+            else:
+                self._stats["prompt_tokens"] += len(prompt)
+                self._stats["completion_tokens"] += len(content)
+
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            self._send_json(handler, 500, {"error": {"message": "模拟服务错误", "type": "server_error"}})
+            return
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get("model", "mock")
+        usage = {"prompt_tokens": len(prompt), "completion_tokens": len(content),
+                 "total_tokens": len(prompt) + len(content)}
+        if not body.get("stream"):
+            if self.token_rate:
+                time.sleep(len(content) / self.token_rate)
+            self._send_json(handler, 200, {
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+            return
+
+        # 流式输出：每个字符作为一个token，按 token_rate 限速
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+        step = 8
+        for idx in range(0, len(content), step):
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[idx:idx + step]}, "finish_reason": None}],
+            }
+            handler.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            handler.wfile.flush()
+            if self.token_rate:
+                time.sleep(step / self.token_rate)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [], "usage": usage}
+            handler.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟大模型服务（OpenAI chat.completions 兼容）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5, help="首个token前的等待时间（秒）")
+    parser.add_argument("--token-rate", type=float, default=50, help="每秒输出token数，0为不限速")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500错误的概率")
+    parser.add_argument("--tokens", type=int, default=200, help="每个回复的大致token数")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = MockLLMServer(args.host, args.port, latency=args.latency, token_rate=args.token_rate,
+                           error_rate=args.error_rate, tokens=args.tokens, seed=args.seed)
+    print(f"模拟大模型服务: {server.base_url}（在 api_config.json 中把 base_url 设为该地址）")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
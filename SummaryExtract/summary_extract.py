@@ -3,11 +3,23 @@ import re
 from .api_call import chat
 from tqdm import tqdm
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from Pipeline.json_store import get_store
+from Pipeline.line_index import LineIndex, get_line_index
+from .system_set import get_config
+from .summary_planner import (
+    CHUNK_TOKENS, MAX_INPUT_TOKENS, PROMPT_OVERHEAD_TOKENS, build_chunk_prompt, build_packed_prompt,
+    build_reduce_prompt, chunk_text, estimate_tokens, expected_output_tokens, output_budget, parse_packed_output,
+    plan_sections,
+)
 
-def load_json_file(json_filepath: str):
+# 单个文件内同时请求摘要的章节数（未传入共享线程池时使用）
+DEFAULT_SECTION_WORKERS = 8
+
+def load_json_file(json_filepath: str, store=None, mutable=False):
+    """读取json，store 为中间json存储（默认直接读磁盘），需要修改返回结果时传 mutable=True"""
     try:
-        with open(json_filepath, "r", encoding="utf-8") as f_json:
-            json_data = json.load(f_json)
+        json_data = get_store(store).load_json(json_filepath, mutable=mutable)
         if not isinstance(json_data, dict):
             logging.warning(f"JSON文件格式异常，期望字典，实际类型为{type(json_data)}")
             return {}
@@ -20,9 +32,9 @@ def load_json_file(json_filepath: str):
         return {}
 
 def read_text_lines(filepath: str):
+    """返回文本文件的行索引（Pipeline.line_index.LineIndex），按行号取原文时不必把整个文件读入内存"""
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            lines = f.readlines()
+        lines = get_line_index(filepath)
         if not lines:
             logging.warning(f"文本文件{filepath}为空")
         return lines
@@ -36,6 +48,8 @@ def extract_text_segment(lines, start_line, end_line):
     """
     if not lines:
         return ""
+    if isinstance(lines, LineIndex):
+        return lines.read_text(start_line, end_line)
     # 防止越界
     start_idx = max(0, start_line - 1)
     end_idx = min(len(lines), end_line)
@@ -115,75 +129,297 @@ def parse_llm_output(output: str):
 
     return result
 
-def process_json_and_generate_summaries(json_filepath: str):
-    json_data = load_json_file(json_filepath)
-    if not json_data:
-        logging.warning("JSON文件为空或格式错误，无法处理")
-        return {}
+def clear_section_summaries(section_val):
+    section_val["summary"] = ""
+    subsections = section_val.get("subsections", {})
+    if isinstance(subsections, dict):
+        for sub_val in subsections.values():
+            sub_val["summary"] = ""
 
-    text_filepath = json_data.get("source_txt")
-    if not text_filepath:
-        raise ValueError("JSON中缺少source_txt字段，无法读取文本文件路径")
+def section_content(section_key, section_val, text_lines):
+    """
+    返回章节的原文（去掉首尾空白）；行号无效或文本为空时清空摘要并返回None，这类章节无需调用大模型。
+    """
+    start_line = section_val.get("start_line")
+    end_line = section_val.get("end_line")
 
-    text_lines = read_text_lines(text_filepath)
-    if not text_lines:
-        logging.warning(f"文本文件 {text_filepath} 为空或无法读取，无法生成摘要")
-        return json_data
+    if not (isinstance(start_line, int) and isinstance(end_line, int) and start_line > 0 and end_line >= start_line):
+        logging.warning(f"章节{section_key}有无效的起止行号：start_line={start_line}, end_line={end_line}")
+        clear_section_summaries(section_val)
+        return None
 
-    # 过滤掉source_txt字段，只处理章节部分
-    section_keys = [k for k in json_data.keys() if k != "source_txt"]
-    if not section_keys:
-        logging.warning("JSON中没有章节数据，无法生成摘要")
-        return json_data
+    content_text = extract_text_segment(text_lines, start_line, end_line).strip()
+    if not content_text:
+        logging.warning(f"章节{section_key}提取文本为空，跳过摘要生成")
+        clear_section_summaries(section_val)
+        return None
+    return content_text
 
-    for section_key in tqdm(section_keys, desc="处理章节摘要"):
-        section_val = json_data[section_key]
-        start_line = section_val.get("start_line")
-        end_line = section_val.get("end_line")
-
-        if not (isinstance(start_line, int) and isinstance(end_line, int) and start_line > 0 and end_line >= start_line):
-            logging.warning(f"章节{section_key}有无效的起止行号：start_line={start_line}, end_line={end_line}")
-            section_val["summary"] = ""
-            subsections = section_val.get("subsections", {})
-            if isinstance(subsections, dict):
-                for sub_val in subsections.values():
-                    sub_val["summary"] = ""
-            continue
+def apply_summary_output(section_val, llm_output):
+    """把大模型输出写入章节：无三级标题时整段作为summary，否则按格式解析出各级摘要"""
+    subsections = section_val.get("subsections", {})
+    if not subsections:
+        # 直接将输出作为summary
+        section_val["summary"] = llm_output.strip()
+        return
 
-        content_text = extract_text_segment(text_lines, start_line, end_line).strip()
-        if not content_text:
-            logging.warning(f"章节{section_key}提取文本为空，跳过摘要生成")
-            section_val["summary"] = ""
-            subsections = section_val.get("subsections", {})
-            if isinstance(subsections, dict):
-                for sub_val in subsections.values():
-                    sub_val["summary"] = ""
-            continue
+    parsed = parse_llm_output(llm_output)
+
+    section_val["summary"] = parsed.get("section_summary", "")
+
+    for sub_key, sub_val in subsections.items():
+        summary = parsed.get("subsections_summary", {}).get(sub_key, "")
+        sub_val["summary"] = summary
+
+def summarize_section(section_key, section_val, text_lines, timeout=None):
+    """
+    为单个二级标题生成摘要，结果直接写入 section_val 及其 subsections。
+    大模型调用失败或超时时只清空该章节的摘要，不影响其他章节。
 
+    Returns:
+        bool: 是否成功（无需调用大模型的章节也视为成功）
+    """
+    content_text = section_content(section_key, section_val, text_lines)
+    if content_text is None:
+        return True
+
+    try:
         subsections = section_val.get("subsections", {})
-        if not subsections or (isinstance(subsections, dict) and len(subsections) == 0):
+        if not subsections:
             # 无三级标题，使用简易prompt摘要整段文本
             prompt = build_simple_section_prompt(section_key, content_text)
             logging.info(f"章节{section_key}无三级标题，开始请求大模型生成整体摘要")
-            llm_output = chat(prompt, "summarization")
+            llm_output = chat(prompt, "summarization", timeout=timeout)
             logging.info(f"大模型输出（{section_key}无三级标题）：\n{llm_output}")
-
-            # 直接将输出作为summary
-            section_val["summary"] = llm_output.strip()
         else:
             # 有三级标题，使用原逻辑
             prompt = build_prompt(section_key, content_text)
             logging.info(f"开始请求大模型处理章节：{section_key}")
-            llm_output = chat(prompt, "summarization")
+            llm_output = chat(prompt, "summarization", timeout=timeout)
             logging.info(f"大模型输出（{section_key}）：\n{llm_output}")
+        apply_summary_output(section_val, llm_output)
+    except Exception as e:
+        logging.error(f"章节{section_key}摘要生成失败：{e}")
+        clear_section_summaries(section_val)
+        return False
+    return True
+
+def summarize_packed_sections(sections, text_lines, timeout=None):
+    """
+    多个小章节合并为一次请求生成摘要，sections 为 [(章节标题, 章节字典, 原文)]。
+    输出中缺少的章节改为单独请求；整个请求失败时这些章节的摘要都清空。
+
+    Returns:
+        list: 摘要生成失败的章节标题
+    """
+    keys = [key for key, _, _ in sections]
+    prompt = build_packed_prompt([(key, text, bool(val.get("subsections"))) for key, val, text in sections])
+    try:
+        logging.info(f"合并请求 {len(sections)} 个章节的摘要：{keys}")
+        llm_output = chat(prompt, "summarization", timeout=timeout)
+        logging.info(f"大模型输出（合并请求{keys}）：\n{llm_output}")
+    except Exception as e:
+        logging.error(f"章节{keys}合并摘要生成失败：{e}")
+        for _, val, _ in sections:
+            clear_section_summaries(val)
+        return keys
+
+    blocks = parse_packed_output(llm_output, len(sections))
+    failed = []
+    for idx, (key, val, _) in enumerate(sections, start=1):
+        block = blocks.get(idx)
+        if block is None:
+            logging.warning(f"合并请求的输出中缺少章节{key}，改为单独请求")
+            if not summarize_section(key, val, text_lines, timeout):
+                failed.append(key)
+            continue
+        # 与单独请求的输出一致，章节摘要后以空行结束，供 parse_llm_output 匹配
+        apply_summary_output(val, block + "\n\n")
+    return failed
 
+def group_by_tokens(texts, max_tokens):
+    """按顺序把文本分组，每组估算token数不超过 max_tokens（单个超限的文本单独成组）"""
+    groups, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def summarize_long_text(title, text, timeout=None, length="约150-200字"):
+    """文本分段摘要后汇总（map-reduce），汇总内容仍然过长时逐级汇总"""
+    chunks = chunk_text(text)
+    summaries = [
+        chat(build_chunk_prompt(title, chunk, idx, len(chunks)), "summarization", timeout=timeout).strip()
+        for idx, chunk in enumerate(chunks, start=1)
+    ]
+    while len(summaries) > 1:
+        groups = group_by_tokens(summaries, CHUNK_TOKENS)
+        if len(groups) == len(summaries):
+            # 分组后没有减少，直接整体汇总，避免循环不结束
+            groups = [summaries]
+        summaries = [
+            chat(build_reduce_prompt(title, group, length), "summarization", timeout=timeout).strip()
+            for group in groups
+        ]
+    return summaries[0] if summaries else ""
+
+def summarize_split_section(section_key, section_val, text_lines, timeout=None):
+    """
+    过大的章节拆分后摘要：无三级标题时整段文本分段摘要再汇总；
+    有三级标题时按三级标题分组请求（每组的输入和预计输出都不超过单次请求上限），
+    各组给出的二级标题摘要再汇总为整个章节的摘要。字段与单独请求时相同。
+
+    Returns:
+        bool: 是否成功
+    """
+    content_text = section_content(section_key, section_val, text_lines)
+    if content_text is None:
+        return True
+
+    try:
+        subsections = section_val.get("subsections", {})
+        if not subsections:
+            logging.info(f"章节{section_key}过长，拆分后分段摘要")
+            section_val["summary"] = summarize_long_text(section_key, content_text, timeout=timeout)
+            return True
+
+        budget = output_budget(get_config("summarization")["max_tokens"])
+        first_sub_line = min((v.get("start_line") for v in subsections.values()
+                              if isinstance(v.get("start_line"), int)), default=None)
+        # 第一个三级标题之前的引言并入第一组
+        intro = ""
+        if first_sub_line is not None and first_sub_line > section_val["start_line"]:
+            intro = extract_text_segment(text_lines, section_val["start_line"], first_sub_line - 1).strip()
+
+        groups, current, current_tokens = [], [], estimate_tokens(intro)
+        for sub_key, sub_val in subsections.items():
+            sub_start, sub_end = sub_val.get("start_line"), sub_val.get("end_line")
+            if isinstance(sub_start, int) and isinstance(sub_end, int):
+                sub_text = extract_text_segment(text_lines, sub_start, sub_end).strip()
+            else:
+                sub_text = sub_key
+            tokens = estimate_tokens(sub_text)
+            if current and (current_tokens + tokens + PROMPT_OVERHEAD_TOKENS > MAX_INPUT_TOKENS
+                            or expected_output_tokens(len(current) + 1) > budget):
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append((sub_key, sub_val, sub_text))
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+
+        logging.info(f"章节{section_key}过长，按三级标题拆分为{len(groups)}组请求摘要")
+        partial_summaries = []
+        for idx, group in enumerate(groups):
+            texts = [text for _, _, text in group]
+            if idx == 0 and intro:
+                texts.insert(0, intro)
+            else:
+                # 后续分组补上二级标题行，模型据此区分层级
+                texts.insert(0, section_key)
+            group_text = "\n".join(texts)
+            if len(group) == 1 and estimate_tokens(group_text) + PROMPT_OVERHEAD_TOKENS > MAX_INPUT_TOKENS:
+                # 单个三级标题也超出上限，分段摘要
+                sub_key, sub_val, _ = group[0]
+                sub_val["summary"] = summarize_long_text(sub_key, group_text, timeout=timeout, length="约100字")
+                partial_summaries.append(sub_val["summary"])
+                continue
+            llm_output = chat(build_prompt(section_key, group_text), "summarization", timeout=timeout)
+            logging.info(f"大模型输出（{section_key} 第{idx + 1}组）：\n{llm_output}")
             parsed = parse_llm_output(llm_output)
+            for sub_key, sub_val, _ in group:
+                sub_val["summary"] = parsed.get("subsections_summary", {}).get(sub_key, "")
+            partial_summaries.append(parsed.get("section_summary", ""))
 
-            section_val["summary"] = parsed.get("section_summary", "")
+        partial_summaries = [s for s in partial_summaries if s]
+        if len(partial_summaries) > 1:
+            section_val["summary"] = chat(build_reduce_prompt(section_key, partial_summaries), "summarization",
+                                          timeout=timeout).strip()
+        else:
+            section_val["summary"] = partial_summaries[0] if partial_summaries else ""
+    except Exception as e:
+        logging.error(f"章节{section_key}摘要生成失败：{e}")
+        clear_section_summaries(section_val)
+        return False
+    return True
 
-            for sub_key, sub_val in subsections.items():
-                summary = parsed.get("subsections_summary", {}).get(sub_key, "")
-                sub_val["summary"] = summary
+def run_summary_plan_entry(mode, sections, text_lines, timeout=None):
+    """执行规划中的一项，返回摘要生成失败的章节标题列表"""
+    if mode == "pack":
+        return summarize_packed_sections(sections, text_lines, timeout)
+    key, val, _ = sections[0]
+    func = summarize_split_section if mode == "split" else summarize_section
+    return [] if func(key, val, text_lines, timeout) else [key]
+
+def process_json_and_generate_summaries(json_filepath: str, store=None, executor=None, timeout=None,
+                                        failed_sections=None):
+    """
+    为标题json中的每个二级标题生成摘要，各章节并发请求大模型。
 
+    Args:
+        store (JsonStore): 中间json存储，默认直接读磁盘
+        executor (Executor): 章节摘要使用的线程池；批量处理时由调用方传入共享线程池，
+                             使所有文件的章节在同一个并发上限内执行；为None时临时创建
+        timeout (float): 单个章节请求的超时（秒），默认使用任务配置
+        failed_sections (list): 传入列表时，摘要生成失败的章节名追加到其中
+    """
+    # 摘要直接写入读到的标题数据中，需取副本，避免改动内存中的标题json
+    json_data = load_json_file(json_filepath, store=store, mutable=True)
+    if not json_data:
+        logging.warning("JSON文件为空或格式错误，无法处理")
+        return {}
+
+    text_filepath = json_data.get("source_txt")
+    if not text_filepath:
+        raise ValueError("JSON中缺少source_txt字段，无法读取文本文件路径")
+
+    text_lines = read_text_lines(text_filepath)
+    if not text_lines:
+        logging.warning(f"文本文件 {text_filepath} 为空或无法读取，无法生成摘要")
+        return json_data
+
+    # 过滤掉source_txt字段，只处理章节部分
+    section_keys = [k for k in json_data.keys() if k != "source_txt"]
+    if not section_keys:
+        logging.warning("JSON中没有章节数据，无法生成摘要")
+        return json_data
+
+    # 行号无效或文本为空的章节直接清空摘要，其余章节按估算的token数规划请求
+    contents = {}
+    for section_key in section_keys:
+        content_text = section_content(section_key, json_data[section_key], text_lines)
+        if content_text is not None:
+            contents[section_key] = content_text
+    items = []
+    for section_key, content_text in contents.items():
+        subsections = json_data[section_key].get("subsections", {})
+        items.append((section_key, estimate_tokens(content_text), len(subsections) if subsections else 0))
+    plan = plan_sections(items, get_config("summarization")["max_tokens"])
+    if len(plan) < len(items):
+        logging.info(f"{json_filepath} 共{len(items)}个章节，合并/拆分后需{len(plan)}组请求")
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=DEFAULT_SECTION_WORKERS, thread_name_prefix="summary")
+    try:
+        # 每个任务只修改自己章节的字典，结果直接写回 json_data 中对应位置
+        futures = [
+            executor.submit(run_summary_plan_entry, mode,
+                            [(key, json_data[key], contents[key]) for key in keys], text_lines, timeout)
+            for mode, keys in plan
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="处理章节摘要"):
+            failed = future.result()
+            if failed and failed_sections is not None:
+                failed_sections.extend(failed)
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
 
-    return json_data
\ No newline at end of file
+    return json_data
@@ -0,0 +1,180 @@
+import re
+from typing import Dict, List, Tuple
+
+# 摘要请求规划：按本地估算的token数，把多个小章节合并到一次请求中，过大的章节拆分后分段摘要再汇总（map-reduce），
+# 在每个章节写回的json字段不变的前提下减少请求次数，并避免超出上下文长度或 summarization 的 max_tokens。
+
+# 单次请求输入（提示词）的token上限，超过时拆分章节
+MAX_INPUT_TOKENS = 24000
+# 预计输出占 max_tokens 的比例上限，留出余量避免摘要被截断
+OUTPUT_BUDGET_RATIO = 0.8
+# 输入不超过该token数的章节视为小章节，可以与其他小章节合并请求
+SMALL_SECTION_TOKENS = 1000
+# 合并请求的输入token上限和章节数上限
+PACK_INPUT_TOKENS = 4000
+PACK_MAX_SECTIONS = 6
+# 拆分时每段文本的token上限
+CHUNK_TOKENS = 8000
+
+# 提示词中的固定说明文字及每个输出摘要（含标题和格式）的预计token数
+PROMPT_OVERHEAD_TOKENS = 300
+SECTION_SUMMARY_TOKENS = 160
+SUBSECTION_SUMMARY_TOKENS = 80
+
+PACK_MARKER = "【章节{}】"
+PACK_MARKER_PATTERN = re.compile(r"^[ \t]*【章节(\d+)】.*$", re.M)
+NESTED_FLAG = "（含三级标题）"
+
+_CJK_PATTERN = re.compile("[\u2e80-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地估算token数：按 DeepSeek 文档给出的经验值，1个中文字符约0.6个token，1个英文字符约0.3个token。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+
+def expected_output_tokens(n_subsections: int) -> int:
+    """二级标题摘要（约200字）加每个三级标题摘要（约100字）的预计输出token数"""
+    return SECTION_SUMMARY_TOKENS + SUBSECTION_SUMMARY_TOKENS * n_subsections
+
+
+def output_budget(max_tokens: int) -> int:
+    return int(max_tokens * OUTPUT_BUDGET_RATIO)
+
+
+def plan_sections(items: List[Tuple[str, int, int]], max_tokens: int) -> List[Tuple[str, List[str]]]:
+    """
+    根据各章节的输入token数和三级标题数规划请求。
+
+    :param items: [(章节标题, 章节文本token数, 三级标题数)]，按章节顺序
+    :param max_tokens: summarization 的 max_tokens
+    :return: [(方式, [章节标题])]，方式为 "single"（单独请求，提示词与原来相同）、
+             "pack"（多个小章节合并为一次请求）或 "split"（拆分后分段摘要再汇总）
+    """
+    budget = output_budget(max_tokens)
+    plan = []
+    batch, batch_input, batch_output = [], 0, 0
+
+    def close_batch():
+        nonlocal batch, batch_input, batch_output
+        if len(batch) == 1:
+            plan.append(("single", batch))
+        elif batch:
+            plan.append(("pack", batch))
+        batch, batch_input, batch_output = [], 0, 0
+
+    for key, tokens, n_subs in items:
+        output = expected_output_tokens(n_subs)
+        if tokens + PROMPT_OVERHEAD_TOKENS > MAX_INPUT_TOKENS or output > budget:
+            plan.append(("split", [key]))
+            continue
+        if tokens > SMALL_SECTION_TOKENS:
+            plan.append(("single", [key]))
+            continue
+        if batch and (len(batch) >= PACK_MAX_SECTIONS or batch_input + tokens > PACK_INPUT_TOKENS
+                      or batch_output + output > budget):
+            close_batch()
+        batch.append(key)
+        batch_input += tokens
+        batch_output += output
+    close_batch()
+    return plan
+
+
+def build_packed_prompt(sections: List[Tuple[str, str, bool]]) -> str:
+    """
+    多个小章节合并为一次请求的提示词，sections 为 [(章节标题, 章节文本, 是否有三级标题)]。
+    每个章节的输出以单独一行“【章节N】”开头，用 parse_packed_output 拆分。
+    """
+    parts = [
+        f"我将给你{len(sections)}个章节的文本，每个章节以“【章节N】二级标题”开头，"
+        "文本中二级标题用“X.Y”编号格式，三级标题用“X.Y.Z”编号格式。请分别为每个章节生成摘要：",
+        f"1. 标注“{NESTED_FLAG}”的章节，提取二级标题整体摘要（约150-200字）和每个三级标题对应的摘要（约100字）；",
+        "2. 其余章节，生成该二级标题的摘要，长度约150-200字，涵盖文本核心要点。",
+        "",
+        "请严格按章节顺序输出，每个章节的输出以单独一行“【章节N】”开头，格式如下：",
+        "",
+        "【章节1】",
+        "二级标题摘要：",
+        "<二级标题编号和标题>",
+        "<摘要内容>",
+        "",
+        "三级标题摘要：",
+        "<三级标题编号和标题>：",
+        "<摘要内容>",
+        "",
+        "【章节2】",
+        "<摘要内容>",
+        "",
+        "以下是各章节文本：",
+    ]
+    for idx, (title, text, nested) in enumerate(sections, start=1):
+        parts.append("")
+        parts.append(f"{PACK_MARKER.format(idx)}{title}{NESTED_FLAG if nested else ''}")
+        parts.append(text)
+    return "\n".join(parts)
+
+
+def parse_packed_output(output: str, count: int) -> Dict[int, str]:
+    """按“【章节N】”拆分合并请求的输出，返回 {N: 该章节的输出}，缺失或为空的章节不在结果中"""
+    blocks = {}
+    matches = list(PACK_MARKER_PATTERN.finditer(output))
+    for pos, match in enumerate(matches):
+        idx = int(match.group(1))
+        end = matches[pos + 1].start() if pos + 1 < len(matches) else len(output)
+        block = output[match.end():end].strip()
+        if 1 <= idx <= count and block and idx not in blocks:
+            blocks[idx] = block
+    return blocks
+
+
+def chunk_text(text: str, max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """按行把文本切成若干段，每段不超过 max_tokens；单行过长时按字符切开"""
+    chunks, current, current_tokens = [], [], 0
+    for line in text.splitlines():
+        line_tokens = estimate_tokens(line)
+        if line_tokens > max_tokens:
+            if current:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            # 按每个字符0.6个token（估算中的最大值）计算每段字符数
+            step = max(1, int(max_tokens / 0.6))
+            chunks.extend(line[pos:pos + step] for pos in range(0, len(line), step))
+            continue
+        if current and current_tokens + line_tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return [c for c in chunks if c.strip()]
+
+
+def build_chunk_prompt(title: str, chunk: str, index: int, total: int) -> str:
+    """拆分后单段文本的摘要提示词（map）"""
+    prompt = f"""
+    我将给你“{title}”章节的第{index}/{total}段文本，该章节过长，已拆分为多段分别摘要。
+    请概括这一段的核心要点，长度约200字，只输出摘要内容。
+
+    以下是文本内容：
+    {chunk}
+    """
+    return prompt.strip()
+
+
+def build_reduce_prompt(title: str, summaries: List[str], length: str = "约150-200字") -> str:
+    """把分段摘要汇总为整个章节摘要的提示词（reduce）"""
+    joined = "\n\n".join(f"第{idx}段摘要：\n{s}" for idx, s in enumerate(summaries, start=1))
+    prompt = f"""
+    下面是“{title}”章节按顺序拆分后各段文本的摘要。
+    请据此生成该章节的整体摘要，长度{length}，确保涵盖各段核心要点且语言连贯，只输出摘要内容。
+
+    {joined}
+    """
+    return prompt.strip()
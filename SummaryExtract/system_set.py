@@ -9,7 +9,9 @@ def get_config(task_type):
             "model": "deepseek-chat",
             "temperature": 0.3,
             "max_tokens": 1024,
-            "stream": False
+            "timeout": 180,  # 单个章节摘要的超时（秒），超时只影响该章节
+            "stream": False,
+            "cache": True
         }
     elif task_type == "merging":
         return {
@@ -22,7 +24,8 @@ def get_config(task_type):
             "model": "deepseek-chat",
             "temperature": 0.5,
             "max_tokens": 8192,
-            "stream": False
+            "stream": True,  # 合并输出较长，流式请求以便实时查看输出速度
+            "cache": True
         }
     elif task_type == "structuring":
         return {
@@ -35,14 +38,16 @@ def get_config(task_type):
             "model": "deepseek-chat",
             "temperature": 0.2,
             "max_tokens": 8192,
-            "stream": False
+            "stream": False,
+            "cache": True
         }
     else:
-        # 默认配置
+        # 默认配置（通用对话，不使用回复缓存）
         return {
             "system_prompt": "你是一个智能文档助手。",
             "model": "deepseek-chat",
             "temperature": 0.7,
             "max_tokens": 4096,
-            "stream": False
+            "stream": False,
+            "cache": False
         }
@@ -1,10 +1,14 @@
 import re
-import json
 import os
 import logging
 from tqdm import tqdm
+from FilePreProcess.batch_runner import STAGING_DIR_NAME
+from Pipeline.json_store import get_store
 
-def extract_title_index_with_lines(txt_filepath, json_filepath=None):
+# output_root 下由流程生成的目录（不是项目文件夹）
+PIPELINE_OUTPUT_DIRS = ('Title', 'Summary', 'merging_files', STAGING_DIR_NAME)
+
+def extract_title_index_with_lines(txt_filepath, json_filepath=None, store=None):
     """
     从txt文件中提取二级和三级标题及对应内容的起止行号，
     生成json文件，json文件名同txt文件名，txt后缀替换为_json.json。
@@ -15,6 +19,7 @@ def extract_title_index_with_lines(txt_filepath, json_filepath=None):
 
     Args:
         txt_filepath (str): 待解析的txt文件路径
+        store (JsonStore): 中间json存储，默认直接写磁盘
 
     Returns:
         str: 生成的json文件路径
@@ -82,20 +87,63 @@ def extract_title_index_with_lines(txt_filepath, json_filepath=None):
         json_filepath = os.path.join(os.path.dirname(txt_filepath), json_filename)
 
     # 保存json文件
-    with open(json_filepath, 'w', encoding='utf-8') as jf:
-        json.dump(result, jf, indent=2, ensure_ascii=False)
+    get_store(store).save_json(json_filepath, result, indent=2)
 
     logging.info(f"已生成标题索引json文件：{json_filepath}")
     return json_filepath
 
-def batch_process_txt_files(root_dir):
+def process_txt_file(root_dir, txt_path, manifest=None, store=None):
+    """
+    为root_dir下的单个txt文件生成标题索引json，
+    json放在 root_dir/Title/一级子目录/ 下。
+
+    Returns:
+        str: json文件路径
     """
-    批量处理root_dir下所有txt文件，
-    json放在 root_dir/output/一级子目录/ 目录下，
+    root_dir = os.path.abspath(root_dir)
+    output_dir = os.path.join(root_dir, 'Title')
+    dirpath, filename = os.path.split(os.path.abspath(txt_path))
+
+    # 计算相对于root_dir的相对路径
+    rel_path = os.path.relpath(dirpath, root_dir)
+    # 获取一级子目录名
+    first_level_folder = rel_path.split(os.sep)[0] if rel_path != '.' else ''
+
+    if first_level_folder == '':
+        # 如果txt文件直接放在root_dir目录下，直接放output下根目录
+        target_dir = output_dir
+    else:
+        # json统一放到 output/一级子目录/
+        target_dir = os.path.join(output_dir, first_level_folder)
+
+    os.makedirs(target_dir, exist_ok=True)
+
+    base_name = os.path.splitext(filename)[0]
+    json_filename = base_name + '.json'
+    json_path = os.path.join(target_dir, json_filename)
+
+    unit = os.path.relpath(txt_path, root_dir)
+    if manifest is not None and manifest.is_fresh("title", unit, [txt_path]):
+        return json_path
+
+    # 调用处理函数，传入json输出路径
+    extract_title_index_with_lines(txt_path, json_path, store=store)
+    if manifest is not None:
+        manifest.record("title", unit, [txt_path], [json_path])
+    return json_path
+
+def batch_process_txt_files(root_dir, manifest=None, store=None, project_folders=None):
+    """
+    批量处理root_dir下的项目txt文件，
+    json放在 root_dir/Title/一级子目录/ 目录下，
     不重建更深层目录结构。
 
     Args:
         root_dir (str): 根目录路径
+        manifest (Manifest): 任务清单，txt内容未变化时跳过
+        store (JsonStore): 中间json存储，内存模式下标题json暂不写盘
+        project_folders (list): 切分得到的项目文件夹名，只处理其中的模块txt（与依赖图模式一致）；
+            为None时遍历root_dir，跳过流程自身的输出目录（PIPELINE_OUTPUT_DIRS）
 
     Returns:
         None
@@ -109,38 +157,24 @@ def batch_process_txt_files(root_dir):
 
     # 先收集所有txt文件路径及其所在目录
     txt_files = []
-    for dirpath, _, filenames in os.walk(root_dir):
-        # 跳过output目录，避免递归处理
-        if os.path.abspath(dirpath).startswith(os.path.abspath(output_dir)):
-            continue
-
-        for filename in filenames:
-            if filename.lower().endswith('.txt'):
-                txt_files.append( (dirpath, filename) )
+    if project_folders is not None:
+        for folder in project_folders:
+            project_dir = os.path.join(root_dir, folder)
+            if not os.path.isdir(project_dir):
+                continue
+            txt_files.extend((project_dir, f) for f in sorted(os.listdir(project_dir)) if f.endswith('.txt'))
+    else:
+        for dirpath, dirnames, filenames in os.walk(root_dir):
+            # 跳过流程的输出目录，避免把上次运行的中间结果当作项目模块
+            if os.path.abspath(dirpath) == root_dir:
+                dirnames[:] = [d for d in dirnames if d not in PIPELINE_OUTPUT_DIRS]
+
+            for filename in filenames:
+                if filename.lower().endswith('.txt'):
+                    txt_files.append( (dirpath, filename) )
 
     # 使用tqdm显示进度条
     for dirpath, filename in tqdm(txt_files, desc="多级标题提取", unit="文件"):
-        txt_path = os.path.join(dirpath, filename)
-
-        # 计算相对于root_dir的相对路径
-        rel_path = os.path.relpath(dirpath, root_dir)
-        # 获取一级子目录名
-        first_level_folder = rel_path.split(os.sep)[0] if rel_path != '.' else ''
-
-        if first_level_folder == '':
-            # 如果txt文件直接放在root_dir目录下，直接放output下根目录
-            target_dir = output_dir
-        else:
-            # json统一放到 output/一级子目录/
-            target_dir = os.path.join(output_dir, first_level_folder)
-
-        os.makedirs(target_dir, exist_ok=True)
-
-        base_name = os.path.splitext(filename)[0]
-        json_filename = base_name + '.json'
-        json_path = os.path.join(target_dir, json_filename)
-
-        # 调用处理函数，传入json输出路径
-        extract_title_index_with_lines(txt_path, json_path)
+        process_txt_file(root_dir, os.path.join(dirpath, filename), manifest=manifest, store=store)
 
     logging.info("批量处理完成。")
\ No newline at end of file
@@ -2,17 +2,73 @@ import os
 import re
 from docx import Document
 
+def join_non_empty_lines(text):
+    """去掉文字中的空白行"""
+    return '\n'.join(line for line in text.splitlines() if line.strip())
+
+
 def remove_inner_empty_lines(doc):
     """
     去除段落内部的空行（换行符导致的空白行）
     """
     for para in doc.paragraphs:
-        lines = para.text.splitlines()
-        non_empty_lines = [line for line in lines if line.strip()]
-        para.text = '\n'.join(non_empty_lines)
+        para.text = join_non_empty_lines(para.text)
+
+
+def correct_paragraph_text(text, style_name):
+    """
+    单个段落的修正，返回修正后的文字：去除段落内部空行；非标题段落中“- ”开头的无序列表转为编号，
+    多行且每行含“：”的段落统一缩进和行尾标点。
+    合并时逐段调用（process_and_merge_all_files 的 transform），也用于 correct_and_convert_numbered_paragraphs。
+    """
+    text = join_non_empty_lines(text)
+
+    if '标题' in style_name or 'Heading' in style_name:
+        return text
+
+    stripped = text.strip()
+    if not stripped:
+        return text
+
+    # 处理“- ”开头的无序列表转编号
+    if stripped.count('- ') > 0:
+        first_dash_pos = stripped.find('- ')
+        lead_text = stripped[:first_dash_pos].strip()
+        list_text = stripped[first_dash_pos:]
+
+        parts = [p.strip() for p in list_text.split('- ') if p.strip()]
+        new_items = []
+        for i, part in enumerate(parts, start=1):
+            part_clean = re.sub(r'[：:；;。.]$', '', part)
+            if i == len(parts):
+                part_clean += '。'
+            else:
+                part_clean += '；'
+            new_items.append(f"  {i}) {part_clean}")
+
+        if lead_text:
+            return f"{lead_text}\n" + '\n'.join(new_items)
+        return '\n'.join(new_items)
+
+    # 处理无编号但多行且每行含“：”的段落
+    if ('\n' in text or (text.count('：') > 0 and text.count('\n') > 0)):
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        if len(lines) > 1 and all('：' in line for line in lines):
+            new_lines = []
+            for i, line in enumerate(lines):
+                line_clean = re.sub(r'[：:；;。.]$', '', line)
+                if i == len(lines) - 1:
+                    line_clean += '。'
+                else:
+                    line_clean += '；'
+                new_lines.append(f"  {line_clean}")
+            return '\n'.join(new_lines)
+
+    return text
 
 
 def correct_and_convert_numbered_paragraphs(root_folder_path):
+    """读取 word_files/merged.docx，逐段修正（correct_paragraph_text）后另存为 formated.docx"""
     # 构建目标文件路径 merged.docx
     docx_path = os.path.join(root_folder_path, 'merging_files', 'word_files', 'merged.docx')
     if not os.path.isfile(docx_path):
@@ -21,55 +77,8 @@ def correct_and_convert_numbered_paragraphs(root_folder_path):
 
     doc = Document(docx_path)
 
-    # 删除段落内部空行
-    remove_inner_empty_lines(doc)
-
     for para in doc.paragraphs:
-        style_name = para.style.name
-
-        if '标题' in style_name or 'Heading' in style_name:
-            continue
-
-        text = para.text.strip()
-        if not text:
-            continue
-
-        # 处理“- ”开头的无序列表转编号
-        if text.count('- ') > 0:
-            first_dash_pos = text.find('- ')
-            lead_text = text[:first_dash_pos].strip()
-            list_text = text[first_dash_pos:]
-
-            parts = [p.strip() for p in list_text.split('- ') if p.strip()]
-            new_items = []
-            for i, part in enumerate(parts, start=1):
-                part_clean = re.sub(r'[：:；;。.]$', '', part)
-                if i == len(parts):
-                    part_clean += '。'
-                else:
-                    part_clean += '；'
-                new_items.append(f"  {i}) {part_clean}")
-
-            if lead_text:
-                para.text = f"{lead_text}\n" + '\n'.join(new_items)
-            else:
-                para.text = '\n'.join(new_items)
-            continue
-
-        # 处理无编号但多行且每行含“：”的段落
-        if ('\n' in para.text or (para.text.count('：') > 0 and para.text.count('\n') > 0)):
-            lines = [line.strip() for line in para.text.splitlines() if line.strip()]
-            if len(lines) > 1 and all('：' in line for line in lines):
-                new_lines = []
-                for i, line in enumerate(lines):
-                    line_clean = re.sub(r'[：:；;。.]$', '', line)
-                    if i == len(lines) - 1:
-                        line_clean += '。'
-                    else:
-                        line_clean += '；'
-                    new_lines.append(f"  {line_clean}")
-                para.text = '\n'.join(new_lines)
-                continue
+        para.text = correct_paragraph_text(para.text, para.style.name)
 
     # 输出路径同样放在 word_files 目录下，命名为 formated.docx
     output_path = os.path.join(root_folder_path, 'merging_files', 'word_files', 'formated.docx')
@@ -0,0 +1,296 @@
+import re
+
+# Description: 合并提示词生成的Markdown子集（ATX标题、段落、无序/有序列表、强调）直接解析为段落列表，
+# 由 TxtoWord.txt_to_word 写入合并文档，不再经过 pandoc 子进程和单个模块docx的写出/读回。
+# 解析规则按 pandoc markdown 的默认行为，使合并文档中的段落、文字和样式名与 pandoc 路径一致：
+# - 标题前必须有空行，紧跟在段落后的“#”行并入该段落；段落内的换行转为空格；
+# - 列表前必须有空行，紧跟在段落后的“- ”、“1. ”行并入该段落（format_check 再把其中的“- ”转为编号）；
+# - 列表项的符号由 pandoc 写成Word自动编号，合并时不会复制，因此这里直接去掉；
+# - 段落样式：文档开头、标题或列表后的第一段为 First Paragraph，其余段落为 Body Text，
+#   紧凑列表项为 Compact，各项之间有空行的列表为 Normal；
+# - 直引号按 pandoc smart 扩展转换：前面不是字母或汉字且后面不是空白时为左引号，其余为右引号。
+# 遇到子集之外的写法（表格、引用、代码块、链接、分隔线等）抛出 UnsupportedMarkdown，调用方改用 pandoc 转换。
+
+RENDERER_NATIVE = "native"
+RENDERER_PANDOC = "pandoc"
+DEFAULT_RENDERER = RENDERER_NATIVE
+
+STYLE_FIRST_PARAGRAPH = "First Paragraph"
+STYLE_BODY_TEXT = "Body Text"
+STYLE_COMPACT = "Compact"
+STYLE_NORMAL = "Normal"
+
+_HEADING_PATTERN = re.compile(r"^ {0,3}(#{1,6})(?:[ \t]+(.*?))?[ \t]*$")
+_HEADING_CLOSING_PATTERN = re.compile(r"(?:^|[ \t]+)#+$")
+_LIST_ITEM_PATTERN = re.compile(r"^ {0,3}(?P<marker>[-*+]|\d+[.)]|\(\d+\))[ \t]+(?P<text>.*)$")
+_INDENTED_PATTERN = re.compile(r"^(?: {4}|\t)")
+_HARD_BREAK_PATTERN = re.compile(r"(?: {2,}|\\)$")
+_TRAILING_BREAK_PATTERN = re.compile(r" {2,}$")
+
+# 子集之外的写法
+_UNSUPPORTED_LINE_PATTERNS = [
+    ("表格", re.compile(r"^\s*\|.*\|\s*$|^\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)+$")),
+    ("引用", re.compile(r"^ {0,3}>")),
+    ("代码块", re.compile(r"^ {0,3}(```|~~~)")),
+    ("分隔线或二级Setext标题", re.compile(r"^ {0,3}([-*_])([ \t]*\1){2,}[ \t]*$")),
+    ("一级Setext标题", re.compile(r"^ {0,3}=+[ \t]*$")),
+]
+_UNSUPPORTED_INLINE_PATTERNS = [
+    ("链接或图片", re.compile(r"\]\(|\]\[|^\s*\[[^\]]+\]:")),
+    ("HTML标签或自动链接", re.compile(r"<[A-Za-z/!]")),
+    ("脚注", re.compile(r"\[\^")),
+    ("公式", re.compile(r"\$[^\s$][^$]*\$")),
+]
+
+# 行内语法：转义、行内代码、强调（*、_，_ 不能在单词内部）
+_ESCAPABLE = set("\\`*_{}[]()>#+-.!|~^$\"'<=&:;,/?@%")
+_EMPHASIS_PATTERN = re.compile(
+    r"(?P<strong_em>\*\*\*(?=\S)(?P<se>.+?)(?<=\S)\*\*\*)"
+    r"|(?P<strong>\*\*(?=\S)(?P<s>.+?)(?<=\S)\*\*)"
+    r"|(?P<under_strong>(?<![0-9A-Za-z])__(?=\S)(?P<us>.+?)(?<=\S)__(?![0-9A-Za-z]))"
+    r"|(?P<em>\*(?=[^\s*])(?P<e>.+?)(?<=[^\s*])\*)"
+    r"|(?P<under_em>(?<![0-9A-Za-z])_(?=[^\s_])(?P<ue>.+?)(?<=[^\s_])_(?![0-9A-Za-z]))"
+)
+_CODE_PATTERN = re.compile(r"(?<!\\)(`+)(.+?)(?<!`)\1(?!`)")
+# 转义字符在解析期间替换为私用区字符，不参与强调和引号匹配
+_ESCAPE_BASE = 0xE000
+
+
+class UnsupportedMarkdown(ValueError):
+    """Markdown中包含原生渲染不支持的写法"""
+
+
+def _list_type(marker):
+    """列表符号的类型，类型不同的相邻列表项属于不同的列表：无序列表按符号，有序列表按数字后的标点"""
+    if marker[0].isdigit():
+        return marker[-1]
+    return "()" if marker.startswith("(") else marker
+
+
+def check_supported(lines):
+    """逐行检查是否只包含支持的写法，不支持时抛出 UnsupportedMarkdown（含行号和写法）"""
+    for lineno, line in enumerate(lines, start=1):
+        for name, pattern in _UNSUPPORTED_LINE_PATTERNS:
+            if pattern.search(line):
+                raise UnsupportedMarkdown(f"第{lineno}行包含{name}: {line.strip()[:40]}")
+        for name, pattern in _UNSUPPORTED_INLINE_PATTERNS:
+            if pattern.search(line):
+                raise UnsupportedMarkdown(f"第{lineno}行包含{name}: {line.strip()[:40]}")
+
+
+def _smart_punctuation(text):
+    """pandoc smart 扩展的常见情况：省略号、破折号和直引号"""
+    text = text.replace("...", "…").replace("---", "—").replace("--", "–")
+    chars = list(text)
+    in_double = False
+    for i, ch in enumerate(chars):
+        prev = chars[i - 1] if i > 0 else " "
+        nxt = chars[i + 1] if i + 1 < len(chars) else " "
+        if ch == '"':
+            if not in_double and not prev.isalnum() and not nxt.isspace():
+                chars[i] = "“"
+                in_double = True
+            else:
+                chars[i] = "”"
+                in_double = False
+        elif ch == "'":
+            if not prev.isalnum() and not nxt.isspace():
+                chars[i] = "‘"
+            else:
+                chars[i] = "’"
+    return "".join(chars)
+
+
+def _escape(text):
+    chars = []
+    i = 0
+    while i < len(text):
+        if text[i] == "\\" and i + 1 < len(text) and text[i + 1] in _ESCAPABLE:
+            chars.append(chr(_ESCAPE_BASE + ord(text[i + 1])))
+            i += 2
+        else:
+            chars.append(text[i])
+            i += 1
+    return "".join(chars)
+
+
+def _unescape(text):
+    return "".join(chr(ord(ch) - _ESCAPE_BASE) if _ESCAPE_BASE <= ord(ch) < _ESCAPE_BASE + 128 else ch
+                   for ch in text)
+
+
+def _parse_emphasis(text, bold, italic, runs):
+    pos = 0
+    for match in _EMPHASIS_PATTERN.finditer(text):
+        if match.start() > pos:
+            runs.append((text[pos:match.start()], bold, italic))
+        if match.group("strong_em"):
+            _parse_emphasis(match.group("se"), True, True, runs)
+        elif match.group("strong") or match.group("under_strong"):
+            _parse_emphasis(match.group("s") or match.group("us"), True, italic, runs)
+        else:
+            _parse_emphasis(match.group("e") or match.group("ue"), bold, True, runs)
+        pos = match.end()
+    if pos < len(text):
+        runs.append((text[pos:], bold, italic))
+
+
+def _parse_text(text, runs, strict):
+    start = len(runs)
+    _parse_emphasis(_smart_punctuation(_escape(text)), False, False, runs)
+    if strict and any("*" in content for content, _, _ in runs[start:]):
+        raise UnsupportedMarkdown(f"包含不成对的强调符号: {text.strip()[:40]}")
+
+
+def parse_inline(text, strict=True):
+    """
+    行内文本 -> [(文字, 是否加粗, 是否斜体)]。
+    行内代码只保留文字（pandoc的代码样式合并时不会复制），其余文字处理转义、引号和强调。
+    strict=True 时，强调之外还剩下未转义的“*”（pandoc对不成对星号的处理规则复杂）抛出 UnsupportedMarkdown。
+    """
+    runs = []
+    pos = 0
+    for match in _CODE_PATTERN.finditer(text):
+        if match.start() > pos:
+            _parse_text(text[pos:match.start()], runs, strict)
+        runs.append((match.group(2).strip(), False, False))
+        pos = match.end()
+    if pos < len(text):
+        _parse_text(text[pos:], runs, strict)
+
+    merged = []
+    for content, bold, italic in runs:
+        content = _unescape(content)
+        if not content:
+            continue
+        if merged and merged[-1][1] == bold and merged[-1][2] == italic:
+            merged[-1] = (merged[-1][0] + content, bold, italic)
+        else:
+            merged.append((content, bold, italic))
+    return merged
+
+
+def _join_lines(lines):
+    """段落内的多行：普通换行转为空格，行尾两个以上空格或反斜杠为硬换行"""
+    parts = []
+    for idx, line in enumerate(lines):
+        stripped = line.strip()
+        if idx < len(lines) - 1 and _HARD_BREAK_PATTERN.search(line.rstrip("\n")):
+            parts.append(stripped.rstrip("\\").rstrip() + "\n")
+        else:
+            parts.append(stripped + (" " if idx < len(lines) - 1 else ""))
+    return "".join(parts)
+
+
+def _block(style, text, strict=True):
+    return {"style": style, "runs": parse_inline(text, strict)}
+
+
+def parse_markdown(lines, strict=True):
+    """
+    Markdown文本行 -> 段落列表 [{"style": 段落样式名, "runs": [(文字, 加粗, 斜体)]}]，
+    标题的样式为 "Heading N"。结果只含基本类型，可以在进程间传递。
+
+    :param lines: 文本行（可以带换行符）
+    :param strict: 为True时遇到不支持的写法抛出 UnsupportedMarkdown，否则按普通段落处理
+    """
+    lines = [line.rstrip("\n").rstrip("\r") for line in lines]
+    if strict:
+        check_supported(lines)
+
+    blocks = []
+    paragraph = []          # 当前段落的行
+    items = []              # 当前列表各项的行 [[行]]
+    list_loose = False
+    list_type = None
+    blank_before = True     # 上一行是否为空行（或文档开头）
+    first_paragraph = True  # 下一个段落是否为文档开头、标题或列表后的第一段
+
+    def flush_paragraph():
+        nonlocal paragraph, first_paragraph
+        if paragraph:
+            style = STYLE_FIRST_PARAGRAPH if first_paragraph else STYLE_BODY_TEXT
+            blocks.append(_block(style, _join_lines(paragraph), strict))
+            first_paragraph = False
+        paragraph = []
+
+    def flush_list():
+        nonlocal items, list_loose, first_paragraph
+        style = STYLE_NORMAL if list_loose else STYLE_COMPACT
+        for item in items:
+            blocks.append(_block(style, _join_lines(item), strict))
+        if items:
+            first_paragraph = True
+        items, list_loose = [], False
+
+    for line in lines:
+        if not line.strip():
+            flush_paragraph()
+            blank_before = True
+            continue
+
+        heading = _HEADING_PATTERN.match(line)
+        item = _LIST_ITEM_PATTERN.match(line)
+
+        if items:
+            if item and _list_type(item.group("marker")) != list_type:
+                # 符号类型不同的列表项开始新的列表
+                flush_list()
+                items, list_type = [[item.group("text")]], _list_type(item.group("marker"))
+            elif item:
+                if blank_before:
+                    list_loose = True
+                elif _TRAILING_BREAK_PATTERN.search(items[-1][-1]):
+                    # pandoc：紧跟下一项的列表项末尾的硬换行保留，补一个空行使 _join_lines 输出换行
+                    items[-1].append("")
+                items.append([item.group("text")])
+            elif not blank_before or _INDENTED_PATTERN.match(line):
+                # 列表项的延续行（含缩进的后续段落），并入当前列表项
+                items[-1].append(line)
+                if blank_before:
+                    list_loose = True
+            else:
+                flush_list()
+                if heading:
+                    flush_paragraph()
+                    _append_heading(blocks, heading, strict)
+                    first_paragraph = True
+                else:
+                    paragraph.append(line)
+            blank_before = False
+            continue
+
+        if paragraph:
+            # pandoc：标题和列表前需要空行，否则并入段落
+            paragraph.append(line)
+            blank_before = False
+            continue
+
+        if blank_before and _INDENTED_PATTERN.match(line):
+            if strict:
+                raise UnsupportedMarkdown(f"包含缩进代码块: {line.strip()[:40]}")
+            paragraph.append(line)
+        elif heading:
+            _append_heading(blocks, heading, strict)
+            first_paragraph = True
+        elif item:
+            items, list_type = [[item.group("text")]], _list_type(item.group("marker"))
+        else:
+            paragraph.append(line)
+        blank_before = False
+
+    flush_paragraph()
+    flush_list()
+    return blocks
+
+
+def _append_heading(blocks, match, strict=True):
+    level = len(match.group(1))
+    text = _HEADING_CLOSING_PATTERN.sub("", match.group(2) or "").strip()
+    blocks.append(_block(f"Heading {level}", text, strict))
+
+
+def read_markdown_blocks(md_path, strict=True):
+    """读取md文件并解析为段落列表"""
+    with open(md_path, 'r', encoding='utf-8') as f:
+        return parse_markdown(f.readlines(), strict=strict)
@@ -1,11 +1,80 @@
 import logging
 import os
-import pypandoc
 from tqdm import tqdm
 import re
 
+from TxtoWord.md_render import DEFAULT_RENDERER, RENDERER_PANDOC, UnsupportedMarkdown, read_markdown_blocks
+
+try:
+    import pypandoc
+except ImportError:  # 只使用原生渲染时不需要 pandoc
+    pypandoc = None
+
 # Description: 处理标题格式化和转换为Word文档
 
+# reformat_titles 使用的预编译正则
+TITLE_STR_PATTERN = re.compile(r"(\d+)[_ ](.+)")
+HEADING_PATTERN = re.compile(r'(\s*)(#+)(\s*)(.*)')
+# 标题文字开头的原编号，按顺序依次去掉：数字+点（如 1.2.3.）、括号包数字（如 (1)、（1））、
+# 数字加右括号（如 1)、1））、纯数字加空格（如 "1 "）
+TITLE_NUMBER_PATTERNS = [re.compile(pattern) for pattern in (
+    r'^\s*(\d+(\.\d+)*\.)\s*',
+    r'^\s*[\(\（](\d+)[\)\）]\s*',
+    r'^\s*(\d+)[\)\）]\s*',
+    r'^\s*\d+\s+',
+)]
+
+def clean_title_text(text):
+    """去掉标题文字开头的原编号"""
+    text = text.lstrip()
+    # 以上编号都以数字或括号开头，其他标题不必逐个尝试
+    if text and (text[0].isdecimal() or text[0] in '(（'):
+        for pattern in TITLE_NUMBER_PATTERNS:
+            text = pattern.sub('', text, count=1)
+    return text.lstrip()
+
+def iter_reformatted_lines(lines, root_num, root_title):
+    """
+    逐行转换 reformat_titles 的输入，依次产出输出的各行：
+    先产出模块标题行 "# {root_num} {root_title}" 和一个空行；删除以```开头的行；
+    以#开头的行多加一个#（原文标题整体降一级），并按层级重新编号为 "{root_num}.x.y 标题文字"。
+    """
+    yield f"# {root_num} {root_title}\n"
+    yield "\n"
+
+    numbering = [int(root_num)]
+    last_level = 1
+    for line in lines:
+        # 大部分是正文行和空行，不含#和`时直接输出
+        if '#' not in line and '`' not in line:
+            yield line
+            continue
+        stripped = line.lstrip()
+        if stripped.startswith('```'):
+            continue
+        if not stripped.startswith('#'):
+            yield line
+            continue
+
+        prefix_ws, hashes, _, content = HEADING_PATTERN.match(line).groups()
+        # 多加一个#后至少是二级标题，一级标题只有开头插入的模块标题
+        level = len(hashes) + 1
+
+        if level > last_level:
+            for _ in range(level - last_level):
+                numbering.append(1)
+        elif level == last_level:
+            numbering[-1] += 1
+        else:
+            for _ in range(last_level - level):
+                numbering.pop()
+            numbering[-1] += 1
+
+        last_level = level
+
+        numbering_str = '.'.join(str(num) for num in numbering)
+        yield f"{prefix_ws}#{hashes} {numbering_str} {clean_title_text(content)}\n"
+
 def reformat_titles(file_path, title_str, output_md_path):
     """
     1. 删除txt文件中所有以```开头的行。
@@ -13,6 +82,7 @@ def reformat_titles(file_path, title_str, output_md_path):
     3. 在文件开头插入一行内容，如 "# 1 研究背景"，然后添加一个空行。
     4. 基于传入字符串开头的数字，对标题进行重新编号（遍历全文）。
     5. 结果输出到指定的md文件。
+    逐行读取、转换（iter_reformatted_lines）并写出，不把整个文件读入内存。
 
     :param file_path: 要处理的文件路径
     :param title_str: 类似 "1_研究背景"，数字和标题用下划线或空格分隔
@@ -20,100 +90,22 @@ def reformat_titles(file_path, title_str, output_md_path):
     """
 
     # 解析传入字符串
-    match = re.match(r"(\d+)[_ ](.+)", title_str)
+    match = TITLE_STR_PATTERN.match(title_str)
     if not match:
         raise ValueError("title_str格式错误，应为类似 '1_研究背景' 或 '1 研究背景'")
     root_num = match.group(1)
     root_title = match.group(2)
 
-    with open(file_path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-
-    # 删除以```开头的行（去除前后空白判断）
-    lines = [line for line in lines if not line.lstrip().startswith('```')]
-
-    # 为所有以#开头的行前加一个#
-    def add_extra_hash(line):
-        if line.lstrip().startswith('#'):
-            prefix_ws = re.match(r'^\s*', line).group(0)
-            hashes = re.match(r'^\s*(#+)', line).group(1)
-            rest = line.lstrip()[len(hashes):]
-            new_hashes = '#' + hashes
-            return prefix_ws + new_hashes + rest
-        else:
-            return line
-
-    lines = [add_extra_hash(line) for line in lines]
-
-    # 在开头插入 "# {root_num} {root_title}" 和一个空行
-    insert_title_line = f"# {root_num} {root_title}\n"
-    lines.insert(0, insert_title_line)
-    lines.insert(1, "\n")
-
-    numbering = [int(root_num)]
-    last_level = 1
-
-    def clean_title_text(text):
-    # 数字+点，如 1.2.3.
-        text = re.sub(r'^\s*(\d+(\.\d+)*\.)\s*', '', text)
-
-        # 括号包数字，如 (1) 、（1）
-        text = re.sub(r'^\s*[\(\（](\d+)[\)\）]\s*', '', text)
-
-        # 数字加右括号，如 1) 1）
-        text = re.sub(r'^\s*(\d+)[\)\）]\s*', '', text)
-
-        # 纯数字加空格，如 "1 "
-        text = re.sub(r'^\s*\d+\s+', '', text)
-
-        return text.lstrip()
-
-
-    new_lines = []
-
-    for line in lines:
-        match = re.match(r'^(\s*)(#+)(\s*)(.*)', line)
-        if match:
-            prefix_ws, hashes, space_after_hashes, content = match.groups()
-            level = len(hashes)
-
-            if level == 1:
-                # 一级标题保持传入的编号和标题
-                if line.strip() == insert_title_line.strip():
-                    new_lines.append(line)
-                    numbering = [int(root_num)]
-                    last_level = level
-                    continue
-                else:
-                    numbering = [int(root_num)]
-                    last_level = level
-                    title_text = clean_title_text(content)
-                    new_line = f"{prefix_ws}# {root_num} {title_text}\n"
-                    new_lines.append(new_line)
-                    continue
-
-            if level > last_level:
-                for _ in range(level - last_level):
-                    numbering.append(1)
-            elif level == last_level:
-                numbering[-1] += 1
-            else:
-                for _ in range(last_level - level):
-                    numbering.pop()
-                numbering[-1] += 1
-
-            last_level = level
-
-            title_text = clean_title_text(content)
-            numbering_str = '.'.join(str(num) for num in numbering)
-
-            new_line = f"{prefix_ws}{hashes} {numbering_str} {title_text}\n"
-            new_lines.append(new_line)
-        else:
-            new_lines.append(line)
-
-    with open(output_md_path, 'w', encoding='utf-8') as f:
-        f.writelines(new_lines)
+    # 边读边写到临时文件，全部完成后再替换，出错时不会留下只写了一半的md
+    tmp_path = output_md_path + ".tmp"
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f_in, open(tmp_path, 'w', encoding='utf-8') as f_out:
+            f_out.writelines(iter_reformatted_lines(f_in, root_num, root_title))
+        os.replace(tmp_path, output_md_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 def md_to_docx(input_md_path, output_docx_path):
     """
@@ -121,17 +113,99 @@ def md_to_docx(input_md_path, output_docx_path):
 
     :param input_md_path: 输入Markdown文件路径（txt格式，内容为Markdown）
     :param output_docx_path: 输出Word文件路径
+    :return: 是否转换成功
     """
+    if pypandoc is None:
+        logging.error(f"未安装pypandoc，无法转换：{input_md_path}")
+        return False
     try:
         output = pypandoc.convert_file(input_md_path, 'docx', outputfile=output_docx_path)
         logging.info(f"转换成功，输出文件：{output_docx_path}")
+        return True
     except Exception as e:
         logging.info(f"转换失败，错误信息：{e}")
+        return False
+
+def needs_pandoc(md_path, renderer=DEFAULT_RENDERER):
+    """该模块的md是否需要用pandoc转换：指定使用pandoc，或包含原生渲染不支持的写法"""
+    if renderer == RENDERER_PANDOC:
+        return True
+    try:
+        read_markdown_blocks(md_path)
+        return False
+    except UnsupportedMarkdown as e:
+        logging.info(f"{os.path.basename(md_path)} {e}，改用pandoc转换")
+        return True
+
+def list_module_folders(merging_path):
+    """merging_files 下以数字开头的模块文件夹（排序后）"""
+    return sorted(
+        name for name in os.listdir(merging_path)
+        if os.path.isdir(os.path.join(merging_path, name))
+        and name not in ('reformat_tilte', 'word_files')
+        and name[0].isdigit()
+    )
+
+def is_module_fresh(merging_path, folder_name, manifest, renderer=DEFAULT_RENDERER):
+    """模块的 merged.txt 未变化且上次生成的md/docx仍存在时返回True，可以跳过 reformat_one_folder"""
+    input_file = os.path.join(merging_path, folder_name, 'merged.txt')
+    return (manifest is not None and os.path.isfile(input_file)
+            and manifest.is_fresh("word_module", folder_name, [input_file], renderer=renderer))
 
-def batch_reformat_titles(base_folder):
+def reformat_one_folder(merging_path, folder_name, manifest=None, renderer=DEFAULT_RENDERER):
+    """
+    对单个模块文件夹的 merged.txt 进行 reformat_titles 和 md 转 docx，
+    输出到 merging_files/reformat_tilte 和 merging_files/word_files。
+    原生渲染（renderer="native"）时只生成md，由 build_final_document 直接写入合并文档，
+    md中有不支持的写法时仍用pandoc转换为docx。
+    :param merging_path: merging_files 目录
+    :param folder_name: 模块文件夹名，如 "1_研究背景"
+    :param renderer: "native" 或 "pandoc"
+    :return: 本次生成的文件列表，跳过或出错时返回None
+    """
+    output_md_folder = os.path.join(merging_path, 'reformat_tilte')
+    output_docx_folder = os.path.join(merging_path, 'word_files')
+    os.makedirs(output_md_folder, exist_ok=True)
+    os.makedirs(output_docx_folder, exist_ok=True)
+
+    folder_path = os.path.join(merging_path, folder_name)
+
+    title_str = folder_name
+    input_file = os.path.join(folder_path, 'merged.txt')
+    if not os.path.isfile(input_file):
+        logging.info(f"缺少文件：{input_file}，跳过")
+        return
+
+    output_md_path = os.path.join(output_md_folder, f"{title_str}.md")
+    output_docx_path = os.path.join(output_docx_folder, f"{title_str}.docx")
+
+    if is_module_fresh(merging_path, folder_name, manifest, renderer):
+        return
+
+    try:
+        # 先执行标题重格式化
+        reformat_titles(input_file, title_str, output_md_path)
+        logging.info(f"已生成MD文件: {output_md_path}")
+
+        # 再转换为docx；原生渲染时删除上次留下的docx，合并时只有需要pandoc的模块才读取docx
+        outputs = [output_md_path]
+        if needs_pandoc(output_md_path, renderer):
+            md_to_docx(output_md_path, output_docx_path)
+            outputs.append(output_docx_path)
+        elif os.path.exists(output_docx_path):
+            os.remove(output_docx_path)
+        if manifest is not None:
+            manifest.record("word_module", folder_name, [input_file], outputs, renderer=renderer)
+        return outputs
+    except Exception as e:
+        logging.info(f"处理文件夹 {folder_name} 时出错：{e}")
+
+def batch_reformat_titles(base_folder, manifest=None, renderer=DEFAULT_RENDERER):
     """
     只处理以数字开头的子文件夹，进行 reformat_titles 和 md 转 docx
     :param base_folder: 包含merging_files文件夹的基础路径
+    :param manifest: 任务清单，merged.txt 未变化且md/docx仍存在的模块跳过
+    :param renderer: "native"（默认，只生成md，合并时直接写入最终文档）或 "pandoc"（每个模块转换为docx）
     """
     merging_path = os.path.join(base_folder, 'merging_files')
     output_md_folder = os.path.join(merging_path, 'reformat_tilte')
@@ -141,34 +215,10 @@ def batch_reformat_titles(base_folder):
     os.makedirs(output_docx_folder, exist_ok=True)
 
     # 先过滤出所有需要处理的文件夹
-    folder_list = [
-        name for name in os.listdir(merging_path)
-        if os.path.isdir(os.path.join(merging_path, name))
-        and name not in ('reformat_tilte', 'word_files')
-        and name[0].isdigit()
-    ]
+    folder_list = list_module_folders(merging_path)
 
     for folder_name in tqdm(folder_list, desc="markdown格式化处理"):
-        folder_path = os.path.join(merging_path, folder_name)
-
-        title_str = folder_name
-        input_file = os.path.join(folder_path, 'merged.txt')
-        if not os.path.isfile(input_file):
-            logging.info(f"缺少文件：{input_file}，跳过")
-            continue
-
-        output_md_path = os.path.join(output_md_folder, f"{title_str}.md")
-        output_docx_path = os.path.join(output_docx_folder, f"{title_str}.docx")
-
-        try:
-            # 先执行标题重格式化
-            reformat_titles(input_file, title_str, output_md_path)
-            logging.info(f"已生成MD文件: {output_md_path}")
-
-            # 再转换为docx
-            md_to_docx(output_md_path, output_docx_path)
-        except Exception as e:
-            logging.info(f"处理文件夹 {folder_name} 时出错：{e}")
+        reformat_one_folder(merging_path, folder_name, manifest=manifest, renderer=renderer)
 
 
 
@@ -1,11 +1,42 @@
 import logging
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from copy import deepcopy
 from docx import Document
 from docx.shared import Pt, Cm, RGBColor
+from docx.enum.style import WD_STYLE_TYPE
 from docx.enum.text import WD_LINE_SPACING
 from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
+from docx.text.paragraph import Paragraph
 from tqdm import tqdm
+from TxtoWord.format_check import correct_paragraph_text
+from TxtoWord.md_render import DEFAULT_RENDERER, RENDERER_PANDOC, UnsupportedMarkdown, read_markdown_blocks
+from FilePreProcess.utils import get_current_log_file, init_worker_logger
+from TxtoWord.title_fromat import batch_reformat_titles, is_module_fresh, list_module_folders, reformat_one_folder
+
+# 合并方式：xml 为按元素批量追加（DocxBodyMerger），copy 为原先逐段逐run复制并设置格式
+MERGE_XML = "xml"
+MERGE_COPY = "copy"
+DEFAULT_MERGE_MODE = MERGE_XML
+
+# 合并输出的文件名，按 pandoc 方式读取 word_files 下的模块docx时排除
+MERGED_FILENAME = "merged.docx"
+FORMATED_FILENAME = "formated.docx"
+
+# 最终Word生成时各模块渲染（reformat_titles、md解析或pandoc转换）的默认进程数
+DEFAULT_WORD_WORKERS = min(4, os.cpu_count() or 1)
+
+# 合并文档的样式设置，其他样式的段落按 Normal 处理
+STYLES_CONFIG = {
+    'Heading 1': {'font_name': '黑体', 'font_size':16, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.5, 'first_line_indent':0},
+    'Heading 2': {'font_name': '黑体', 'font_size':15, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.5, 'first_line_indent':0},
+    'Heading 3': {'font_name': '黑体', 'font_size':14, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.5, 'first_line_indent':0},
+    'Heading 4': {'font_name': '黑体', 'font_size':12, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.25, 'first_line_indent':0},
+    'Heading 5': {'font_name': '黑体', 'font_size':12, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.25, 'first_line_indent':0},
+    'Normal':    {'font_name': '宋体', 'font_size':12, 'bold': False, 'italic': False, 'color':(0,0,0), 'line_spacing':1.25, 'first_line_indent':0.74},
+}
 
 
 def ensure_rPr(style_element):
@@ -33,16 +64,7 @@ def set_style_font(style, font_name, font_size_pt, bold, italic, color):
     rFonts.set(qn('w:hAnsi'), font_name)
     rFonts.set(qn('w:cs'), font_name)
 
-def unify_styles(doc):
-    styles_config = {
-        'Heading 1': {'font_name': '黑体', 'font_size':16, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.5, 'first_line_indent':0},
-        'Heading 2': {'font_name': '黑体', 'font_size':15, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.5, 'first_line_indent':0},
-        'Heading 3': {'font_name': '黑体', 'font_size':14, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.5, 'first_line_indent':0},
-        'Heading 4': {'font_name': '黑体', 'font_size':12, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.25, 'first_line_indent':0},
-        'Heading 5': {'font_name': '黑体', 'font_size':12, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.25, 'first_line_indent':0},
-        'Normal':    {'font_name': '宋体', 'font_size':12, 'bold': False, 'italic': False, 'color':(0,0,0), 'line_spacing':1.25, 'first_line_indent':0.74},
-    }
-
+def unify_styles(doc, styles_config=STYLES_CONFIG):
     for style_name, cfg in styles_config.items():
         if style_name not in doc.styles:
             logging.info(f"样式{style_name}不存在，跳过")
@@ -104,50 +126,261 @@ def copy_paragraph(source_paragraph, target_document, force_style=None):
     # 返回创建的段落，以便后续处理
     return p
 
-def process_and_merge_all_files(folder_path, merged_filename="merged.docx"):
-    word_folder = os.path.join(folder_path, "merging_files", "word_files")
-    output_path = os.path.join(word_folder, merged_filename)
+def add_block_paragraph(block, target_document):
+    """原生渲染的段落（TxtoWord.md_render）写入目标文档，样式和文字的处理同 copy_paragraph"""
+    style_name = block["style"] if block["style"] in target_document.styles else 'Normal'
+    p = target_document.add_paragraph(style=style_name)
+    for text, bold, italic in block["runs"]:
+        r = p.add_run(text)
+        r.bold = bold or None
+        r.italic = italic or None
+    return p
 
-    # 如果合并文档已存在，先删除
-    if os.path.exists(output_path):
-        try:
-            os.remove(output_path)
-            logging.info(f"已删除已存在的合并文档：{merged_filename}")
-        except Exception as e:
-            logging.error(f"删除合并文档时出错：{e}")
-    
-    # 如果 formated.docx 存在，也删除
-    formated_path = os.path.join(word_folder, "formated.docx")
-    if os.path.exists(formated_path):
-        try:
-            os.remove(formated_path)
-            logging.info(f"已删除已存在的格式化文档：formated.docx")
-        except Exception as e:
-            logging.error(f"删除格式化文档时出错：{e}")
+def list_module_sources(folder_path, renderer=DEFAULT_RENDERER, merged_filename=MERGED_FILENAME):
+    """
+    需要合并的各模块及其来源，返回 [(名称, md路径, docx路径)]。
+    pandoc 方式为 word_files 下的各模块docx（md路径为None）；原生渲染为各模块文件夹对应的
+    reformat_tilte/模块.md，其中需要pandoc转换的模块读取 word_files 下同名docx。
+    """
+    merging_path = os.path.join(folder_path, "merging_files")
+    word_folder = os.path.join(merging_path, "word_files")
+    if renderer == RENDERER_PANDOC:
+        return [(fname, None, os.path.join(word_folder, fname))
+                for fname in list_module_docx_files(word_folder, merged_filename)]
+    sources = []
+    for module in list_module_folders(merging_path):
+        md_path = os.path.join(merging_path, "reformat_tilte", f"{module}.md")
+        if os.path.isfile(md_path):
+            sources.append((module, md_path, os.path.join(word_folder, f"{module}.docx")))
+    return sources
 
-    merged_doc = Document()
-    
-    # 统一合并文档的样式
-    unify_styles(merged_doc)
+def load_module_blocks(name, md_path, docx_path):
+    """
+    原生渲染的模块解析为段落列表；需要pandoc且已有转换结果时返回None（改为读取docx），
+    没有转换结果（如未安装pandoc）时按普通段落渲染不支持的写法。
+    """
+    try:
+        return read_markdown_blocks(md_path)
+    except UnsupportedMarkdown as e:
+        if os.path.isfile(docx_path):
+            return None
+        logging.warning(f"{name} {e}，且没有pandoc转换结果，按普通段落渲染")
+        return read_markdown_blocks(md_path, strict=False)
 
-    styles_config = {
-        'Heading 1': {'font_name': '黑体', 'font_size':16, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.5, 'first_line_indent':0},
-        'Heading 2': {'font_name': '黑体', 'font_size':15, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.5, 'first_line_indent':0},
-        'Heading 3': {'font_name': '黑体', 'font_size':14, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.5, 'first_line_indent':0},
-        'Heading 4': {'font_name': '黑体', 'font_size':12, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.25, 'first_line_indent':0},
-        'Heading 5': {'font_name': '黑体', 'font_size':12, 'bold': True, 'italic': False, 'color':(0,0,0), 'line_spacing':1.25, 'first_line_indent':0},
-        'Normal':    {'font_name': '宋体', 'font_size':12, 'bold': False, 'italic': False, 'color':(0,0,0), 'line_spacing':1.25, 'first_line_indent':0.74},
-    }
-
-    # 获取所有需要合并的 docx 文件列表，并排除合并输出文件
-    file_list = [
+def list_module_docx_files(word_folder, merged_filename=MERGED_FILENAME):
+    """返回 word_files 下需要合并的各模块docx文件名（排序后），排除合并及格式化输出文件"""
+    return [
         fname for fname in sorted(os.listdir(word_folder))
-        if fname.lower().endswith('.docx') and fname != merged_filename
+        if fname.lower().endswith('.docx') and fname not in (merged_filename, MERGED_FILENAME, FORMATED_FILENAME)
     ]
 
-    # tqdm 包裹 file_list，即可显示进度条
-    for fname in tqdm(file_list, desc="合并进度"):
-        fpath = os.path.join(word_folder, fname)
+# OOXML 元素名
+W_P = qn('w:p')
+W_PPR = qn('w:pPr')
+W_PSTYLE = qn('w:pStyle')
+W_R = qn('w:r')
+W_RPR = qn('w:rPr')
+W_T = qn('w:t')
+W_VAL = qn('w:val')
+XML_SPACE = qn('xml:space')
+# 合并时保留的段落属性、run属性和run内容，其余（字体、字号、颜色、缩进、编号、域代码、图片等）丢弃
+KEEP_PPR = {qn('w:jc')}
+KEEP_RPR = {qn(f'w:{tag}') for tag in ('b', 'bCs', 'i', 'iCs', 'strike', 'u', 'vertAlign')}
+KEEP_RUN_CONTENT = {qn(f'w:{tag}') for tag in ('t', 'tab', 'br', 'cr', 'noBreakHyphen', 'softHyphen')}
+# 段落中包着run的元素（超链接、智能标记、修订插入等），合并时拆开保留其中的文字
+UNWRAP_RUN_CONTAINERS = {qn(f'w:{tag}') for tag in ('hyperlink', 'smartTag', 'ins', 'fldSimple', 'customXml')}
+RUN_TEXT_SPLIT = re.compile(r'(\n|\t)')
+
+class DocxBodyMerger:
+    """
+    按OOXML元素把各模块追加到合并文档的 body。
+    子文档的段落元素清理后直接移入合并文档，段落样式通过样式表（子文档样式ID -> 样式名 -> 合并文档样式ID）
+    每个子文档只映射一次；字体、字号、颜色、行距、缩进都不再写到段落和run上，统一由 unify_styles
+    设置的样式决定，run上只保留加粗、倾斜、下划线等强调。
+    transform(文字, 样式名) 为逐段的文字修正（如 format_check.correct_paragraph_text），文字有变化的段落
+    改为一个不带强调的run。
+    """
+
+    def __init__(self, target_doc, styles_config=STYLES_CONFIG, transform=None):
+        self.doc = target_doc
+        self.styles_config = styles_config
+        self.transform = transform
+        self.body = target_doc.element.body
+        self._styles = {}  # {样式名: (合并文档中的样式名, 样式ID)}，Normal 的样式ID为 None（不写 pStyle）
+        # 先取下节属性，段落追加完后再放回 body 末尾
+        self._sect_pr = self.body.sectPr
+        if self._sect_pr is not None:
+            self.body.remove(self._sect_pr)
+        self._page_break = self._make_page_break()
+
+    def target_style(self, style_name):
+        """
+        样式名对应的合并文档样式 (样式名, 样式ID)：与 copy_paragraph 一样沿用合并文档中的同名样式
+        （如模板自带的 Heading 6-9，保留标题样式和大纲级别），合并文档没有的样式按 Normal 处理
+        """
+        if style_name not in self._styles:
+            if style_name != 'Normal' and style_name in self.doc.styles:
+                self._styles[style_name] = (style_name, self.doc.styles[style_name].style_id)
+            else:
+                self._styles[style_name] = ('Normal', None)
+        return self._styles[style_name]
+
+    def append_document(self, sub_doc):
+        """子文档的非空段落移入合并文档（表格等其他元素与原先一样不合并）"""
+        style_names = {style.style_id: style.name for style in sub_doc.styles}
+        default_style = sub_doc.styles.default(WD_STYLE_TYPE.PARAGRAPH)
+        default_name = default_style.name if default_style is not None else 'Normal'
+        style_map = {}  # {子文档样式ID: 合并文档 (样式名, 样式ID)}
+        for p in list(sub_doc.element.body.iterchildren(W_P)):
+            pStyle = p.find(f'{W_PPR}/{W_PSTYLE}')
+            source_id = pStyle.get(W_VAL) if pStyle is not None else None
+            if source_id not in style_map:
+                style_map[source_id] = self.target_style(style_names.get(source_id, default_name))
+            style_name, style_id = style_map[source_id]
+            if not self._clean_paragraph(p, style_id):
+                continue
+            if self.transform is not None:
+                para = Paragraph(p, None)
+                text = para.text
+                new_text = self.transform(text, style_name)
+                if new_text != text:
+                    para.text = new_text
+            self.body.append(p)
+
+    def append_blocks(self, blocks):
+        """原生渲染的段落（TxtoWord.md_render）直接生成段落元素追加"""
+        for block in blocks:
+            if not "".join(text for text, _, _ in block["runs"]).strip():
+                continue
+            style_name, style_id = self.target_style(block["style"])
+            runs = block["runs"]
+            if self.transform is not None:
+                text = "".join(text for text, _, _ in runs)
+                new_text = self.transform(text, style_name)
+                if new_text != text:
+                    runs = [(new_text, False, False)]
+            p = OxmlElement('w:p')
+            self._set_style(p, style_id)
+            for text, bold, italic in runs:
+                p.append(self._make_run(text, bold, italic))
+            self.body.append(p)
+
+    def append_page_break(self):
+        self.body.append(deepcopy(self._page_break))
+
+    def close(self):
+        if self._sect_pr is not None:
+            self.body.append(self._sect_pr)
+            self._sect_pr = None
+
+    def _clean_paragraph(self, p, style_id):
+        """就地清理段落，只留文字和强调，返回段落是否有非空文字"""
+        kept_ppr = []
+        for child in list(p):
+            if child.tag == W_R:
+                self._clean_run(child)
+            elif child.tag in UNWRAP_RUN_CONTAINERS:
+                for r in list(child.iter(W_R)):
+                    self._clean_run(r)
+                    child.addprevious(r)
+                p.remove(child)
+            else:
+                # 段落属性按保留项重建；书签、批注范围、拼写标记等直接丢弃
+                if child.tag == W_PPR:
+                    kept_ppr = [prop for prop in child if prop.tag in KEEP_PPR]
+                p.remove(child)
+        if not "".join(t.text or "" for t in p.iter(W_T)).strip():
+            return False
+        self._set_style(p, style_id, kept_ppr)
+        return True
+
+    @staticmethod
+    def _clean_run(r):
+        for child in list(r):
+            if child.tag == W_RPR:
+                for prop in list(child):
+                    if prop.tag not in KEEP_RPR:
+                        child.remove(prop)
+                if len(child) == 0:
+                    r.remove(child)
+            elif child.tag not in KEEP_RUN_CONTENT:
+                r.remove(child)
+
+    @staticmethod
+    def _set_style(p, style_id, extra=()):
+        if style_id is None and not extra:
+            return
+        pPr = OxmlElement('w:pPr')
+        if style_id is not None:
+            pStyle = OxmlElement('w:pStyle')
+            pStyle.set(W_VAL, style_id)
+            pPr.append(pStyle)
+        pPr.extend(extra)
+        p.insert(0, pPr)
+
+    @staticmethod
+    def _make_run(text, bold, italic):
+        r = OxmlElement('w:r')
+        if bold or italic:
+            rPr = OxmlElement('w:rPr')
+            if bold:
+                rPr.append(OxmlElement('w:b'))
+            if italic:
+                rPr.append(OxmlElement('w:i'))
+            r.append(rPr)
+        # 与 python-docx 的 run.text 一致：换行为 w:br，制表符为 w:tab
+        for part in RUN_TEXT_SPLIT.split(text):
+            if part == "\n":
+                r.append(OxmlElement('w:br'))
+            elif part == "\t":
+                r.append(OxmlElement('w:tab'))
+            elif part:
+                t = OxmlElement('w:t')
+                t.text = part
+                if part != part.strip():
+                    t.set(XML_SPACE, "preserve")
+                r.append(t)
+        return r
+
+    @staticmethod
+    def _make_page_break():
+        p = OxmlElement('w:p')
+        r = OxmlElement('w:r')
+        br = OxmlElement('w:br')
+        br.set(qn('w:type'), "page")
+        r.append(br)
+        p.append(r)
+        return p
+
+def merge_sources_xml(merged_doc, sources, transform=None):
+    """按元素批量合并各模块（DocxBodyMerger）"""
+    merger = DocxBodyMerger(merged_doc, transform=transform)
+    for fname, md_path, fpath in tqdm(sources, desc="合并进度"):
+        blocks = load_module_blocks(fname, md_path, fpath) if md_path else None
+        if blocks is not None:
+            merger.append_blocks(blocks)
+            logging.info(f"已渲染并合并：{fname}")
+        else:
+            merger.append_document(Document(fpath))
+            logging.info(f"已处理并合并：{fname}")
+        merger.append_page_break()
+    merger.close()
+
+def merge_sources_copy(merged_doc, sources, styles_config=STYLES_CONFIG, transform=None):
+    """原先的合并方式：逐段逐run复制，再对每个run直接设置样式配置中的格式"""
+    # tqdm 包裹 sources，即可显示进度条
+    for fname, md_path, fpath in tqdm(sources, desc="合并进度"):
+        blocks = load_module_blocks(fname, md_path, fpath) if md_path else None
+        if blocks is not None:
+            for block in blocks:
+                if not "".join(text for text, _, _ in block["runs"]).strip():
+                    continue
+                new_para = add_block_paragraph(block, merged_doc)
+                transform_paragraph(new_para, transform)
+                apply_style_properties(new_para, styles_config.get(block["style"], styles_config['Normal']))
+            merged_doc.add_page_break()
+            logging.info(f"已渲染并合并：{fname}")
+            continue
 
         # 打开子文档
         sub_doc = Document(fpath)
@@ -160,6 +393,7 @@ def process_and_merge_all_files(folder_path, merged_filename="merged.docx"):
                 
                 # 复制段落并保留基本格式
                 new_para = copy_paragraph(para, merged_doc, force_style=style_name)
+                transform_paragraph(new_para, transform)
                 
                 # 根据样式名称直接应用正确的格式
                 if style_name in styles_config:
@@ -172,11 +406,190 @@ def process_and_merge_all_files(folder_path, merged_filename="merged.docx"):
         merged_doc.add_page_break()
         logging.info(f"已处理并合并：{fname}")
 
+def transform_paragraph(paragraph, transform):
+    """对合并文档中的段落做逐段文字修正，文字有变化时整段替换"""
+    if transform is None:
+        return
+    text = paragraph.text
+    new_text = transform(text, paragraph.style.name)
+    if new_text != text:
+        paragraph.text = new_text
+
+def process_and_merge_all_files(folder_path, merged_filename=MERGED_FILENAME, renderer=DEFAULT_RENDERER,
+                                merge_mode=DEFAULT_MERGE_MODE, transform=None):
+    """
+    合并各模块生成 word_files/merged.docx（merged_filename）。
+    原生渲染（renderer="native"）时各模块的md直接写入合并文档，pandoc 方式逐个读取各模块docx复制段落。
+    merge_mode="xml"（默认）时段落按元素批量追加，格式取自 unify_styles 设置的样式；
+    merge_mode="copy" 为原先逐段逐run复制并直接设置格式的方式。
+    transform(文字, 样式名) 在合并时对每个段落做文字修正，返回修正后的文字。
+    """
+    word_folder = os.path.join(folder_path, "merging_files", "word_files")
+    output_path = remove_merge_outputs(word_folder, merged_filename)
+
+    merged_doc = Document()
+    
+    # 统一合并文档的样式
+    unify_styles(merged_doc)
+
+    # 获取所有需要合并的模块，docx 方式排除合并输出文件
+    sources = list_module_sources(folder_path, renderer, merged_filename)
+    if merge_mode == MERGE_COPY:
+        merge_sources_copy(merged_doc, sources, transform=transform)
+    else:
+        merge_sources_xml(merged_doc, sources, transform=transform)
+
     # 保存合并文档
     merged_doc.save(output_path)
     logging.info(f"合并完成，保存为 {merged_filename}")
     return output_path
 
+def remove_merge_outputs(word_folder, merged_filename):
+    """删除上次的合并输出（merged_filename 以及 merged.docx / formated.docx），返回本次的输出路径"""
+    output_path = os.path.join(word_folder, merged_filename)
+
+    # 如果合并文档已存在，先删除
+    if os.path.exists(output_path):
+        try:
+            os.remove(output_path)
+            logging.info(f"已删除已存在的合并文档：{merged_filename}")
+        except Exception as e:
+            logging.error(f"删除合并文档时出错：{e}")
+    
+    # 另一个输出文件（merged.docx / formated.docx）如果存在，也删除
+    for stale_filename in (MERGED_FILENAME, FORMATED_FILENAME):
+        stale_path = os.path.join(word_folder, stale_filename)
+        if stale_filename == merged_filename or not os.path.exists(stale_path):
+            continue
+        try:
+            os.remove(stale_path)
+            logging.info(f"已删除已存在的文档：{stale_filename}")
+        except Exception as e:
+            logging.error(f"删除{stale_filename}时出错：{e}")
+    return output_path
+
+def build_final_document(folder_path, manifest=None, renderer=DEFAULT_RENDERER, merge_mode=DEFAULT_MERGE_MODE):
+    """
+    合并各模块（原生渲染为 reformat_tilte 下的md，pandoc 方式为 word_files 下的docx）并修正编号段落，
+    返回 formated.docx 路径。编号段落在合并时逐段修正（correct_paragraph_text），直接保存为 formated.docx，
+    不再先保存 merged.docx 再读入修正。传入 manifest 时，各模块均未变化则直接沿用上次生成的文档。
+    """
+    if final_document_is_fresh(folder_path, manifest, renderer, merge_mode):
+        logging.info("各模块Word文档未变化，沿用已有的最终文档")
+        return os.path.join(folder_path, "merging_files", "word_files", FORMATED_FILENAME)
+
+    result_path = process_and_merge_all_files(folder_path, FORMATED_FILENAME, renderer=renderer, merge_mode=merge_mode,
+                                              transform=correct_paragraph_text)
+    record_final_document(folder_path, manifest, renderer, merge_mode, result_path)
+    return result_path
+
+def final_word_inputs(folder_path, renderer=DEFAULT_RENDERER):
+    """最终文档的输入：原生渲染为各模块md（需要pandoc的模块同样以md记录），pandoc 方式为各模块docx"""
+    return [md_path or docx_path for _, md_path, docx_path in list_module_sources(folder_path, renderer)]
+
+def final_document_is_fresh(folder_path, manifest, renderer=DEFAULT_RENDERER, merge_mode=DEFAULT_MERGE_MODE):
+    return manifest is not None and manifest.is_fresh("word_merge", FORMATED_FILENAME,
+                                                      final_word_inputs(folder_path, renderer), merge_mode=merge_mode)
+
+def record_final_document(folder_path, manifest, renderer, merge_mode, result_path):
+    if manifest is not None:
+        manifest.record("word_merge", FORMATED_FILENAME, final_word_inputs(folder_path, renderer), [result_path],
+                        merge_mode=merge_mode)
+
+def render_module(merging_path, folder_name, renderer=DEFAULT_RENDERER, reformat=True):
+    """
+    单个模块的渲染，可在子进程中执行：reformat=True 时先 reformat_one_folder 生成md（及需要的docx），
+    原生渲染时再把md解析为段落列表（md_render 的段落列表可以直接传回主进程）。
+    返回 {"folder", "md_path", "docx_path", "blocks", "outputs"}：md_path 和 docx_path 都为 None 时该模块没有
+    可合并的内容，blocks 为 None 时合并读取 docx_path；outputs 为本次 reformat_one_folder 生成的文件。
+    """
+    outputs = reformat_one_folder(merging_path, folder_name, renderer=renderer) if reformat else None
+    md_path = os.path.join(merging_path, "reformat_tilte", f"{folder_name}.md")
+    docx_path = os.path.join(merging_path, "word_files", f"{folder_name}.docx")
+    result = {"folder": folder_name, "md_path": None, "docx_path": None, "blocks": None, "outputs": outputs}
+    if renderer == RENDERER_PANDOC:
+        if os.path.isfile(docx_path):
+            result["docx_path"] = docx_path
+    elif os.path.isfile(md_path):
+        result["md_path"] = md_path
+        result["docx_path"] = docx_path
+        result["blocks"] = load_module_blocks(folder_name, md_path, docx_path)
+    return result
+
+def merge_rendered_module(merger, result):
+    """按 render_module 的结果把模块追加到合并文档"""
+    if result["blocks"] is not None:
+        merger.append_blocks(result["blocks"])
+        logging.info(f"已渲染并合并：{result['folder']}")
+    elif result["docx_path"] is not None:
+        merger.append_document(Document(result["docx_path"]))
+        logging.info(f"已处理并合并：{result['folder']}")
+    else:
+        return
+    merger.append_page_break()
+
+def render_and_build_final_document(folder_path, manifest=None, renderer=DEFAULT_RENDERER,
+                                    merge_mode=DEFAULT_MERGE_MODE, max_workers=DEFAULT_WORD_WORKERS):
+    """
+    batch_reformat_titles 与 build_final_document 合为一步：各模块的渲染在进程池中并行执行，
+    主进程按模块文件夹顺序，在前面的模块都完成后依次把结果追加到最终文档，编号段落合并时逐段修正。
+    max_workers 小于等于1或需要重新渲染的模块不超过1个时串行处理；merge_mode="copy" 时按原先两步处理。
+    返回 formated.docx 路径。
+    """
+    if merge_mode == MERGE_COPY:
+        batch_reformat_titles(folder_path, manifest=manifest, renderer=renderer)
+        return build_final_document(folder_path, manifest=manifest, renderer=renderer, merge_mode=merge_mode)
+
+    merging_path = os.path.join(folder_path, "merging_files")
+    word_folder = os.path.join(merging_path, "word_files")
+    os.makedirs(os.path.join(merging_path, "reformat_tilte"), exist_ok=True)
+    os.makedirs(word_folder, exist_ok=True)
+
+    folders = list_module_folders(merging_path)
+    reformat = [not is_module_fresh(merging_path, folder, manifest, renderer) for folder in folders]
+    if not any(reformat) and final_document_is_fresh(folder_path, manifest, renderer, merge_mode):
+        logging.info("各模块Word文档未变化，沿用已有的最终文档")
+        return os.path.join(word_folder, FORMATED_FILENAME)
+
+    output_path = remove_merge_outputs(word_folder, FORMATED_FILENAME)
+    merged_doc = Document()
+    unify_styles(merged_doc)
+    merger = DocxBodyMerger(merged_doc, transform=correct_paragraph_text)
+
+    def merge_result(result):
+        if result["outputs"] and manifest is not None:
+            manifest.record("word_module", result["folder"], [os.path.join(merging_path, result["folder"], 'merged.txt')],
+                            result["outputs"], renderer=renderer)
+        merge_rendered_module(merger, result)
+
+    total = len(folders)
+    if max_workers is None or max_workers <= 1 or sum(reformat) <= 1:
+        for folder, need_reformat in zip(tqdm(folders, desc="生成最终Word文档"), reformat):
+            merge_result(render_module(merging_path, folder, renderer, need_reformat))
+    else:
+        logging.info(f"并行渲染各模块，进程数: {max_workers}")
+        results = [None] * total
+        next_merge = 0
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker_logger,
+                                 initargs=(get_current_log_file(),)) as executor:
+            futures = {executor.submit(render_module, merging_path, folder, renderer, need_reformat): idx
+                       for idx, (folder, need_reformat) in enumerate(zip(folders, reformat))}
+            with tqdm(total=total, desc="生成最终Word文档") as pbar:
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+                    # 只合并连续完成的前缀，保证模块顺序与串行一致
+                    while next_merge < total and results[next_merge] is not None:
+                        merge_result(results[next_merge])
+                        results[next_merge] = None
+                        next_merge += 1
+                    pbar.update(1)
+
+    merger.close()
+    merged_doc.save(output_path)
+    logging.info(f"合并完成，保存为 {FORMATED_FILENAME}")
+    record_final_document(folder_path, manifest, renderer, merge_mode, output_path)
+    return output_path
+
 # 使用示例
 if __name__ == "__main__":
     root_dir = r"D:\python_workspace\LLM_apply\FileMerge\projects_txt_modules"  # 这里替换成您的根目录路径
@@ -1,16 +1,20 @@
 from flask import Flask, abort, render_template, request, jsonify, redirect, url_for, flash, send_file
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_bcrypt import Bcrypt
 import json
 import time
 import logging
 import os
-import urllib
+import threading
+import urllib.parse
 from werkzeug.utils import secure_filename
 
 
-from file_merge_pipeline import process_word_documents  # 你的业务逻辑
+from Pipeline.jobs import (JOBS_ROOT, DEFAULT_MAX_WORKERS, EVENT_DONE, EVENT_FAILED, EVENT_PROGRESS, EVENT_STARTED,
+                          RESUMABLE_STATUSES, STATUS_DONE, JobManager)
+from Pipeline.checkpoint import load_checkpoint
+from Pipeline.progress_hub import DEFAULT_MAX_RATE, ProgressHub, job_room
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key'
@@ -23,6 +27,10 @@ login_manager.init_app(app)
 login_manager.login_view = "login"
 
 USERS_FILE = "users.json"
+# 同时运行的处理任务数，每个任务占用一个子进程
+MAX_JOB_WORKERS = DEFAULT_MAX_WORKERS
+# 每个任务每秒最多推送的进度更新次数，期间的多次进度变化合并为一次推送
+PROGRESS_MAX_RATE = DEFAULT_MAX_RATE
 AVATAR_FOLDER = 'static/avatars'
 ALLOWED_AVATAR_EXT = {'png', 'jpg', 'jpeg', 'gif'}
 
@@ -79,12 +87,9 @@ class User(UserMixin):
 def load_user(user_id):
     return User.get(user_id)
 
-def format_seconds_to_hms(seconds):
-    seconds = int(seconds)
-    h = seconds // 3600
-    m = (seconds % 3600) // 60
-    s = seconds % 60
-    return f"{h:02d}:{m:02d}:{s:02d}"
+# --------- 任务管理（处理流程在 Pipeline.jobs 的子进程中执行） -----------
+JOB_WORKERS_LOCK = threading.Lock()
+job_workers_state = {"started": False}
 
 # --------- 用户注册、登录、登出、自注销 -----------
 
@@ -315,155 +320,229 @@ def start_process():
     if not module_config_file:
         return jsonify({"status": "error", "message": "缺少必要参数：模块配置文件"}), 400
 
-    input_dir = os.path.join(os.getcwd(), "uploaded_input")
-    if not os.path.exists(input_dir):
-        os.makedirs(input_dir)
-    else:
-        # 清空目录
-        for root, dirs, files_in_dir in os.walk(input_dir, topdown=False):
-            for name in files_in_dir:
-                os.remove(os.path.join(root, name))
-            for name in dirs:
-                os.rmdir(os.path.join(root, name))
-
-    for f in files:
-        rel_path = f.filename
-        save_path = os.path.join(input_dir, rel_path)
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        f.save(save_path)
-    module_config_path = os.path.join(input_dir, module_config_file.filename)
-    module_config_file.save(module_config_path)
-
-    output_dir = os.path.join(os.getcwd(), "default_output")
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    # 每个任务使用单独的输入、输出目录，多个任务可以同时处理
+    job_id = JOB_MANAGER.new_job()
+    input_dir = JOB_MANAGER.input_dir(job_id)
+    try:
+        for f in files:
+            save_path = os.path.normpath(os.path.join(input_dir, f.filename))
+            # 保留上传时的相对路径，但不允许写到任务目录之外
+            if not save_path.startswith(input_dir + os.sep):
+                raise ValueError(f"非法文件名: {f.filename}")
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            f.save(save_path)
+        module_config_name = os.path.basename(module_config_file.filename) or "module_config.json"
+        module_config_path = os.path.join(JOB_MANAGER.job_dir(job_id), module_config_name)
+        module_config_file.save(module_config_path)
+    except Exception as e:
+        JOB_MANAGER.discard(job_id)
+        logging.exception("保存上传文件失败:")
+        return jsonify({"status": "error", "message": f"保存上传文件失败：{e}"}), 400
 
     USERS[current_user.id].setdefault("usage_log", []).append(
-        {"event": "start_process", "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+        {"event": "start_process", "job_id": job_id, "time": time.strftime("%Y-%m-%d %H:%M:%S")}
     )
     save_users(USERS)
 
-    socketio.start_background_task(
-        run_process, input_dir, output_dir, days, module_config_path
-    )
-    return jsonify({"status": "started"})
-
-def run_process(input_dir, output_dir, days, module_config):
-    total_start_time = time.time()
-    stop_flag = {"stop": False}
-    last_progress = {
-        "percent": 0,
-        "current_step_name": "无",
-        "current_step_elapsed": 0,
-        "history": [],
-    }
-    current_step_state = {
-        "name": None,
-        "start_time": None,
-        "elapsed": 0
-    }
-    def timer_thread():
-        while not stop_flag["stop"]:
-            now = time.time()
-            step_elapsed = 0
-            if current_step_state["start_time"] is not None:
-                step_elapsed = now - current_step_state["start_time"]
-            socketio.emit("progress_update", {
-                "percent": last_progress["percent"],
-                "current_step_name": current_step_state["name"] or last_progress["current_step_name"],
-                "current_step_elapsed": format_seconds_to_hms(step_elapsed),
-                "history": [
-                    {"name": h["name"], "time": format_seconds_to_hms(h["time"])}
-                    for h in (last_progress.get("history") or [])
-                ],
-                "total_elapsed": format_seconds_to_hms(now - total_start_time)
-            })
-            socketio.sleep(1)
-    socketio.start_background_task(timer_thread)
-
-    def progress_callback(percent, current_step_name=None, current_step_elapsed=None, history=None):
-        if current_step_name and current_step_name != current_step_state["name"]:
-            current_step_state["name"] = current_step_name
-            current_step_state["start_time"] = time.time()
-        last_progress.update({
-            "percent": percent,
-            "current_step_name": current_step_name or last_progress.get("current_step_name"),
-            "current_step_elapsed": current_step_elapsed or 0,
-            "history": history or last_progress.get("history"),
-        })
-        now = time.time()
-        step_elapsed = 0
-        if current_step_state["start_time"] is not None:
-            step_elapsed = now - current_step_state["start_time"]
-        socketio.emit("progress_update", {
-            "percent": percent,
-            "current_step_name": current_step_name,
-            "current_step_elapsed": format_seconds_to_hms(step_elapsed),
-            "history": [
-                {"name": h["name"], "time": format_seconds_to_hms(h["time"])}
-                for h in (history or [])
-            ],
-            "total_elapsed": format_seconds_to_hms(now - total_start_time)
+    job = JOB_MANAGER.submit(job_id, current_user.id, module_config_path, days=days)
+    return jsonify({
+        "status": "started",
+        "job_id": job_id,
+        "job_status": job["status"],
+        "queue_position": JOB_MANAGER.queue_position(job_id),
+    })
+
+
+# --------- 任务队列 -----------
+
+def handle_job_event(kind, job_id, payload):
+    """任务子进程发回的事件（在任务管理器的事件线程中调用），进度交给 PROGRESS_HUB 合并后推送到该任务的房间"""
+    if kind == EVENT_STARTED:
+        PROGRESS_HUB.job_started(job_id)
+    elif kind == EVENT_PROGRESS:
+        PROGRESS_HUB.update(job_id, payload)
+    elif kind == EVENT_DONE:
+        PROGRESS_HUB.finish(job_id, "process_done", {
+            "job_id": job_id,
+            "status": "完成",
+            "download_url": url_for_job_download(job_id),
+            "llm_report": payload.get("llm_report")
         })
-        socketio.sleep(0)
-    try:
-        # 假设处理函数返回输出文件路径
-        output_file_path = process_word_documents(
-            input_dir=input_dir,
-            output_root=output_dir,
-            log_root_dir="log",
-            days_to_keep=days,
-            module_config_file=module_config,
-            progress_callback=progress_callback
-        )
-        stop_flag["stop"] = True
-        now = time.time()
-        step_elapsed = 0
-        if current_step_state["start_time"] is not None:
-            step_elapsed = now - current_step_state["start_time"]
+    elif kind == EVENT_FAILED:
+        PROGRESS_HUB.finish(job_id, "process_error", {"job_id": job_id, "status": "失败", "error": payload["error"]})
+
+
+PROGRESS_HUB = ProgressHub(lambda event, data, room: socketio.emit(event, data, to=room),
+                           max_rate=PROGRESS_MAX_RATE)
+JOB_MANAGER = JobManager(JOBS_ROOT, max_workers=MAX_JOB_WORKERS, on_event=handle_job_event)
+
+
+@app.before_request
+def ensure_job_workers():
+    """
+    收到第一个请求时启动任务管理器和进度推送线程（只启动一次），同时恢复上次退出时排队中的任务。
+    不在导入时启动：任务子进程以spawn方式启动时会重新导入本模块，调试模式的重载监控进程也不处理请求。
+    """
+    with JOB_WORKERS_LOCK:
+        if job_workers_state["started"]:
+            return
+        job_workers_state["started"] = True
+    PROGRESS_HUB.start()
+    JOB_MANAGER.start()
+
+
+def url_for_job_download(job_id):
+    return f"/jobs/{urllib.parse.quote(job_id)}/download"
+
+
+def get_job_or_abort(job_id):
+    """返回当前用户可以查看的任务记录：管理员可查看所有任务，其他用户只能查看自己提交的任务"""
+    job = JOB_MANAGER.get(job_id)
+    if job is None:
+        abort(404, "任务不存在")
+    if current_user.role != "admin" and job["owner"] != current_user.id:
+        abort(403, "无权查看该任务")
+    return job
+
+
+def format_timestamp(value):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(value)) if value else None
+
+
+def job_summary(job):
+    """任务记录 -> 接口返回内容（不含输入输出目录等服务器路径）"""
+    return {
+        "job_id": job["id"],
+        "owner": job["owner"],
+        "status": job["status"],
+        "created": format_timestamp(job["created"]),
+        "started": format_timestamp(job["started"]),
+        "finished": format_timestamp(job["finished"]),
+        "progress": job["progress"],
+        "error": job["error"],
+        "queue_position": JOB_MANAGER.queue_position(job["id"]),
+        "download_url": url_for_job_download(job["id"]) if job["status"] == STATUS_DONE else None,
+        "resumable": job["status"] in RESUMABLE_STATUSES,
+    }
+
+
+@app.route("/jobs", methods=["GET"])
+@login_required
+def list_jobs():
+    owner = None if current_user.role == "admin" else current_user.id
+    limit = request.args.get("limit", 50, type=int)
+    return jsonify({"jobs": [job_summary(job) for job in JOB_MANAGER.list(owner=owner, limit=limit)]})
 
-        # 拼接可供下载的URL，注意做URL编码
-        safe_path = urllib.parse.quote(output_file_path)
-        download_url = f"/download?file_path={safe_path}"
 
-        socketio.emit("process_done", {
+@app.route("/jobs/<job_id>", methods=["GET"])
+@login_required
+def job_status(job_id):
+    job = get_job_or_abort(job_id)
+    data = job_summary(job)
+    data["llm_report"] = job["llm_report"]
+    # 各步骤的完成情况（断点记录）
+    checkpoint = load_checkpoint(JOB_MANAGER.output_dir(job_id))
+    data["checkpoint"] = {
+        "resumed": checkpoint.get("resumed", 0),
+        "current_step": checkpoint.get("current_step"),
+        "steps": checkpoint.get("steps", {}),
+    } if checkpoint else None
+    return jsonify(data)
+
+
+# --------- 任务进度订阅（Socket.IO 房间） -----------
+
+@socketio.on("join_job")
+def on_join_job(data):
+    """
+    客户端订阅任务进度：加入该任务的房间后只收到该任务的推送；
+    任务运行中时立即补发一次全量进度，已结束时补发结束事件（订阅前任务可能已经结束）。
+    """
+    if not current_user.is_authenticated:
+        return {"status": "error", "message": "请先登录"}
+    job_id = (data or {}).get("job_id")
+    job = JOB_MANAGER.get(job_id) if job_id else None
+    if job is None:
+        return {"status": "error", "message": "任务不存在"}
+    if current_user.role != "admin" and job["owner"] != current_user.id:
+        return {"status": "error", "message": "无权查看该任务"}
+    join_room(job_room(job_id))
+
+    snapshot = PROGRESS_HUB.snapshot(job_id)
+    if snapshot is not None:
+        emit("progress_update", snapshot)
+    elif job["status"] == STATUS_DONE:
+        emit("process_done", {
+            "job_id": job_id,
             "status": "完成",
-            "total_elapsed": format_seconds_to_hms(now - total_start_time),
-            "download_url": download_url  # 新增
+            "download_url": url_for_job_download(job_id),
+            "llm_report": job["llm_report"]
         })
-    except Exception as e:
-        stop_flag["stop"] = True
-        logging.exception("处理异常:")
-        socketio.emit("process_error", {"status": "失败", "error": str(e)})
+    elif job["status"] in RESUMABLE_STATUSES:
+        emit("process_error", {"job_id": job_id, "status": "失败", "error": job["error"]})
+    return {"status": "ok", "job_status": job["status"], "queue_position": JOB_MANAGER.queue_position(job_id)}
+
+
+@socketio.on("leave_job")
+def on_leave_job(data):
+    job_id = (data or {}).get("job_id")
+    if job_id:
+        leave_room(job_room(job_id))
 
-@app.route('/download', methods=['GET'])
+
+@app.route("/resume/<job_id>", methods=["POST"])
 @login_required
-def download_result_file():
-    file_path = request.args.get('file_path')
-    if not file_path:
-        return abort(400, '缺少文件路径参数')
-    # 仅允许下载 output_dir 下文件，防止任意路径下载
-    abs_output_dir = os.path.abspath(os.path.join(os.getcwd(), "default_output"))
-    abs_file_path = os.path.abspath(file_path)
-    if not abs_file_path.startswith(abs_output_dir):
-        return abort(403, '非法访问')
+def resume_job(job_id):
+    """失败或中断的任务从断点继续，已完成的摘要、合并等结果和大模型回复直接沿用"""
+    if current_user.role != 'admin':
+        return jsonify({"status": "error", "message": "没有权限操作"}), 403
+    get_job_or_abort(job_id)
+    try:
+        job = JOB_MANAGER.resume(job_id)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
 
+    USERS[current_user.id].setdefault("usage_log", []).append(
+        {"event": "resume_process", "job_id": job_id, "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+    )
+    save_users(USERS)
+    return jsonify({
+        "status": "started",
+        "job_id": job_id,
+        "job_status": job["status"],
+        "queue_position": JOB_MANAGER.queue_position(job_id),
+    })
+
+
+@app.route("/jobs/<job_id>/download", methods=["GET"])
+@login_required
+def download_job_result(job_id):
+    job = get_job_or_abort(job_id)
+    if job["status"] != STATUS_DONE or not job["result_path"]:
+        return abort(409, "任务尚未完成")
+    # 只允许下载该任务输出目录下的文件
+    abs_output_dir = os.path.abspath(JOB_MANAGER.output_dir(job_id))
+    abs_file_path = os.path.abspath(job["result_path"])
+    if not abs_file_path.startswith(abs_output_dir + os.sep):
+        return abort(403, '非法访问')
     if not os.path.isfile(abs_file_path):
         return abort(404, "文件不存在")
 
-    # 生成一个不重复的文件名，比如加上时间戳或用户id
     ext = os.path.splitext(abs_file_path)[1]
     basename = os.path.splitext(os.path.basename(abs_file_path))[0]
-    import time
-    import random
-    # 例如：result_用户名_20240610_143012.docx
-    safe_user = current_user.username if hasattr(current_user, "username") else f"user{current_user.id}"
-    timestamp = time.strftime("%Y%m%d_%H%M%S")
-    random_part = random.randint(1000, 9999)
-    download_name = f"{basename}_{safe_user}_{timestamp}_{random_part}{ext}"
-
-    # Flask 2.0+: use download_name, old Flask use attachment_filename
+    download_name = f"{basename}_{job_id}{ext}"
     return send_file(abs_file_path, as_attachment=True, download_name=download_name)
 
+@app.route("/download", methods=["GET"])
+@login_required
+def download_result_file():
+    """旧的下载入口：转到当前用户最近完成的任务的下载地址"""
+    jobs = JOB_MANAGER.list(owner=current_user.id, status=STATUS_DONE, limit=None)
+    if not jobs:
+        return abort(404, "没有已完成的任务")
+    latest = max(jobs, key=lambda job: job["finished"] or 0)
+    return redirect(url_for_job_download(latest["id"]))
+
+
 if __name__ == "__main__":
     socketio.run(app, host="0.0.0.0", port=5000, debug=True)
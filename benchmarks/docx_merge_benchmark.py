@@ -0,0 +1,159 @@
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from docx import Document
+
+from TxtoWord.md_render import RENDERER_NATIVE, RENDERER_PANDOC
+from TxtoWord.txt_to_word import MERGE_COPY, MERGE_XML, process_and_merge_all_files
+
+# 最终Word合并的基准：生成约 --pages 页的模块文档，对比逐段逐run复制（copy，原实现）与按元素批量追加（xml）
+# 生成 merged.docx 的耗时，并校验两者的段落样式和文字一致。
+# 用法：python -m benchmarks.docx_merge_benchmark --pages 500 --modules 20 --source docx
+
+# 按宋体小四、1.25倍行距的A4页面估算每页字数
+CHARS_PER_PAGE = 1000
+
+SENTENCES = [
+    "本项目围绕传统机械行业的智能化转型开展研究",
+    "构建覆盖设计、制造、运维全流程的多模态知识图谱",
+    "通过大模型对设备运行数据和维修记录进行统一表示",
+    "形成可推广、可复制的行业应用示范",
+    "关键技术包括多源异构数据融合与故障诊断推理",
+    "项目团队在相关领域具有长期的研究积累",
+]
+EMPHASIS = ["关键技术", "预期成果", "创新点", "技术路线"]
+
+
+def make_paragraph(rng):
+    """返回 [(文字, 是否加粗)]，约200字，夹杂加粗的短语"""
+    runs = []
+    length = 0
+    while length < 200:
+        if rng.random() < 0.2:
+            text = rng.choice(EMPHASIS)
+            runs.append((text, True))
+        else:
+            text = rng.choice(SENTENCES) + rng.choice(["，", "；", "。"])
+            runs.append((text, False))
+        length += len(text)
+    return runs
+
+
+def make_modules(n_pages, n_modules, seed=0):
+    """生成各模块内容：[(模块名, [(样式, [(文字, 是否加粗)])])]，正文总字数约为 n_pages 页"""
+    rng = random.Random(seed)
+    per_module = n_pages * CHARS_PER_PAGE // n_modules
+    modules = []
+    for idx in range(1, n_modules + 1):
+        name = f"{idx:02d}模块{idx}"
+        # Heading 6 不在 STYLES_CONFIG 中，检查两种方式都保留模板自带的标题样式
+        paragraphs = [("Heading 1", [(f"{idx}. 模块{idx}", False)]), ("Heading 6", [(f"模块{idx}说明", False)])]
+        length = 0
+        section = 0
+        while length < per_module:
+            if length // 2000 >= section:
+                section += 1
+                paragraphs.append(("Heading 2", [(f"{idx}.{section} 研究内容{section}", False)]))
+            runs = make_paragraph(rng)
+            paragraphs.append(("Body Text", runs))
+            length += sum(len(text) for text, _ in runs)
+        modules.append((name, paragraphs))
+    return modules
+
+
+def write_docx_modules(folder_path, modules):
+    """各模块写成 word_files 下的docx（pandoc 方式的合并输入）"""
+    word_folder = os.path.join(folder_path, "merging_files", "word_files")
+    os.makedirs(word_folder, exist_ok=True)
+    for name, paragraphs in modules:
+        doc = Document()
+        for style, runs in paragraphs:
+            p = doc.add_paragraph(style=style)
+            for text, bold in runs:
+                p.add_run(text).bold = bold or None
+        doc.save(os.path.join(word_folder, f"{name}.docx"))
+
+
+def write_md_modules(folder_path, modules):
+    """各模块写成 reformat_tilte 下的md（原生渲染的合并输入）"""
+    merging_path = os.path.join(folder_path, "merging_files")
+    os.makedirs(os.path.join(merging_path, "reformat_tilte"), exist_ok=True)
+    os.makedirs(os.path.join(merging_path, "word_files"), exist_ok=True)
+    for name, paragraphs in modules:
+        os.makedirs(os.path.join(merging_path, name), exist_ok=True)
+        lines = []
+        for style, runs in paragraphs:
+            text = "".join(f"**{t}**" if bold else t for t, bold in runs)
+            if style.startswith("Heading"):
+                text = "#" * int(style.split()[-1]) + " " + text
+            lines.extend([text, ""])
+        with open(os.path.join(merging_path, "reformat_tilte", f"{name}.md"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+
+
+def paragraph_texts(docx_path):
+    return [(p.style.name, p.text) for p in Document(docx_path).paragraphs]
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="最终Word合并基准")
+    parser.add_argument("--pages", type=int, default=500, help="合并输出的页数（按每页约1000字估算）")
+    parser.add_argument("--modules", type=int, default=20, help="模块数")
+    parser.add_argument("--source", choices=["docx", "md"], default="docx",
+                        help="合并输入：docx 为pandoc转换的各模块docx，md 为原生渲染的各模块md")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最短耗时")
+    args = parser.parse_args()
+
+    modules = make_modules(args.pages, args.modules)
+    folder_path = tempfile.mkdtemp(prefix="docx_merge_bench_")
+    try:
+        if args.source == "docx":
+            write_docx_modules(folder_path, modules)
+            renderer = RENDERER_PANDOC
+        else:
+            write_md_modules(folder_path, modules)
+            renderer = RENDERER_NATIVE
+
+        outputs = {}
+        timings = {}
+        for mode in (MERGE_COPY, MERGE_XML):
+            merged_filename = f"merged_{mode}.docx"
+
+            def run():
+                process_and_merge_all_files(folder_path, merged_filename, renderer=renderer, merge_mode=mode)
+
+            timings[mode] = best_time(run, args.repeat)
+            outputs[mode] = paragraph_texts(os.path.join(folder_path, "merging_files", "word_files", merged_filename))
+            # 下一种方式不应把本次输出当作模块合并进去
+            os.rename(os.path.join(folder_path, "merging_files", "word_files", merged_filename),
+                      os.path.join(folder_path, f"merged_{mode}.docx"))
+
+        if outputs[MERGE_COPY] != outputs[MERGE_XML]:
+            raise SystemExit("两种合并方式的段落样式或文字不一致")
+
+        n_chars = sum(len(text) for _, text in outputs[MERGE_XML])
+        print(f"模块 {len(modules)} 个（{args.source}），段落 {len(outputs[MERGE_XML])} 个，"
+              f"约 {n_chars / CHARS_PER_PAGE:.0f} 页，段落样式和文字一致")
+        print(f"逐段逐run复制（原实现）: {timings[MERGE_COPY] * 1000:.0f} ms")
+        print(f"按元素批量追加:         {timings[MERGE_XML] * 1000:.0f} ms")
+        print(f"加速: {timings[MERGE_COPY] / timings[MERGE_XML]:.1f}x")
+    finally:
+        shutil.rmtree(folder_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
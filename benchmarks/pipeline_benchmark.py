@@ -0,0 +1,229 @@
+import argparse
+import glob
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from docx import Document
+
+import Module_merge.merge as module_merge
+from file_merge_pipeline import process_word_documents
+from SummaryExtract.llm_client import configure_client
+from SummaryExtract.model_call import MockLLMServer
+from TxtoWord.md_render import DEFAULT_RENDERER, RENDERER_NATIVE, RENDERER_PANDOC
+
+# 用本地模拟大模型服务跑完整流程，统计各步骤耗时、大模型调用次数和token数，不产生接口费用。
+# 用法：python -m benchmarks.pipeline_benchmark --docs 10 --latency 0.5 --token-rate 50 --dag
+
+MODULE_TITLES = ["研究背景", "研究目的", "研究内容", "关键技术", "实施方案"]
+SENTENCE = "本项目围绕机械行业智能化转型开展研究，形成可推广的技术方案与应用示范。"
+
+
+def make_synthetic_inputs(input_dir, n_docs=3, sections=3, subsections=2, paragraphs=3, seed=0):
+    """
+    在 input_dir 下生成 n_docs 个模拟申请书和 module_config.json，返回模块配置文件路径。
+    每个文档首段为项目名，按 MODULE_TITLES 分模块，模块下为“X.Y”二级标题和“X.Y.Z”三级标题。
+    """
+    rng = random.Random(seed)
+    os.makedirs(input_dir, exist_ok=True)
+    for doc_idx in range(1, n_docs + 1):
+        doc = Document()
+        doc.add_paragraph(f"模拟项目{doc_idx:03d}申请书")
+        for mod_idx, module in enumerate(MODULE_TITLES, start=1):
+            doc.add_paragraph(f"#{module}")
+            doc.add_paragraph(SENTENCE * rng.randint(1, paragraphs))
+            for sec in range(1, sections + 1):
+                doc.add_paragraph(f"{mod_idx}.{sec} {module}第{sec}部分")
+                doc.add_paragraph(SENTENCE * rng.randint(1, paragraphs))
+                for sub in range(1, subsections + 1):
+                    doc.add_paragraph(f"{mod_idx}.{sec}.{sub} {module}第{sec}部分要点{sub}")
+                    for _ in range(paragraphs):
+                        doc.add_paragraph(SENTENCE * rng.randint(1, paragraphs))
+        doc.save(os.path.join(input_dir, f"project_{doc_idx:03d}.docx"))
+
+    config_path = os.path.join(input_dir, "module_config.json")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump({"module_titles": MODULE_TITLES}, f, ensure_ascii=False, indent=2)
+    return config_path
+
+
+def run_benchmark(work_dir, n_docs=3, latency=0.0, token_rate=0, error_rate=0.0, tokens=200,
+                  max_concurrency=8, use_dag=False, pool_sizes=None, in_memory=False, section_db=False,
+                  enable_summary=True, enable_restructure=True, seed=0, profile=False, profile_step=None,
+                  profile_mode="cprofile", word_renderer=DEFAULT_RENDERER, incremental=False,
+                  checkpoint=False, resume=False, fail_merge_call=None):
+    """
+    在 work_dir 下生成输入并运行一次全流程，返回统计结果字典。
+    work_dir 下已有输入时直接沿用（便于 incremental=True 或 resume=True 时在同一目录重复运行）。
+    fail_merge_call 为第几次章节合并调用抛出异常（从1开始），用于模拟单个章节合并失败后断点续跑。
+    """
+    input_dir = os.path.join(work_dir, "input")
+    output_dir = os.path.join(work_dir, "output")
+    log_dir = os.path.join(work_dir, "log")
+    module_config = os.path.join(input_dir, "module_config.json")
+    if not os.path.isfile(module_config):
+        module_config = make_synthetic_inputs(input_dir, n_docs=n_docs, seed=seed)
+
+    steps = []
+
+    def progress_callback(percent, current_step_name=None, current_step_elapsed=None, history=None):
+        if history is not None:
+            steps[:] = history
+
+    result = {"docs": n_docs, "use_dag": use_dag, "in_memory": in_memory, "section_db": section_db,
+              "word_renderer": word_renderer, "incremental": incremental, "error": None}
+
+    with MockLLMServer(latency=latency, token_rate=token_rate, error_rate=error_rate, tokens=tokens,
+                       seed=seed) as server:
+        api_config = os.path.join(work_dir, "api_config.json")
+        with open(api_config, "w", encoding="utf-8") as f:
+            # 压测时关闭回复缓存，每次运行都真实请求模拟服务
+            json.dump({"api_key": "mock", "base_url": server.base_url, "cache_path": None}, f)
+        client = configure_client(config_file=api_config, max_concurrency=max_concurrency)
+
+        chat = module_merge.chat
+        if fail_merge_call:
+            lock = threading.Lock()
+            calls = [0]
+
+            def flaky_chat(*args, **kwargs):
+                with lock:
+                    calls[0] += 1
+                    failed = calls[0] == fail_merge_call
+                if failed:
+                    raise RuntimeError(f"模拟第 {fail_merge_call} 次章节合并失败")
+                return chat(*args, **kwargs)
+
+            module_merge.chat = flaky_chat
+
+        start = time.time()
+        try:
+            result["output"] = process_word_documents(
+                input_dir, output_dir, log_root_dir=log_dir,
+                module_config_file=module_config, progress_callback=progress_callback,
+                use_dag=use_dag, pool_sizes=pool_sizes, in_memory=in_memory, section_db=section_db,
+                enable_summary=enable_summary, enable_restructure=enable_restructure,
+                profile=profile, profile_step=profile_step, profile_mode=profile_mode,
+                word_renderer=word_renderer, incremental=incremental, checkpoint=checkpoint, resume=resume)
+        except Exception as e:
+            # 例如未安装pandoc时最后一步失败，已完成步骤的统计仍然有效
+            result["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            module_merge.chat = chat
+        result["total_time"] = time.time() - start
+        result["llm"] = server.stats()
+        client.close()
+
+    result["steps"] = [{"name": h["name"], "time": h["time"]} for h in steps]
+    if profile or profile_step:
+        # 本次运行的资源统计（Pipeline.profiler），保存在日志目录中最新的 *.profile.json
+        reports = sorted(glob.glob(os.path.join(log_dir, "**", "*.profile.json"), recursive=True),
+                         key=os.path.getmtime)
+        if reports:
+            with open(reports[-1], encoding="utf-8") as f:
+                result["profile"] = json.load(f)
+            result["profile"]["path"] = reports[-1]
+    return result
+
+
+def print_report(result):
+    print(f"文档数: {result['docs']}，依赖图模式: {result['use_dag']}，内存模式: {result['in_memory']}，"
+          f"章节数据库: {result['section_db']}，Word生成方式: {result['word_renderer']}")
+    print(f"{'步骤':<20}{'耗时(秒)':>10}")
+    for step in result["steps"]:
+        print(f"{step['name']:<20}{step['time']:>10.2f}")
+    print(f"{'总计':<20}{result['total_time']:>10.2f}")
+    llm = result["llm"]
+    print(f"大模型请求 {llm['requests']} 次（错误 {llm['errors']} 次），"
+          f"输入约 {llm['prompt_tokens']} tokens，输出约 {llm['completion_tokens']} tokens，"
+          f"按任务: {llm['by_task']}")
+    if result["total_time"] > 0:
+        print(f"输出吞吐: {llm['completion_tokens'] / result['total_time']:.1f} tokens/s")
+    if result.get("profile"):
+        print(f"{'步骤':<20}{'CPU(秒)':>10}{'峰值内存(MB)':>14}{'读(MB)':>10}{'写(MB)':>10}{'写入文件':>10}{'GC停顿(毫秒)':>14}")
+        mb = 1024 * 1024
+        for step in result["profile"]["steps"]:
+            print(f"{step['step']:<20}{step['cpu'] + step['children_cpu']:>10.2f}"
+                  f"{(step['rss_peak'] or 0) / mb:>14.1f}{(step['bytes_read'] or 0) / mb:>10.1f}"
+                  f"{(step['bytes_written'] or 0) / mb:>10.1f}{step['files_written']:>10}"
+                  f"{step['gc_pause_total'] * 1000:>14.1f}")
+        print(f"资源统计: {result['profile']['path']}")
+    if result["error"]:
+        print(f"流程异常: {result['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用本地模拟大模型服务测试全流程吞吐量")
+    parser.add_argument("--docs", type=int, default=3, help="生成的模拟文档数")
+    parser.add_argument("--latency", type=float, default=0.2, help="模拟服务首个token前的等待时间（秒）")
+    parser.add_argument("--token-rate", type=float, default=0, help="模拟服务每秒输出token数，0为不限速")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务返回500错误的概率")
+    parser.add_argument("--tokens", type=int, default=200, help="每个回复的大致token数")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="大模型客户端最大并发数")
+    parser.add_argument("--dag", action="store_true", help="按任务依赖图调度")
+    parser.add_argument("--memory", action="store_true", help="中间json在内存中传递")
+    parser.add_argument("--section-db", action="store_true", help="中间json保存在章节数据库中")
+    parser.add_argument("--no-summary", action="store_true", help="跳过摘要提取")
+    parser.add_argument("--no-restructure", action="store_true", help="跳过标题重组")
+    parser.add_argument("--work-dir", default=None, help="工作目录，默认使用临时目录并在结束后删除")
+    parser.add_argument("--json", default=None, help="把统计结果写入该json文件")
+    parser.add_argument("--profile", action="store_true", help="统计各步骤的CPU时间、内存峰值、读写字节数等资源占用")
+    parser.add_argument("--profile-step", default=None, help="对该步骤做函数级分析，如 文档切分（依赖图模式下为整个调度过程）")
+    parser.add_argument("--profile-mode", choices=["cprofile", "sample"], default="cprofile",
+                        help="函数级分析方式：cprofile 或 sample（采样所有线程）")
+    parser.add_argument("--rerun-check", action="store_true",
+                        help="启用任务清单运行两次，检查输入未变化的第二次运行不再请求大模型")
+    parser.add_argument("--resume-check", action="store_true",
+                        help="首次运行让一次章节合并失败，检查断点续跑只重新请求这一次合并")
+    parser.add_argument("--word-renderer", choices=[RENDERER_NATIVE, RENDERER_PANDOC], default=DEFAULT_RENDERER,
+                        help="最终Word文档的生成方式：native（直接写入合并文档）或 pandoc（每个模块转换为docx）")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="pipeline_bench_")
+
+    def run(**kwargs):
+        return run_benchmark(work_dir, n_docs=args.docs, latency=args.latency, token_rate=args.token_rate,
+                             error_rate=args.error_rate, tokens=args.tokens,
+                             max_concurrency=args.max_concurrency, use_dag=args.dag, in_memory=args.memory,
+                             section_db=args.section_db,
+                             enable_summary=not args.no_summary, enable_restructure=not args.no_restructure,
+                             profile=args.profile, profile_step=args.profile_step,
+                             profile_mode=args.profile_mode, word_renderer=args.word_renderer,
+                             incremental=args.rerun_check, **kwargs)
+
+    try:
+        if args.resume_check:
+            first = run(checkpoint=True, fail_merge_call=3)
+            print_report(first)
+            if first["error"] is None:
+                raise SystemExit("章节合并失败时流程没有抛出异常")
+            result = run(resume=True)
+        else:
+            result = run()
+        if args.rerun_check:
+            print_report(result)
+            result = run()
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(result)
+    if args.rerun_check:
+        if result["llm"]["requests"]:
+            raise SystemExit(f"输入未变化的第二次运行仍请求大模型 {result['llm']['requests']} 次")
+        print("输入未变化的第二次运行没有请求大模型")
+    if args.resume_check:
+        if result["llm"]["requests"] != 1:
+            raise SystemExit(f"断点续跑请求大模型 {result['llm']['requests']} 次，应只重新请求失败的1次章节合并")
+        print("断点续跑只重新请求了失败的章节合并")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import argparse
+import glob
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from TxtoWord.title_fromat import reformat_titles
+
+# 标题重编号的回归与基准：以 default_output/merging_files/*/merged.txt 为样本，加上各种标题写法的边界情况，
+# 校验逐行流式实现（reformat_titles）与原实现的输出逐字节一致，再把样本放大后对比两者耗时。
+# 用法：python -m benchmarks.reformat_titles_benchmark --scale 200
+
+SAMPLE_GLOB = os.path.join("default_output", "merging_files", "*", "merged.txt")
+
+# 边界情况：缩进和全角空格开头的标题、层级跳跃和回退、各种原编号、空标题、代码块标记、CRLF换行、结尾没有换行
+EDGE_CASES = {
+    "9_层级跳跃": "# 总体\n#### 跳到四级\n## 回到二级\n### 三级\n### 三级\n# 再次一级\n",
+    "2_原编号": ("# 1.2.3. 数字加点\n## 1.2 数字点数字\n## (1) 半角括号\n## （2）全角括号\n"
+                "## 3) 半角右括号\n## 4）全角右括号\n## 5 数字空格\n## 1. (2) 3) 4 多重编号\n"
+                "## １．全角数字\n## 2024年计划\n## (注) 括号文字\n"),
+    "3_空白": "  # 缩进标题\n\u3000## 全角空格\n#\n## \n##\t制表符\n正文 # 不是标题\n\n   \n",
+    "4_代码块": "```python\n# 代码里的注释\n   ```\n正文\n```\n",
+    "5_换行": "# 标题一\r\n正文\r\n## 标题二\r\n最后一行没有换行",
+    "10_两位编号": "# 标题\n## 子标题\n",
+}
+
+
+def legacy_reformat_titles(file_path, title_str, output_md_path):
+    """
+    原先的实现：整个文件读入列表，生成两份修改后的副本，每行多次调用未编译的正则。
+
+    1. 删除txt文件中所有以```开头的行。
+    2. 文件中所有以#开头的行前面再加一个#。
+    3. 在文件开头插入一行内容，如 "# 1 研究背景"，然后添加一个空行。
+    4. 基于传入字符串开头的数字，对标题进行重新编号（遍历全文）。
+    5. 结果输出到指定的md文件。
+
+    :param file_path: 要处理的文件路径
+    :param title_str: 类似 "1_研究背景"，数字和标题用下划线或空格分隔
+    :param output_md_path: 输出的md文件路径，必须指定
+    """
+
+    # 解析传入字符串
+    match = re.match(r"(\d+)[_ ](.+)", title_str)
+    if not match:
+        raise ValueError("title_str格式错误，应为类似 '1_研究背景' 或 '1 研究背景'")
+    root_num = match.group(1)
+    root_title = match.group(2)
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+
+    # 删除以```开头的行（去除前后空白判断）
+    lines = [line for line in lines if not line.lstrip().startswith('```')]
+
+    # 为所有以#开头的行前加一个#
+    def add_extra_hash(line):
+        if line.lstrip().startswith('#'):
+            prefix_ws = re.match(r'^\s*', line).group(0)
+            hashes = re.match(r'^\s*(#+)', line).group(1)
+            rest = line.lstrip()[len(hashes):]
+            new_hashes = '#' + hashes
+            return prefix_ws + new_hashes + rest
+        else:
+            return line
+
+    lines = [add_extra_hash(line) for line in lines]
+
+    # 在开头插入 "# {root_num} {root_title}" 和一个空行
+    insert_title_line = f"# {root_num} {root_title}\n"
+    lines.insert(0, insert_title_line)
+    lines.insert(1, "\n")
+
+    numbering = [int(root_num)]
+    last_level = 1
+
+    def clean_title_text(text):
+    # 数字+点，如 1.2.3.
+        text = re.sub(r'^\s*(\d+(\.\d+)*\.)\s*', '', text)
+
+        # 括号包数字，如 (1) 、（1）
+        text = re.sub(r'^\s*[\(\（](\d+)[\)\）]\s*', '', text)
+
+        # 数字加右括号，如 1) 1）
+        text = re.sub(r'^\s*(\d+)[\)\）]\s*', '', text)
+
+        # 纯数字加空格，如 "1 "
+        text = re.sub(r'^\s*\d+\s+', '', text)
+
+        return text.lstrip()
+
+
+    new_lines = []
+
+    for line in lines:
+        match = re.match(r'^(\s*)(#+)(\s*)(.*)', line)
+        if match:
+            prefix_ws, hashes, space_after_hashes, content = match.groups()
+            level = len(hashes)
+
+            if level == 1:
+                # 一级标题保持传入的编号和标题
+                if line.strip() == insert_title_line.strip():
+                    new_lines.append(line)
+                    numbering = [int(root_num)]
+                    last_level = level
+                    continue
+                else:
+                    numbering = [int(root_num)]
+                    last_level = level
+                    title_text = clean_title_text(content)
+                    new_line = f"{prefix_ws}# {root_num} {title_text}\n"
+                    new_lines.append(new_line)
+                    continue
+
+            if level > last_level:
+                for _ in range(level - last_level):
+                    numbering.append(1)
+            elif level == last_level:
+                numbering[-1] += 1
+            else:
+                for _ in range(last_level - level):
+                    numbering.pop()
+                numbering[-1] += 1
+
+            last_level = level
+
+            title_text = clean_title_text(content)
+            numbering_str = '.'.join(str(num) for num in numbering)
+
+            new_line = f"{prefix_ws}{hashes} {numbering_str} {title_text}\n"
+            new_lines.append(new_line)
+        else:
+            new_lines.append(line)
+
+    with open(output_md_path, 'w', encoding='utf-8') as f:
+        f.writelines(new_lines)
+
+
+def load_corpus(scale=1):
+    """回归样本：[(title_str, 文本)]，样本文件的 title_str 取所在模块文件夹名，scale>1 时每个样本重复 scale 次"""
+    corpus = []
+    for path in sorted(glob.glob(SAMPLE_GLOB)):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            corpus.append((os.path.basename(os.path.dirname(path)), f.read()))
+    corpus.extend(EDGE_CASES.items())
+    if scale > 1:
+        corpus = [(title_str, text if text.endswith("\n") else text + "\n") for title_str, text in corpus]
+        corpus = [(title_str, text * scale) for title_str, text in corpus]
+    return corpus
+
+
+def write_inputs(folder, corpus):
+    paths = []
+    for idx, (title_str, text) in enumerate(corpus):
+        path = os.path.join(folder, f"{idx}.txt")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        paths.append((title_str, path))
+    return paths
+
+
+def run_all(func, inputs, output_folder):
+    outputs = []
+    for idx, (title_str, path) in enumerate(inputs):
+        output_path = os.path.join(output_folder, f"{idx}.md")
+        func(path, title_str, output_path)
+        outputs.append(output_path)
+    return outputs
+
+
+def read_bytes(paths):
+    result = []
+    for path in paths:
+        with open(path, "rb") as f:
+            result.append(f.read())
+    return result
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def check_regression(folder):
+    """逐个样本对比两种实现的输出，返回样本数"""
+    inputs = write_inputs(os.path.join(folder, "regression"), load_corpus())
+    for name in ("legacy", "stream"):
+        os.makedirs(os.path.join(folder, "regression", name))
+    expected = read_bytes(run_all(legacy_reformat_titles, inputs, os.path.join(folder, "regression", "legacy")))
+    actual = read_bytes(run_all(reformat_titles, inputs, os.path.join(folder, "regression", "stream")))
+    for (title_str, path), old, new in zip(inputs, expected, actual):
+        if old != new:
+            raise SystemExit(f"样本 {title_str}（{path}）的输出与原实现不一致")
+    return len(inputs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="标题重编号回归与基准")
+    parser.add_argument("--scale", type=int, default=200, help="基准测试时每个样本重复的次数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最短耗时")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="reformat_titles_bench_")
+    try:
+        os.makedirs(os.path.join(folder, "regression"))
+        n_samples = check_regression(folder)
+        print(f"回归样本 {n_samples} 个（{SAMPLE_GLOB} 及边界情况），输出与原实现一致")
+
+        bench_folder = os.path.join(folder, "bench")
+        os.makedirs(bench_folder)
+        inputs = write_inputs(bench_folder, load_corpus(args.scale))
+        n_lines = 0
+        for _, path in inputs:
+            with open(path, "r", encoding="utf-8") as f:
+                n_lines += sum(1 for _ in f)
+
+        legacy = best_time(lambda: run_all(legacy_reformat_titles, inputs, bench_folder), args.repeat)
+        stream = best_time(lambda: run_all(reformat_titles, inputs, bench_folder), args.repeat)
+        print(f"基准：样本重复 {args.scale} 次，共 {n_lines} 行")
+        print(f"整文件读入、逐行未编译正则（原实现）: {legacy * 1000:.1f} ms")
+        print(f"逐行流式、预编译正则:               {stream * 1000:.1f} ms")
+        print(f"加速: {legacy / stream:.1f}x")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import random
+import re
+import time
+
+from FilePreProcess.text_splitter import add_numbering_to_titles, split_text_by_modules
+
+# 模块标题匹配的微基准：对比逐行正则匹配（原实现）与预编译字典树匹配的耗时，并校验两者输出一致。
+# 用法：python -m benchmarks.title_matcher_benchmark --lines 20000 --modules 40
+
+
+def legacy_split_text_by_modules(text, module_titles):
+    """原先的实现：每行先跑一次所有模块名的交替正则，命中后再逐个模块重新构造正则匹配"""
+    if not text:
+        return {}
+
+    if not module_titles:
+        return {"全文": text.strip()}
+
+    if not re.match(r"^\s*\d+[\.\、\)]?\s+", module_titles[0]):
+        module_titles = add_numbering_to_titles(module_titles)
+
+    pattern_parts = []
+    for title in module_titles:
+        m = re.match(r"^(\d+)([\.\、\)]?)\s*(.+)$", title)
+        if m:
+            num, sep, mod_name = m.groups()
+            title_pattern = rf"^(?:.*){re.escape(mod_name)}\s*$"
+        else:
+            title_pattern = rf"^(?:.*){re.escape(title)}\s*$"
+        pattern_parts.append(title_pattern)
+
+    titles_pattern = "|".join(pattern_parts)
+
+    lines = text.splitlines()
+
+    module_positions = []
+
+    for idx, line in enumerate(lines):
+        if re.match(titles_pattern, line):
+            for title in module_titles:
+                m = re.match(r"^(\d+)[\.\、\)]?\s*(.+)$", title)
+                if m:
+                    _, mod_name = m.groups()
+                    if re.match(rf"^(?:.*){re.escape(mod_name)}\s*$", line):
+                        module_positions.append((idx, title))
+                        break
+
+    if not module_positions:
+        return {"全文": text.strip()}
+
+    modules_content = {}
+    for i, (start_idx, title) in enumerate(module_positions):
+        content_start = start_idx + 1
+        content_end = module_positions[i+1][0] if i + 1 < len(module_positions) else len(lines)
+        content_lines = lines[content_start:content_end]
+        content = "\n".join(content_lines).strip()
+        modules_content[title] = content
+
+    return modules_content
+
+
+def make_module_titles(n_modules):
+    base = ["研究背景", "研究目的", "研究内容", "关键技术", "实施方案", "预期成果", "经费预算", "研究基础"]
+    titles = []
+    for idx in range(n_modules):
+        name = base[idx % len(base)]
+        titles.append(name if idx < len(base) else f"{name}{idx}")
+    return titles
+
+
+def make_document(module_titles, n_lines, seed=0):
+    """生成约 n_lines 行的文档，模块标题行带各种前缀和行尾空白，正文行中也夹杂模块名"""
+    rng = random.Random(seed)
+    prefixes = ["#", "", "一、", "（1）", "第一部分 "]
+    body = ["本项目围绕机械行业智能化转型开展研究。", "3.1 关键技术研究", "3.1.1 研究内容概述",
+            "", "   ", "其中研究内容包括以下几个方面", "形成可推广的实施方案。"]
+    trailing = ["", " ", "\t"]
+    lines = []
+    per_module = max(1, n_lines // max(1, len(module_titles)))
+    for title in module_titles:
+        lines.append(f"{rng.choice(prefixes)}{title}{rng.choice(trailing)}")
+        for _ in range(per_module - 1):
+            lines.append(rng.choice(body))
+    return "\n".join(lines)
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模块标题匹配微基准")
+    parser.add_argument("--lines", type=int, default=20000, help="文档行数")
+    parser.add_argument("--modules", type=int, default=40, help="模块标题数")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数，取最短耗时")
+    args = parser.parse_args()
+
+    module_titles = make_module_titles(args.modules)
+    text = make_document(module_titles, args.lines)
+
+    expected = legacy_split_text_by_modules(text, module_titles)
+    actual = split_text_by_modules(text, module_titles)
+    if expected != actual:
+        raise SystemExit("输出与原实现不一致")
+
+    legacy = best_time(lambda: legacy_split_text_by_modules(text, module_titles), args.repeat)
+    compiled = best_time(lambda: split_text_by_modules(text, module_titles), args.repeat)
+    print(f"文档 {len(text.splitlines())} 行，模块 {len(module_titles)} 个，切分出 {len(actual)} 个模块，输出一致")
+    print(f"逐行正则（原实现）: {legacy * 1000:.1f} ms")
+    print(f"预编译字典树:       {compiled * 1000:.1f} ms")
+    print(f"加速: {legacy / compiled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,11 @@ import os
 from FilePreProcess.utils import load_module_titles
 
 
-def check_module_files(parent_folder: str, config_path: str = "config.json") -> bool:
+def check_module_files(parent_folder: str, config_path: str = "config.json", folders=None) -> bool:
     """
     第一次检查：分割模块文件的完整性和正确性。
     检查parent_folder下每个子文件夹中是否包含全部模块对应的txt文件。
+    folders 为切分得到的项目文件夹名时只检查这些文件夹（不检查 Title、Summary 等流程输出目录）。
     
     1. 获取模块标题列表。
     2. 遍历每个子文件夹：
@@ -18,7 +19,7 @@ def check_module_files(parent_folder: str, config_path: str = "config.json") ->
     module_titles = load_module_titles(config_path)
     all_passed = True
 
-    for entry in os.listdir(parent_folder):
+    for entry in (os.listdir(parent_folder) if folders is None else folders):
         subfolder_path = os.path.join(parent_folder, entry)
         if os.path.isdir(subfolder_path):
             txt_files = [f for f in os.listdir(subfolder_path) if f.endswith('.txt')]
@@ -2,9 +2,8 @@ import logging
 import os
 import time
 
-from TxtoWord.format_check import correct_and_convert_numbered_paragraphs
-from TxtoWord.txt_to_word import process_and_merge_all_files
-from TxtoWord.title_fromat import batch_reformat_titles
+from TxtoWord.txt_to_word import DEFAULT_WORD_WORKERS, render_and_build_final_document
+from TxtoWord.md_render import DEFAULT_RENDERER
 from check_format import check_module_files
 from Module_merge.txt_merge import merge_merged_txts
 from Module_merge.index_create import enrich_all_subfolders
@@ -17,10 +16,45 @@ from SummaryExtract.title_extract import batch_process_txt_files
 from SummaryExtract.format import recursive_process_folder
 from FilePreProcess.utils import setup_logger, get_log_file_path, clean_old_logs
 from FilePreProcess.batch_runner import batch_process_word_files
+from Pipeline.manifest import Manifest
+from SummaryExtract.llm_client import cache_stats, set_reply_journal
+from SummaryExtract.llm_cache import LLMCache
+from SummaryExtract.llm_telemetry import LLMTelemetry, add_call_listener, remove_call_listener
+from Pipeline.json_store import JsonStore
+from Pipeline.section_store import SECTION_DB_NAME, SectionStore
+from Pipeline.profiler import StepProfiler
+from Pipeline.checkpoint import REPLY_DB_NAME, RunCheckpoint
+from Pipeline.dag_runner import CHECKPOINT_STEPS, LLM_TASK_STEPS, MANIFEST_STEPS, run_dag_pipeline
+
+
+# 依赖图模式下资源统计和函数级分析的步骤名
+DAG_PROFILE_STEP = "依赖图调度"
+
+
+def log_llm_cache_stats():
+    stats = cache_stats()
+    if stats:
+        logging.info(f"大模型缓存命中 {stats['hits']} 次，未命中 {stats['misses']} 次，"
+                     f"缓存条目 {stats['entries']} 条，共 {stats['bytes'] / 1024 / 1024:.1f} MB")
+
+
+def finish_checkpoint(run_checkpoint, result_path):
+    """生成了最终文档时把断点记录标记为完成，否则标记为失败，以便从断点继续"""
+    if run_checkpoint is None:
+        return
+    if result_path:
+        run_checkpoint.finish(result_path)
+    else:
+        run_checkpoint.fail("未生成最终Word文档")
 
 
 def process_word_documents(input_dir, output_root, log_root_dir="log", days_to_keep=1,
-                           module_config_file="module_config.json", progress_callback=None):
+                           module_config_file="module_config.json", progress_callback=None,
+                           split_workers=1, incremental=False, use_dag=False, pool_sizes=None,
+                           in_memory=False, debug_json=False, enable_summary=False, enable_restructure=False,
+                           section_db=False, telemetry=None, profile=False, profile_step=None,
+                           profile_mode="cprofile", run_id=None, checkpoint=False, resume=False,
+                           word_renderer=DEFAULT_RENDERER, word_workers=DEFAULT_WORD_WORKERS):
     """
     批量处理Word文档，完成切分、索引提取、摘要、格式化、合并及最终输出Word的全流程。
 
@@ -29,6 +63,34 @@ def process_word_documents(input_dir, output_root, log_root_dir="log", days_to_k
     :param log_root_dir: 日志根目录，默认 "log"
     :param days_to_keep: 保留日志天数，默认1天
     :param module_config_file: 模块配置文件路径，默认 "module_config.json"
+    :param split_workers: 文档切分的进程数，默认1（串行）
+    :param incremental: 是否启用任务清单（output_root/manifest.json），
+                        启用后输入内容未变化的项目/模块直接复用上次的结果
+    :param use_dag: 是否按任务依赖图调度（Pipeline.dag_runner），项目和模块不必等待整个步骤完成即可进入下一步骤
+    :param pool_sizes: 依赖图模式下各资源线程池大小，如 {"cpu": 4, "llm": 4, "pandoc": 2}
+    :param in_memory: 是否在内存中传递 Title/Summary/merging_files 下的中间json，
+                      只在大模型步骤完成后和流程结束时写盘
+    :param debug_json: 内存模式或章节数据库模式下仍然每次保存都写盘，便于调试查看中间结果
+    :param enable_summary: 是否调用大模型提取摘要，默认沿用 output_root/Summary 下已有的摘要
+    :param enable_restructure: 是否调用大模型重组标题，默认沿用已有的 restructured_outline.txt
+    :param section_db: 是否用 output_root/sections.sqlite3（Pipeline.section_store）代替中间json文件，
+                       需要查看json时运行 python -m Pipeline.section_store export output_root 导出
+    :param telemetry: 大模型调用统计（SummaryExtract.llm_telemetry.LLMTelemetry），默认新建；
+                      结束时（包括出错时）汇总写入 output_root/llm_report.json
+    :param profile: 是否统计各步骤的CPU时间、内存峰值、读写字节数、文件数和垃圾回收停顿（Pipeline.profiler），
+                    结果保存在运行日志旁边的 run_HH_MM_SS.profile.json
+    :param profile_step: 对该步骤（如 "文档切分"、"生成最终Word文档"）额外做函数级分析，设置后自动启用 profile；
+                         依赖图模式下各步骤并发执行，整个调度过程作为一个步骤（"依赖图调度"）统计和分析
+    :param profile_mode: 函数级分析方式，"cprofile"（只统计主线程）或 "sample"（采样所有线程的调用栈）
+    :param run_id: 本次运行的标识（如任务ID），附加在日志文件名后
+    :param checkpoint: 是否记录断点（Pipeline.checkpoint）：各步骤完成情况写入 output_root/checkpoint.json，
+                       任务清单每完成一个单元即追加到 manifest.json.journal，大模型回复保存到 output_root/llm_replies.sqlite3；启用后自动启用 incremental
+    :param resume: 在上次运行的断点上继续（自动启用 checkpoint）：已完成的单元由任务清单跳过，
+                   未完成单元中已经得到的大模型回复直接沿用
+    :param word_renderer: 最终Word文档的生成方式："native"（默认）由 TxtoWord.md_render 把各模块md直接写入合并文档，
+                          包含不支持的写法的模块仍用pandoc转换；"pandoc" 每个模块用pandoc转换为docx后再合并
+    :param word_workers: 生成最终Word文档时各模块渲染的进程数，主进程按模块顺序边收结果边合并；小于等于1时串行。
+                         依赖图模式下各模块的渲染本来就是独立任务，不使用该参数
     """
     total_steps = 12
     current_step = 0
@@ -36,6 +98,11 @@ def process_word_documents(input_dir, output_root, log_root_dir="log", days_to_k
     
     def step_start(step_name):
         # 新增：步骤开始时调用
+        telemetry.set_step(step_name)
+        if run_checkpoint is not None:
+            run_checkpoint.step_started(step_name)
+        if profiler is not None:
+            profiler.begin(step_name)
         if progress_callback:
             progress_callback(
                 percent=current_step / total_steps * 100,  # 还没做这个步骤
@@ -44,6 +111,16 @@ def process_word_documents(input_dir, output_root, log_root_dir="log", days_to_k
                 history=history.copy()
             )
 
+    def step_progress(step_name, done, total, step_start_time):
+        # 步骤内部按文件推进进度
+        if progress_callback and total:
+            progress_callback(
+                percent=(current_step + done / total) / total_steps * 100,
+                current_step_name=step_name,
+                current_step_elapsed=time.time() - step_start_time,
+                history=history.copy()
+            )
+
     def step_done(step_name, elapsed):
         nonlocal current_step
         current_step += 1
@@ -51,6 +128,23 @@ def process_word_documents(input_dir, output_root, log_root_dir="log", days_to_k
         logging.info(f"{step_name} 完成，耗时 {elapsed:.2f} 秒，进度 {percent:.1f}%")
         history.append({'name': step_name, 'time': elapsed})
 
+        if step_name in CHECKPOINT_STEPS:
+            store.flush()
+
+        units = {}
+        if manifest is not None:
+            for key in MANIFEST_STEPS.get(step_name, []):
+                hits, misses = manifest.summary(key)
+                logging.info(f"{step_name}[{key}] 缓存命中 {hits} 个，重新处理 {misses} 个")
+                units[key] = {"hits": hits, "misses": misses}
+            manifest.save()
+
+        if run_checkpoint is not None:
+            run_checkpoint.step_done(step_name, elapsed, units=units)
+
+        if profiler is not None:
+            profiler.end(step_name)
+
         if progress_callback:
             progress_callback(
                 percent=percent,
@@ -60,7 +154,7 @@ def process_word_documents(input_dir, output_root, log_root_dir="log", days_to_k
             )
 
     # 设置日志路径并初始化日志
-    log_file = get_log_file_path(log_root_dir)
+    log_file = get_log_file_path(log_root_dir, run_id=run_id)
     setup_logger(log_file=log_file, console=False)
 
     # 清理旧日志
@@ -69,96 +163,171 @@ def process_word_documents(input_dir, output_root, log_root_dir="log", days_to_k
     # 创建输出目录（如果不存在）
     os.makedirs(output_root, exist_ok=True)
 
+    if section_db:
+        store = SectionStore(os.path.join(output_root, SECTION_DB_NAME), root=output_root, debug=debug_json)
+    else:
+        store = JsonStore(memory=in_memory, debug=debug_json)
+    if resume:
+        checkpoint = True
+    if checkpoint:
+        # 续跑时由任务清单跳过已完成的单元
+        incremental = True
+    manifest = None
+    if incremental:
+        manifest = Manifest(output_root, store=store, journal=checkpoint)
+    run_checkpoint = reply_journal = None
+    if checkpoint:
+        run_checkpoint = RunCheckpoint(output_root, run_id=run_id, resume=resume)
+        reply_journal = LLMCache(os.path.join(output_root, REPLY_DB_NAME), max_bytes=None)
+        if resume:
+            logging.info(f"断点续跑（第 {run_checkpoint.data['resumed']} 次），"
+                         f"上次已完成的步骤: {run_checkpoint.completed_steps()}，"
+                         f"已保存的大模型回复 {reply_journal.stats()['entries']} 条")
+    profiler = None
+    if profile or profile_step:
+        profiler = StepProfiler(log_file, profile_step=profile_step, profile_mode=profile_mode)
+
     logging.info("开始批量处理Word文档...")
 
-    # 1. Word文档切分成txt文件
-    step_start("文档切分")
-    start = time.time()
-    batch_process_word_files(input_dir, output_root, module_config_file)
-    elapsed = time.time() - start
-    step_done("文档切分", elapsed)
-
-    # 2. 检查模块文件完整性
-    step_start("检查模块文件")
-    start = time.time()
-    check_module_files(output_root, module_config_file)
-    elapsed = time.time() - start
-    step_done("检查模块文件", elapsed)
-
-    # 3. 从txt文档中提取多级标题和对应内容索引
-    step_start("提取多级标题")
-    start = time.time()
-    batch_process_txt_files(output_root)
-    elapsed = time.time() - start
-    step_done("提取多级标题", elapsed)
-
-    # 4. 对应的json文件中提取摘要
-    step_start("提取摘要")
-    start = time.time()
-    # batch_process_json_dir(output_root)
-    elapsed = time.time() - start
-    step_done("提取摘要", elapsed)
-
-    # 5. json文件内容格式化
-    step_start("格式化JSON文件")
-    start = time.time()
-    recursive_process_folder(output_root)
-    elapsed = time.time() - start
-    step_done("格式化JSON文件", elapsed)
-
-    # 6. 准备合并文件预处理
-    step_start("合并文件预处理")
-    start = time.time()
-    merge_json_files_with_suffix(output_root)
-    elapsed = time.time() - start
-    step_done("合并文件预处理", elapsed)
-
-    # 7. 重新组合标题
-    step_start("重组标题")
-    start = time.time()
-    # batch_process_folders(output_root)
-    elapsed = time.time() - start
-    step_done("重组标题", elapsed)
-
-    # 8. 重组结果格式化为json
-    step_start("结果格式化为JSON")
-    start = time.time()
-    batch_process_txt_json(output_root)
-    elapsed = time.time() - start
-    step_done("结果格式化为JSON", elapsed)
-
-    # 9. 生成索引
-    step_start("生成索引")
-    start = time.time()
-    enrich_all_subfolders(output_root)
-    elapsed = time.time() - start
-    step_done("生成索引", elapsed)
-
-    # 10. 合并json文件
-    step_start("合并章节文件")
-    start = time.time()
-    merge_by_folder(output_root)
-    elapsed = time.time() - start
-    step_done("合并章节文件", elapsed)
-
-    # 11. 合并所有的merged.txt文件
-    step_start("合并所有文件")
-    start = time.time()
-    # merge_merged_txts(output_root)
-    elapsed = time.time() - start
-    step_done("合并所有文件", elapsed)
-
-    # 12. 生成最终的合并结果Word文档
-    step_start("生成最终Word文档")
-    start = time.time()
-    # 批量对标题进行格式化，并转换为Word文档
-    batch_reformat_titles(output_root)
-    # 生成最终的Word文档
-    process_and_merge_all_files(output_root)
-    result_path = correct_and_convert_numbered_paragraphs(output_root)
-    elapsed = time.time() - start
-    step_done("生成最终Word文档", elapsed)
-
-    logging.info("批量处理完成！")
-
-    return result_path  # 返回最终文件路径
\ No newline at end of file
+    telemetry = telemetry or LLMTelemetry()
+    add_call_listener(telemetry)
+    set_reply_journal(reply_journal)
+    try:
+
+        if use_dag:
+            # 各步骤并发执行，按任务类型确定大模型调用所属的步骤
+            telemetry.step_by_task = dict(LLM_TASK_STEPS)
+            if profiler is not None:
+                profiler.profile_step = DAG_PROFILE_STEP if profile_step else None
+                profiler.begin(DAG_PROFILE_STEP)
+            result_path = run_dag_pipeline(input_dir, output_root, module_config_file, manifest=manifest,
+                                           pool_sizes=pool_sizes, progress_callback=progress_callback,
+                                           enable_summary=enable_summary, enable_restructure=enable_restructure,
+                                           store=store, word_renderer=word_renderer, run_checkpoint=run_checkpoint)
+            if profiler is not None:
+                profiler.end(DAG_PROFILE_STEP)
+            log_llm_cache_stats()
+            finish_checkpoint(run_checkpoint, result_path)
+            logging.info("批量处理完成！")
+            return result_path
+
+        # 1. Word文档切分成txt文件
+        step_start("文档切分")
+        start = time.time()
+        split_results = batch_process_word_files(
+            input_dir, output_root, module_config_file,
+            max_workers=split_workers,
+            progress_callback=lambda done, total: step_progress("文档切分", done, total, start),
+            manifest=manifest
+        )
+        elapsed = time.time() - start
+        step_done("文档切分", elapsed)
+        # 后续只处理本次切分得到的项目文件夹（同名项目只处理一次），与依赖图模式一致
+        project_folders = list(dict.fromkeys(r["folder"] for r in split_results if r["folder"] and not r["error"]))
+
+        # 2. 检查模块文件完整性
+        step_start("检查模块文件")
+        start = time.time()
+        check_module_files(output_root, module_config_file, folders=project_folders)
+        elapsed = time.time() - start
+        step_done("检查模块文件", elapsed)
+
+        # 3. 从txt文档中提取多级标题和对应内容索引
+        step_start("提取多级标题")
+        start = time.time()
+        batch_process_txt_files(output_root, manifest=manifest, store=store, project_folders=project_folders)
+        elapsed = time.time() - start
+        step_done("提取多级标题", elapsed)
+
+        # 4. 对应的json文件中提取摘要
+        step_start("提取摘要")
+        start = time.time()
+        if enable_summary:
+            batch_process_json_dir(output_root, manifest=manifest, store=store)
+        elapsed = time.time() - start
+        step_done("提取摘要", elapsed)
+
+        # 5. json文件内容格式化
+        step_start("格式化JSON文件")
+        start = time.time()
+        recursive_process_folder(output_root, manifest=manifest, store=store)
+        elapsed = time.time() - start
+        step_done("格式化JSON文件", elapsed)
+
+        # 6. 准备合并文件预处理
+        step_start("合并文件预处理")
+        start = time.time()
+        merge_json_files_with_suffix(output_root, manifest=manifest, store=store)
+        elapsed = time.time() - start
+        step_done("合并文件预处理", elapsed)
+
+        # 7. 重新组合标题
+        step_start("重组标题")
+        start = time.time()
+        if enable_restructure:
+            batch_process_folders(output_root, manifest=manifest, store=store)
+        elapsed = time.time() - start
+        step_done("重组标题", elapsed)
+
+        # 8. 重组结果格式化为json
+        step_start("结果格式化为JSON")
+        start = time.time()
+        batch_process_txt_json(output_root, manifest=manifest, store=store)
+        elapsed = time.time() - start
+        step_done("结果格式化为JSON", elapsed)
+
+        # 9. 生成索引
+        step_start("生成索引")
+        start = time.time()
+        enrich_all_subfolders(output_root, manifest=manifest, store=store)
+        elapsed = time.time() - start
+        step_done("生成索引", elapsed)
+
+        # 10. 合并json文件
+        step_start("合并章节文件")
+        start = time.time()
+        merge_by_folder(output_root, manifest=manifest, store=store)
+        elapsed = time.time() - start
+        step_done("合并章节文件", elapsed)
+
+        # 11. 合并所有的merged.txt文件
+        step_start("合并所有文件")
+        start = time.time()
+        # merge_merged_txts(output_root)
+        elapsed = time.time() - start
+        step_done("合并所有文件", elapsed)
+
+        # 12. 生成最终的合并结果Word文档
+        step_start("生成最终Word文档")
+        start = time.time()
+        # 各模块并行进行标题格式化和渲染，按模块顺序合并生成最终的Word文档
+        result_path = render_and_build_final_document(output_root, manifest=manifest, renderer=word_renderer,
+                                                      max_workers=word_workers)
+        elapsed = time.time() - start
+        step_done("生成最终Word文档", elapsed)
+
+        store.flush()
+        log_llm_cache_stats()
+        finish_checkpoint(run_checkpoint, result_path)
+        logging.info("批量处理完成！")
+
+        return result_path  # 返回最终文件路径
+    except Exception as e:
+        if run_checkpoint is not None:
+            # 内存中已完成的中间json写盘，续跑时可以直接沿用
+            try:
+                store.flush()
+            except Exception as flush_error:
+                logging.error(f"出错后保存中间结果失败: {flush_error}")
+            run_checkpoint.fail(e)
+        raise
+    finally:
+        set_reply_journal(None)
+        if reply_journal is not None:
+            reply_journal.close()
+        if profiler is not None:
+            profiler.save()
+            profiler.close()
+        remove_call_listener(telemetry)
+        telemetry.finish()
+        telemetry.save(output_root)
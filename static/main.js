@@ -284,6 +284,30 @@ function bindPreviewHoverEffect() {
 // ----------------------------
 
 let isProcessing = false;
+let currentJobId = null; // 当前页面提交的任务ID，只显示该任务的进度和结果
+
+// 是否为当前任务的推送（服务器可能同时处理多个任务）
+function isCurrentJob(data) {
+    return !data.job_id || data.job_id === currentJobId;
+}
+
+// 订阅任务进度：服务器只向该任务的房间推送，订阅时补发一次全量进度
+function joinJob(jobId) {
+    socket.emit("join_job", { job_id: jobId });
+}
+
+function leaveJob(jobId) {
+    if (jobId) {
+        socket.emit("leave_job", { job_id: jobId });
+    }
+}
+
+// 断线重连后重新订阅，服务器会补发全量进度
+socket.on("connect", () => {
+    if (isProcessing && currentJobId) {
+        joinJob(currentJobId);
+    }
+});
 
 function resetProcessBtn() {
     const startBtn = document.getElementById("start-process-btn");
@@ -352,6 +376,15 @@ function startProcess() {
             alert("❌ " + data.message);
             document.getElementById("processing-info").style.display = "none";
             resetProcessBtn();
+            return;
+        }
+        currentJobId = data.job_id;
+        resetJobProgress();
+        joinJob(currentJobId);
+        if (data.queue_position) {
+            document.getElementById("current_step").innerText = `排队中（前面还有 ${data.queue_position} 个任务）`;
+        } else if (data.job_status === "queued") {
+            document.getElementById("current_step").innerText = "排队中";
         }
         // 正常则等socket推送
     }).catch(err => {
@@ -363,6 +396,9 @@ function startProcess() {
 
 // 处理完成后，处理下载
 socket.on("process_done", data => {
+    if (!isCurrentJob(data)) return;
+    stopElapsedTimer();
+    leaveJob(data.job_id);
     document.getElementById("processing-info").style.display = "none";
     resetProcessBtn();
 
@@ -370,41 +406,168 @@ socket.on("process_done", data => {
         const downloadBtn = document.getElementById("download-result-btn");
         downloadBtn.href = data.download_url;
         downloadBtn.classList.remove("d-none");
-        alert("处理完成！请点击“下载结果文件”获取处理后的文档。");
+        let message = "处理完成！请点击“下载结果文件”获取处理后的文档。";
+        if (data.llm_report && data.llm_report.total) {
+            const total = data.llm_report.total;
+            message += `\n大模型请求 ${total.requests} 次（缓存命中 ${total.cache_hits} 次），` +
+                `输入 ${total.prompt_tokens} tokens，输出 ${total.completion_tokens} tokens，费用约 ${total.cost.toFixed(4)} 元。`;
+        }
+        alert(message);
     } else {
         alert("处理完成，但未生成可下载结果。");
     }
 });
 
-// 进度更新
-socket.on("progress_update", data => {
-    if (typeof data.percent === "number" && !isNaN(data.percent)) {
-        document.getElementById("progress").style.width = data.percent + "%";
-        document.getElementById("progress").textContent = data.percent.toFixed(1) + "%";
-    } else {
-        document.getElementById("progress").style.width = "100%";
-        document.getElementById("progress").textContent = "";
+// 处理失败，可以从断点继续
+socket.on("process_error", data => {
+    if (!isCurrentJob(data)) return;
+    stopElapsedTimer();
+    if (data.job_id && confirm("处理出现错误：" + (data.error || "未知错误") +
+        "\n是否从断点继续？已完成的摘要和合并结果将直接沿用。")) {
+        resumeProcess(data.job_id);
+        return;
+    }
+    leaveJob(data.job_id);
+    document.getElementById("processing-info").style.display = "none";
+    resetProcessBtn();
+});
+
+function resumeProcess(jobId) {
+    fetch(`/resume/${encodeURIComponent(jobId)}`, { method: "POST" })
+        .then(res => res.json()).then(data => {
+            if (data.status === "error") {
+                alert("❌ " + data.message);
+                document.getElementById("processing-info").style.display = "none";
+                resetProcessBtn();
+                return;
+            }
+            currentJobId = data.job_id;
+            resetJobProgress();
+            joinJob(currentJobId);
+            document.getElementById("current_step").innerText = "从断点继续";
+        }).catch(err => {
+            alert("请求失败：" + err);
+            document.getElementById("processing-info").style.display = "none";
+            resetProcessBtn();
+        });
+}
+
+// 进度更新：服务器只在进度变化时推送（合并限速），首次订阅为全量（full），之后只含变化的字段；
+// 步骤耗时和总耗时由本地每秒计时，服务器只在步骤切换和全量推送时给出基准值（秒）；
+// 大模型无输出时长同样从推送时的 llm.idle 本地计时，流卡住时服务器不会再推送
+let jobProgress = null;
+let elapsedTimer = null;
+
+function formatSecondsToHMS(seconds) {
+    seconds = Math.max(0, Math.floor(seconds || 0));
+    const h = Math.floor(seconds / 3600);
+    const m = Math.floor((seconds % 3600) / 60);
+    const s = seconds % 60;
+    return [h, m, s].map(v => String(v).padStart(2, "0")).join(":");
+}
+
+function resetJobProgress() {
+    jobProgress = null;
+    stopElapsedTimer();
+}
+
+function stopElapsedTimer() {
+    if (elapsedTimer) {
+        clearInterval(elapsedTimer);
+        elapsedTimer = null;
     }
-    document.getElementById("current_step").textContent = data.current_step_name || "无";
-    document.getElementById("current_step_time").textContent = data.current_step_elapsed || "00:00:00";
-    document.getElementById("total_time").textContent = data.total_elapsed || "00:00:00";
+}
 
+function renderElapsed() {
+    if (!jobProgress) return;
+    const now = Date.now();
+    document.getElementById("current_step_time").textContent =
+        formatSecondsToHMS(jobProgress.stepElapsed + (now - jobProgress.stepReceivedAt) / 1000);
+    document.getElementById("total_time").textContent =
+        formatSecondsToHMS(jobProgress.totalElapsed + (now - jobProgress.totalReceivedAt) / 1000);
+    renderLLM(jobProgress.llm, (now - jobProgress.llmReceivedAt) / 1000);
+}
+
+function appendHistoryItems(items) {
     const historyList = document.getElementById("history");
-    historyList.innerHTML = "";
-    (data.history || []).forEach((h, idx) => {
+    items.forEach(h => {
         const li = document.createElement("li");
         li.classList.add("list-group-item", "d-flex", "justify-content-between", "align-items-center");
-        li.innerHTML = `<span><i class="bi bi-check-circle text-success"></i> ${h.name}</span><span class="badge bg-light text-secondary">${h.time}</span>`;
+        li.innerHTML = `<span><i class="bi bi-check-circle text-success"></i> ${h.name}</span><span class="badge bg-light text-secondary">${formatSecondsToHMS(h.time)}</span>`;
         historyList.appendChild(li);
     });
+}
 
-    if (data.status && data.status === "done") {
-        document.getElementById("processing-info").style.display = "none";
-        resetProcessBtn();
+function renderPercent(percent) {
+    const bar = document.getElementById("progress");
+    if (typeof percent === "number" && !isNaN(percent)) {
+        bar.style.width = percent + "%";
+        bar.textContent = percent.toFixed(1) + "%";
+    } else {
+        bar.style.width = "100%";
+        bar.textContent = "";
     }
-    if (data.status && data.status === "error") {
-        document.getElementById("processing-info").style.display = "none";
-        alert("处理出现错误：" + (data.message || "未知错误"));
-        resetProcessBtn();
+}
+
+function renderLLM(llm, sinceReceived) {
+    // 大模型流式输出：在途请求数、累计token数和当前输出速度，长时间无输出时提示
+    const llmBadge = document.getElementById("llm_stream_badge");
+    if (llm && llm.active > 0) {
+        let text = `${llm.active} 个请求，${llm.tokens} tokens，${llm.tokens_per_sec.toFixed(1)} tokens/s`;
+        const idle = (llm.idle || 0) + (sinceReceived || 0);
+        if (idle >= 30) {
+            text += `（已 ${Math.round(idle)} 秒无输出）`;
+        }
+        document.getElementById("llm_stream").textContent = text;
+        llmBadge.classList.remove("d-none");
+    } else {
+        llmBadge.classList.add("d-none");
+    }
+}
+
+socket.on("progress_update", data => {
+    if (!isCurrentJob(data)) return;
+    const now = Date.now();
+    if (data.full) {
+        jobProgress = {
+            seq: data.seq,
+            stepElapsed: data.step_elapsed || 0,
+            stepReceivedAt: now,
+            totalElapsed: data.total_elapsed || 0,
+            totalReceivedAt: now,
+            llm: null,
+            llmReceivedAt: now
+        };
+        document.getElementById("history").innerHTML = "";
+        appendHistoryItems(data.history || []);
+    } else {
+        // 还没收到全量进度，或者是全量进度之前的旧增量
+        if (!jobProgress || data.seq <= jobProgress.seq) return;
+        jobProgress.seq = data.seq;
+        if ("history" in data) {
+            document.getElementById("history").innerHTML = "";
+            appendHistoryItems(data.history);
+        }
+        if (data.history_append) {
+            appendHistoryItems(data.history_append);
+        }
+    }
+    if ("percent" in data) {
+        renderPercent(data.percent);
+    }
+    if ("current_step_name" in data) {
+        document.getElementById("current_step").textContent = data.current_step_name || "无";
+    }
+    if ("step_elapsed" in data) {
+        jobProgress.stepElapsed = data.step_elapsed || 0;
+        jobProgress.stepReceivedAt = now;
+    }
+    if ("llm" in data) {
+        jobProgress.llm = data.llm;
+        jobProgress.llmReceivedAt = now;
+    }
+    renderElapsed();
+    if (!elapsedTimer) {
+        elapsedTimer = setInterval(renderElapsed, 1000);
     }
 });